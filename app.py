@@ -1,12 +1,13 @@
 import asyncio
+import gc
 import logging
 import os
-from aiogram import Bot, Dispatcher, types
+from aiogram import Dispatcher, types
 from aiogram.fsm.strategy import FSMStrategy
+from aiohttp import web
 from pathlib import Path
 
 from aiogram_i18n import I18nMiddleware
-from aiogram_i18n.cores.gnu_text_core import GNUTextCore
 from dotenv import find_dotenv, load_dotenv
 
 load_dotenv(find_dotenv())
@@ -14,19 +15,43 @@ load_dotenv(find_dotenv())
 from handlers.user_handlers import user_handlers_router
 from handlers.admin_handlers import admin_handlers_router
 from common.bot_commands import menu_items
+from common import bot_registry, logging_config, metrics, webhook
+from keyboards import keyboard_cache
 from middlewares import i18nmiddleware
+from middlewares.metrics import MetricsMiddleware
+from middlewares.tracing import TracingMiddleware
+from middlewares.temp_files import TempFilesMiddleware
+from workload_handlers import worker_pool, pdf_converter
+from storages import database, workspace
+from storages.command_scopes import command_scopes
+from storages.fsm_storage import create_storage
+from storages.locale_store import locale_store
+from storages.temp_files import temp_files
 
 ALLOWED_UPDATES = ["message, inline_query"]
 I18N_BASE_DIR = os.path.join(Path.cwd(), "locales")
 log_file_path = os.getenv("LOGFILEPATH")
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 1))
     
 logging.getLogger().setLevel(level=os.getenv("LOGLEVEL"))
 
-bot = Bot(token=os.getenv("TOKEN"))
-dp = Dispatcher(fsm_strategy=FSMStrategy.USER_IN_CHAT)
+bot = bot_registry.get_bot()
+bot.session.middleware(keyboard_cache.LocalizedKeyboards())
+dp = Dispatcher(storage=create_storage(), fsm_strategy=FSMStrategy.USER_IN_CHAT)
 dp.include_routers(user_handlers_router, admin_handlers_router)
+dp.update.outer_middleware(TracingMiddleware())
+dp.update.outer_middleware(TempFilesMiddleware())
+dp.message.middleware(MetricsMiddleware())
+dp.callback_query.middleware(MetricsMiddleware())
 i18n = I18nMiddleware(
-        core=GNUTextCore(
+        core=i18nmiddleware.PrecompiledGNUTextCore(
             path=I18N_BASE_DIR,
         ),
         manager=i18nmiddleware.UserManager(),
@@ -36,6 +61,33 @@ i18n = I18nMiddleware(
 i18n.setup(dp)
 
 
+@dp.startup()
+async def on_startup() -> None:
+    locale_store.warm_up()
+    keyboard_cache.build(i18n.core)
+    workspace.prepare()
+    # Objects created until now (modules, handlers, keyboards) live as long as the bot does.
+    # Frozen, full collections in the event loop skip them, and the workers forked next do not
+    # copy the pages they live on by touching them during their own collections.
+    gc.freeze()
+    worker_pool.start()
+    temp_files.start()
+    await metrics.start_server()
+
+
+@dp.shutdown()
+async def on_shutdown() -> None:
+    await command_scopes.close()
+    worker_pool.shutdown()
+    gc.unfreeze()
+    await temp_files.close()
+    await metrics.stop_server()
+    await pdf_converter.close()
+    await dp.storage.close()
+    await locale_store.close()
+    database.close()
+
+
 async def main() -> None:
     await bot.delete_webhook(drop_pending_updates=True)
     await bot.set_my_commands(
@@ -44,6 +96,48 @@ async def main() -> None:
     await dp.start_polling(bot, allowed_updates=ALLOWED_UPDATES)
 
 
+async def register_webhook() -> None:
+    await bot.set_my_commands(
+        commands=menu_items, scope=types.BotCommandScopeAllPrivateChats()
+    )
+    await bot.set_webhook(
+        WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=ALLOWED_UPDATES,
+        drop_pending_updates=True,
+    )
+    await bot.session.close()
+
+
+# Entry point of every webhook worker process. With several workers the FSM, locales, chat
+# commands and albums are read from and written to the shared database right away (see
+# database.MULTI_PROCESS), and log records are written by the parent process. What stays per worker
+# is only an optimization or a local limit: download coalescing, the fair job queue and the worker
+# pool (JOB_CONCURRENCY and PDF_WORKERS apply to each worker), the temp file sweeper, and the
+# metrics endpoint, which only the first worker to bind the port serves.
+def serve_webhook(log_queue=None) -> None:
+    if log_queue is not None:
+        logging_config.configure_worker(log_queue, os.getenv("LOGLEVEL"))
+    web.run_app(
+        webhook.create_app(dp, bot, WEBHOOK_PATH, WEBHOOK_SECRET),
+        host=WEBHOOK_HOST,
+        port=WEBHOOK_PORT,
+        reuse_port=WEBHOOK_WORKERS > 1,
+        print=None,
+    )
+
+
 if __name__ == "__main__":
-    logging.basicConfig(filename=log_file_path, filemode='w', format='%(asctime)s - %(levelname)s - %(message)s')
-    asyncio.run(main())
+    if BOT_MODE == "webhook":
+        logging_config.setup_logging(log_file_path, os.getenv("LOGLEVEL"))
+        try:
+            asyncio.run(register_webhook())
+            webhook.run_workers(serve_webhook, WEBHOOK_WORKERS, logging_config.worker_log_queue())
+        finally:
+            logging_config.stop_logging()
+    else:
+        logging_config.setup_logging(log_file_path, os.getenv("LOGLEVEL"))
+        try:
+            asyncio.run(main())
+        finally:
+            logging_config.stop_logging()
@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from io import BytesIO
+from pypdf import PdfWriter
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from benchmarks.synthetic_updates import callback_update, document, message_update
+
+# Sends the same set of PDFs to the dispatcher built from app.py in two ways and times how long it
+# takes until the merged PDF is uploaded to the fake Bot API:
+#   separate - the files are sent one by one into a merge session, as before albums were batched
+#   album    - the files arrive as one media group and are downloaded together
+
+TOKEN = "123456:ABCdef"
+
+
+def make_pdf(pages) -> bytes:
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(595, 842)
+    buffer = BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+async def wait_for_upload(fake_api, uploads_before) -> None:
+    while fake_api.calls.get("sendDocument", 0) <= uploads_before:
+        await asyncio.sleep(0.005)
+
+
+async def run_mode(app, fake_api, mode, user_id, files, file_size) -> dict:
+    documents = [
+        document("file" + str(i), "file" + str(i) + ".pdf", file_size) for i in range(files)
+    ]
+    for i in range(files):
+        documents[i]["file_unique_id"] = "u" + str(user_id) + "_" + str(i)
+    uploads_before = fake_api.calls.get("sendDocument", 0)
+    replies_before = fake_api.calls.get("sendMessage", 0) + fake_api.calls.get("editMessageText", 0)
+
+    started = time.perf_counter()
+    if mode == "separate":
+        await app.dp.feed_raw_update(app.bot, callback_update(user_id, "merge"))
+        for item in documents:
+            await app.dp.feed_raw_update(app.bot, message_update(user_id, document=item))
+    else:
+        media_group_id = "album" + str(user_id)
+        await asyncio.gather(
+            *[
+                app.dp.feed_raw_update(app.bot, message_update(user_id, document=item, media_group_id=media_group_id))
+                for item in documents
+            ]
+        )
+    await app.dp.feed_raw_update(app.bot, callback_update(user_id, "combine_files"))
+    await wait_for_upload(fake_api, uploads_before)
+    elapsed = time.perf_counter() - started
+
+    replies = fake_api.calls.get("sendMessage", 0) + fake_api.calls.get("editMessageText", 0) - replies_before
+    return {
+        "mode": mode,
+        "files": files,
+        "seconds": round(elapsed, 3),
+        "files_per_second": round(files / elapsed, 1),
+        "bot_replies": replies,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Album batching vs one file at a time")
+    parser.add_argument("--files", type=int, default=30)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every Bot API call")
+    args = parser.parse_args()
+
+    content = make_pdf(args.pages)
+    fake_api = FakeBotAPI(TOKEN, {"file" + str(i): content for i in range(args.files)}, latency=args.latency)
+    await fake_api.start()
+    directory = tempfile.mkdtemp()
+    for name in ("input", "output"):
+        os.makedirs(os.path.join(directory, name))
+    os.environ.update(
+        TOKEN=TOKEN,
+        BOT_API_BASE_URL=fake_api.base_url,
+        DATABASE_PATH=os.path.join(directory, "bot.sqlite3"),
+        FILE_INPUT_LOCATION=os.path.join(directory, "input"),
+        FILE_OUTPUT_LOCATION=os.path.join(directory, "output"),
+        LOGLEVEL=os.getenv("LOGLEVEL", "WARNING"),
+    )
+    import app
+
+    # Loads the translations and starts the worker pool, as polling or the webhook server would
+    await app.dp.emit_startup(bot=app.bot, dispatcher=app.dp)
+    try:
+        user_id = 1000
+        for _ in range(args.rounds):
+            for mode in ("separate", "album"):
+                user_id += 1
+                print(await run_mode(app, fake_api, mode, user_id, args.files, len(content)))
+    finally:
+        await app.dp.emit_shutdown(bot=app.bot, dispatcher=app.dp)
+        await app.bot.session.close()
+        await fake_api.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from storages import database
+from storages.fsm_storage import SQLiteStorage
+
+# Measures FSM get/set latency with thousands of users walking through a merge flow at the same time
+
+
+async def user_session(storage, user_id, latencies) -> None:
+    key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+    steps = [
+        lambda: storage.set_state(key, "MergePDF:input_file1"),
+        lambda: storage.update_data(key, {"file_path_input1": "/input/" + str(user_id) + "_1.pdf"}),
+        lambda: storage.set_state(key, "MergePDF:input_file2"),
+        lambda: storage.get_data(key),
+        lambda: storage.get_state(key),
+        lambda: storage.set_state(key, None),
+        lambda: storage.set_data(key, {}),
+    ]
+    for step in steps:
+        started = time.perf_counter()
+        await step()
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0)
+
+
+async def run(name, storage, users) -> None:
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*[user_session(storage, user_id, latencies) for user_id in range(users)])
+    await storage.close()
+    elapsed = time.perf_counter() - started
+    quantiles = statistics.quantiles(latencies, n=100)
+    print({
+        "storage": name,
+        "users": users,
+        "operations_per_second": round(len(latencies) / elapsed),
+        "p50_us": round(quantiles[49] * 1e6, 1),
+        "p99_us": round(quantiles[98] * 1e6, 1),
+        "max_us": round(max(latencies) * 1e6, 1),
+    })
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="FSM storage latency under concurrent users")
+    parser.add_argument("--users", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        await run("memory", MemoryStorage(), args.users)
+        await run("sqlite", SQLiteStorage(connection=database.connect(directory + "/cached.sqlite3")), args.users)
+        await run(
+            "sqlite_uncached",
+            SQLiteStorage(connection=database.connect(directory + "/uncached.sqlite3"), cache_size=0),
+            args.users,
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+import time
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import SendMessage
+from aiogram_i18n import I18nContext
+from aiogram_i18n.cores.gnu_text_core import GNUTextCore
+
+from handlers.user_handlers import INITIAL_KEYBOARD, ROTATE_KEYBOARD
+from keyboards import keyboard_cache
+from middlewares.i18nmiddleware import PrecompiledGNUTextCore, UserManager
+
+# Measures what it costs to build a reply, from i18n.get to the form data that is posted to the
+# Bot API, with the catalogs and LazyProxy keyboards resolved on every send ("lazy") and with the
+# messages and keyboards rendered per locale at startup ("precompiled"):
+#
+#   python -m benchmarks.bench_replies --replies 20000
+
+TOKEN = "123456:ABCdef"
+REPLIES = [
+    ("Here is your PDF", INITIAL_KEYBOARD),
+    ("Select how you want to rotate your PDF", ROTATE_KEYBOARD),
+    ("Something went wrong \n Please try again", INITIAL_KEYBOARD),
+]
+
+
+async def run(name, core, bot, locale, replies, middleware=None) -> None:
+    i18n = I18nContext(locale=locale, core=core, manager=UserManager(), data={})
+    token = I18nContext.set_current(i18n)
+
+    async def make_request(bot, method):
+        return bot.session.build_form_data(bot, method)
+
+    try:
+        started = time.perf_counter()
+        for number in range(replies):
+            text, keyboard = REPLIES[number % len(REPLIES)]
+            method = SendMessage(chat_id=1, text=i18n.get(text), reply_markup=keyboard)
+            if middleware is not None:
+                await middleware(make_request, bot, method)
+            else:
+                await make_request(bot, method)
+        elapsed = time.perf_counter() - started
+    finally:
+        I18nContext.reset_current(token)
+    print({
+        "core": name,
+        "locale": locale,
+        "replies": replies,
+        "per_reply_us": round(elapsed / replies * 1e6, 1),
+        "replies_per_second": round(replies / elapsed),
+    })
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Cost of building localized replies")
+    parser.add_argument("--replies", type=int, default=20000)
+    args = parser.parse_args()
+
+    bot = Bot(token=TOKEN, session=AiohttpSession())
+    lazy_core = GNUTextCore(path="locales", default_locale="en")
+    precompiled_core = PrecompiledGNUTextCore(path="locales", default_locale="en")
+    await lazy_core.startup()
+    await precompiled_core.startup()
+    keyboard_cache.build(precompiled_core)
+
+    for locale in ("en", "ru"):
+        await run("lazy", lazy_core, bot, locale, args.replies)
+        await run("precompiled", precompiled_core, bot, locale, args.replies, keyboard_cache.LocalizedKeyboards())
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from aiogram import Bot
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from common import bot_registry
+from storages import workspace
+from workload_handlers.file_downloader import fileDownloader
+
+# Compares download throughput when downloads share the dispatcher's Bot session with the old layout,
+# where file_downloader had a Bot (and connection pool) of its own. API calls run alongside the
+# downloads in both modes, the same way polling and replies do in production.
+
+TOKEN = "123456:ABCdef"
+
+
+async def run_mode(fake_api: FakeBotAPI, shared: bool, files: int, api_calls: int) -> dict:
+    api_bot = Bot(token=TOKEN, session=bot_registry.create_session(fake_api.base_url))
+    download_bot = api_bot if shared else Bot(token=TOKEN, session=bot_registry.create_session(fake_api.base_url))
+    bot_registry.set_bot(download_bot)
+
+    with tempfile.TemporaryDirectory() as input_location:
+        workspace.file_input_location = input_location
+        downloaded_before = fake_api.downloaded_bytes
+        started = time.perf_counter()
+        await asyncio.gather(
+            *[fileDownloader("file" + str(i), "file.pdf", "unique" + str(i)) for i in range(files)],
+            *[api_bot.send_message(chat_id=1, text="ping") for _ in range(api_calls)],
+        )
+        elapsed = time.perf_counter() - started
+
+    await api_bot.session.close()
+    if not shared:
+        await download_bot.session.close()
+
+    downloaded = fake_api.downloaded_bytes - downloaded_before
+    return {
+        "mode": "shared" if shared else "separate",
+        "seconds": round(elapsed, 3),
+        "files_per_second": round(files / elapsed, 1),
+        "megabytes_per_second": round(downloaded / elapsed / (1024 * 1024), 1),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Shared vs separate Bot session download throughput")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--file-size", type=int, default=512 * 1024)
+    parser.add_argument("--api-calls", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    # Passes the PDF magic check the downloader runs on the first bytes
+    content = b"%PDF-1.7\n" + os.urandom(args.file_size)
+    fake_api = FakeBotAPI(TOKEN, {"file" + str(i): content for i in range(args.files)})
+    await fake_api.start()
+    try:
+        for _ in range(args.rounds):
+            for shared in (True, False):
+                print(await run_mode(fake_api, shared, args.files, args.api_calls))
+    finally:
+        await fake_api.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import gc
+import os
+import statistics
+import tempfile
+import time
+from unittest.mock import AsyncMock, Mock
+
+from benchmarks.pdf_corpus import scan_pdf
+from handlers import user_handlers
+from storages import database
+from storages.command_scopes import CommandScopes
+from workload_handlers import worker_pool
+from workload_handlers.pdf_compressor import compressPDF
+
+# Measures how late /start is answered while compress jobs run in the worker pool, compared with
+# an idle bot. The pool is started after gc.freeze(), as app.py does:
+#
+#   python -m benchmarks.bench_start_latency --jobs 4
+
+PROBE_INTERVAL = 0.01
+
+
+async def start_latencies(duration) -> list[float]:
+    message = AsyncMock()
+    message.chat.id = 42
+    i18n = Mock()
+    i18n.get.return_value = "Hi, I am your PDF converter assistant"
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        expected = time.perf_counter() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        await user_handlers.start_cmd(message, i18n)
+        latencies.append(time.perf_counter() - expected)
+    return latencies
+
+
+def report(name, latencies) -> None:
+    cuts = statistics.quantiles(latencies, n=100)
+    print({
+        "phase": name,
+        "probes": len(latencies),
+        "p50_ms": round(cuts[49] * 1000, 2),
+        "p99_ms": round(cuts[98] * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+    })
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="/start latency while the worker pool is busy")
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--idle", type=float, default=2, help="seconds to probe before the jobs start")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        user_handlers.command_scopes = CommandScopes(connection=database.connect(directory + "/commands.sqlite3"))
+        os.makedirs(directory + "/output")
+        inputs = []
+        for i in range(args.jobs):
+            inputs.append(directory + "/input" + str(i) + ".pdf")
+            scan_pdf(inputs[-1], args.pages, seed=i)
+
+        gc.freeze()
+        worker_pool.start()
+        try:
+            report("idle", await start_latencies(args.idle))
+            started = time.perf_counter()
+            jobs = asyncio.ensure_future(asyncio.gather(*[compressPDF(item, directory + "/output") for item in inputs]))
+            loaded = []
+            while not jobs.done():
+                loaded += await start_latencies(0.5)
+            await jobs
+            print({"jobs": args.jobs, "jobs_seconds": round(time.perf_counter() - started, 2)})
+            report("loaded", loaded)
+        finally:
+            worker_pool.shutdown()
+            gc.unfreeze()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
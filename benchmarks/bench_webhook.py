@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import aiohttp
+from aiohttp import web
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from benchmarks.synthetic_updates import message_update
+
+# POSTs synthetic /start updates to the webhook app built from app.py and measures how many updates
+# per second are accepted and fully handled (the reply reached the fake Bot API)
+
+TOKEN = "123456:ABCdef"
+SECRET = "benchmark-secret"
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Webhook updates/sec")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=500)
+    args = parser.parse_args()
+
+    fake_api = FakeBotAPI(TOKEN)
+    await fake_api.start()
+    directory = tempfile.mkdtemp()
+    os.environ.update(
+        TOKEN=TOKEN,
+        BOT_API_BASE_URL=fake_api.base_url,
+        DATABASE_PATH=os.path.join(directory, "bot.sqlite3"),
+        LOGLEVEL=os.getenv("LOGLEVEL", "WARNING"),
+    )
+    import app
+    from common import webhook
+
+    runner = web.AppRunner(webhook.create_app(app.dp, app.bot, "/webhook", SECRET))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = "http://127.0.0.1:" + str(site._server.sockets[0].getsockname()[1]) + "/webhook"
+
+    updates = [message_update(i % args.users + 1000, "/start") for i in range(args.updates)]
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+
+    async def poster(session) -> None:
+        while not queue.empty():
+            update = queue.get_nowait()
+            async with session.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as response:
+                assert response.status == 200
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*[poster(session) for _ in range(args.concurrency)])
+    accepted = time.perf_counter() - started
+    while fake_api.calls.get("sendMessage", 0) < args.updates:
+        await asyncio.sleep(0.01)
+    handled = time.perf_counter() - started
+
+    print({
+        "updates": args.updates,
+        "accepted_per_second": round(args.updates / accepted),
+        "handled_per_second": round(args.updates / handled),
+        "api_calls": sum(fake_api.calls.values()),
+    })
+    await runner.cleanup()
+    await fake_api.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
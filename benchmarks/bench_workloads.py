@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import pypdf
+
+from benchmarks.pdf_corpus import CORPUS, build_corpus
+from workload_handlers.pdf_compressor import _compressPDF
+from workload_handlers.pdf_merger import _mergePDF
+from workload_handlers.pdf_rotator import _rotatePDF
+from workload_handlers.worker_pool import peak_rss, reset_peak_rss
+
+# Runs every workload function on a generated corpus and records wall time, CPU time, peak RSS and
+# how big the output is compared to the input. The functions run in this process, the same code
+# the worker pool runs, so the numbers do not include pickling or the pool itself.
+#
+#   python -m benchmarks.bench_workloads --output results.json
+#   python -m benchmarks.bench_workloads --save-baseline baseline.json
+#   python -m benchmarks.bench_workloads --baseline baseline.json   (exits with 1 on a regression)
+#
+# convertToPDF is only measured when CONVERTER_URL points at a running converter that shares
+# FILE_INPUT_LOCATION with this machine.
+
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), "pdf-bot-bench-corpus")
+# Measurements compared against the baseline, higher is worse for all of them
+REGRESSION_METRICS = ("wall_seconds", "cpu_seconds", "peak_rss_mb", "size_ratio")
+# Timings of a few milliseconds jitter by more than the threshold, so those need a real difference too
+MIN_TIME_DIFFERENCE = 0.01
+CONVERT_OPERATION = "convert/bench_text.txt"
+
+
+# name -> (function, arguments before output_path, keyword arguments, input files)
+def _operations(paths) -> dict:
+    operations = {}
+    for name, path in paths.items():
+        operations["compress_balanced/" + name] = (_compressPDF, (path,), {"profile": "balanced"}, [path])
+        operations["compress_maximum/" + name] = (_compressPDF, (path,), {"profile": "maximum"}, [path])
+        operations["rotate_all/" + name] = (_rotatePDF, (path,), {"rotateAngle": 90}, [path])
+        operations["rotate_first_page/" + name] = (_rotatePDF, (path,), {"rotateAngle": 90, "pages": "1"}, [path])
+    merge_inputs = [paths[name] for name in ("text.pdf", "many_fonts.pdf", "scan.pdf") if name in paths]
+    if len(merge_inputs) > 1:
+        name = "merge/" + "+".join(os.path.basename(path) for path in merge_inputs)
+        operations[name] = (_mergePDF, (merge_inputs,), {}, merge_inputs)
+    return operations
+
+
+def _measure_once(func, args, kwargs, output_path) -> dict:
+    reset_peak_rss()
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+    output_item = func(*args, output_path, **kwargs)
+    return {
+        "wall_seconds": time.perf_counter() - wall_started,
+        "cpu_seconds": time.process_time() - cpu_started,
+        "peak_rss_mb": peak_rss() / (1024 * 1024),
+        "output_size": os.path.getsize(output_item),
+    }
+
+
+def run_operation(func, args, kwargs, inputs, repeat) -> dict:
+    input_size = sum(os.path.getsize(path) for path in inputs)
+    runs = []
+    for _ in range(repeat):
+        output_path = tempfile.mkdtemp()
+        try:
+            runs.append(_measure_once(func, args, kwargs, output_path))
+        finally:
+            shutil.rmtree(output_path)
+    return {
+        "wall_seconds": round(statistics.median(run["wall_seconds"] for run in runs), 4),
+        "cpu_seconds": round(statistics.median(run["cpu_seconds"] for run in runs), 4),
+        "peak_rss_mb": round(max(run["peak_rss_mb"] for run in runs), 1),
+        "input_size": input_size,
+        "output_size": runs[-1]["output_size"],
+        "size_ratio": round(runs[-1]["output_size"] / input_size, 4),
+    }
+
+
+async def run_converter(repeat) -> dict:
+    from workload_handlers import pdf_converter
+
+    input_location = os.getenv("FILE_INPUT_LOCATION")
+    output_location = os.getenv("FILE_OUTPUT_LOCATION")
+    results = {}
+    # The converter reads its input from the shared volume
+    source = os.path.join(input_location, "bench_text.txt")
+    with open(source, "w") as file:
+        file.write("\n".join("Benchmark line " + str(i) for i in range(2000)))
+    walls = []
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            exit_code = await pdf_converter.convertToPDF(source, output_location)
+            walls.append(time.perf_counter() - started)
+            if exit_code != 0:
+                print("Converter failed, skipping convert measurements", file=sys.stderr)
+                return results
+    finally:
+        await pdf_converter.close()
+    results[CONVERT_OPERATION] = {"wall_seconds": round(statistics.median(walls), 4)}
+    return results
+
+
+def compare(results, baseline, threshold) -> list[str]:
+    regressions = []
+    for name, measured in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        for metric in REGRESSION_METRICS:
+            if metric not in measured or metric not in reference or not reference[metric]:
+                continue
+            change = measured[metric] / reference[metric] - 1
+            if metric.endswith("_seconds") and measured[metric] - reference[metric] < MIN_TIME_DIFFERENCE:
+                continue
+            if change > threshold:
+                regressions.append(
+                    name + ": " + metric + " " + str(reference[metric]) + " -> " + str(measured[metric])
+                    + " (+" + str(round(change * 100, 1)) + "%)"
+                )
+    return regressions
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "pypdf": pypdf.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Workload handler benchmarks on a generated PDF corpus")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_DIR, help="where the generated PDFs are kept")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--files", nargs="*", choices=sorted(CORPUS), help="corpus files to use, all by default")
+    parser.add_argument("--filter", default="", help="only run operations whose name contains this")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per operation, the median is reported")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results saved earlier")
+    parser.add_argument("--save-baseline", help="write the results as a new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    paths = build_corpus(args.corpus, args.seed, args.files)
+    results = {}
+    for name, (func, func_args, kwargs, inputs) in _operations(paths).items():
+        if args.filter not in name:
+            continue
+        results[name] = run_operation(func, func_args, kwargs, inputs, args.repeat)
+        print(json.dumps({"operation": name, **results[name]}))
+    if os.getenv("CONVERTER_URL") and args.filter in CONVERT_OPERATION:
+        results.update(asyncio.run(run_converter(args.repeat)))
+
+    report = {"environment": environment(), "seed": args.seed, "results": results}
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as file:
+                json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline["results"], args.threshold)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against " + args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import asyncio
+import itertools
+import time
+from aiohttp import web
+
+# A minimal local stand-in for the Telegram Bot API. It serves getFile and file downloads from
+# an in-memory dict, accepts uploads and answers every other method with a plausible result.
+
+
+class FakeBotAPI:
+    def __init__(self, token, files: dict[str, bytes] | None = None, latency=0.0) -> None:
+        self.token = token
+        self.files = files if files is not None else {}
+        self.latency = latency
+        self.calls: dict[str, int] = {}
+        self.downloaded_bytes = 0
+        self.uploaded_bytes = 0
+        self.base_url = None
+        self._message_ids = itertools.count(1)
+        self._runner = None
+
+    def add_file(self, file_id, content: bytes) -> None:
+        self.files[file_id] = content
+
+    def _message(self, chat_id, **fields) -> dict:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id or 0), "type": "private"},
+        }
+        message.update(fields)
+        return message
+
+    async def _method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "sendDocument":
+            form = await request.post()
+            document = form.get("document")
+            # Uploads come as "attach://<field>" with the file in that field of the form
+            if isinstance(document, str) and document.startswith("attach://"):
+                document = form.get(document[len("attach://"):])
+            if isinstance(document, web.FileField):
+                content = document.file.read()
+                self.uploaded_bytes += len(content)
+                file_id = "uploaded_" + str(len(self.files))
+                self.files[file_id] = content
+            else:
+                file_id = str(document)
+            result = self._message(
+                form.get("chat_id"), document={"file_id": file_id, "file_unique_id": "u" + file_id}
+            )
+            return web.json_response({"ok": True, "result": result})
+
+        payload = dict(await request.post())
+        if not payload and request.can_read_body:
+            payload = await request.json()
+
+        if method == "getFile":
+            file_id = payload["file_id"]
+            if file_id not in self.files:
+                return web.json_response(
+                    {"ok": False, "error_code": 400, "description": "Bad Request: file not found"}, status=400
+                )
+            result = {
+                "file_id": file_id,
+                "file_unique_id": "u" + file_id,
+                "file_size": len(self.files[file_id]),
+                "file_path": "documents/" + file_id,
+            }
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(payload.get("chat_id"), text=payload.get("text", ""))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _download(self, request: web.Request) -> web.StreamResponse:
+        content = self.files.get(request.match_info["file_id"])
+        if content is None:
+            raise web.HTTPNotFound()
+
+        offset = 0
+        if "Range" in request.headers:
+            offset = int(request.headers["Range"].split("=")[1].rstrip("-"))
+        response = web.StreamResponse(status=206 if offset else 200)
+        response.content_length = len(content) - offset
+        await response.prepare(request)
+        await response.write(content[offset:])
+        self.downloaded_bytes += len(content) - offset
+        return response
+
+    async def start(self, host="127.0.0.1", port=0) -> str:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot" + self.token + "/{method}", self._method)
+        app.router.add_get("/file/bot" + self.token + "/documents/{file_id}", self._download)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.base_url = "http://" + host + ":" + str(site._server.sockets[0].getsockname()[1])
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,246 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from aiogram import BaseMiddleware
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from benchmarks.pdf_corpus import scan_pdf, text_pdf
+from benchmarks.synthetic_updates import callback_update, document, message_update
+
+# Drives the dispatcher from app.py with synthetic traffic against a local fake Bot API, the way
+# polling would, and reports throughput, per-handler latency percentiles and memory over time.
+# Sessions start at random (Poisson) intervals at --rate per second and follow one of the flows
+# below, picked with the weights given in --mix:
+#
+#   python -m benchmarks.load_test --rate 20 --duration 60 --mix start=5,compress=2,merge=1,rotate=2
+#
+# Every session sends its own file_id and file_unique_id, so the result cache never answers for it.
+# Identical outputs are still re-sent by file_id after the first upload, as in production.
+
+TOKEN = "123456:ABCdef"
+DEFAULT_MIX = "start=5,compress=2,merge=1,rotate=2"
+
+
+def start_flow(user_id, new_file) -> list[dict]:
+    return [message_update(user_id, "/start")]
+
+
+def compress_flow(user_id, new_file) -> list[dict]:
+    return [
+        message_update(user_id, document=new_file()),
+        callback_update(user_id, "compress_file_first"),
+    ]
+
+
+def merge_flow(user_id, new_file) -> list[dict]:
+    return [
+        callback_update(user_id, "merge"),
+        message_update(user_id, document=new_file()),
+        message_update(user_id, document=new_file()),
+        callback_update(user_id, "combine_files"),
+    ]
+
+
+def rotate_flow(user_id, new_file) -> list[dict]:
+    return [
+        callback_update(user_id, "rotate"),
+        message_update(user_id, document=new_file()),
+        callback_update(user_id, "right90"),
+    ]
+
+
+FLOWS = {"start": start_flow, "compress": compress_flow, "merge": merge_flow, "rotate": rotate_flow}
+
+
+def parse_mix(text) -> dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in FLOWS:
+            raise argparse.ArgumentTypeError("unknown flow " + name + ", expected one of " + ", ".join(FLOWS))
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# Records how long every handler took, under the name of the handler that matched
+class LatencyRecorder(BaseMiddleware):
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = {}
+
+    async def __call__(self, handler, event, data: dict):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            handler_object = data.get("handler")
+            name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+            self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+
+
+def _rss(pid="self") -> int:
+    try:
+        with open("/proc/" + str(pid) + "/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+async def sample_memory(samples, started, interval) -> None:
+    from workload_handlers import worker_pool
+
+    while True:
+        executor = worker_pool._executor
+        worker_pids = list(executor._processes) if executor is not None else []
+        samples.append({
+            "seconds": round(time.perf_counter() - started, 1),
+            "bot_rss_mb": round(_rss() / (1024 * 1024), 1),
+            "workers_rss_mb": round(sum(_rss(pid) for pid in worker_pids) / (1024 * 1024), 1),
+        })
+        await asyncio.sleep(interval)
+
+
+def percentiles(latencies) -> dict:
+    ordered = sorted(latencies)
+    if len(ordered) > 1:
+        cuts = statistics.quantiles(ordered, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = ordered[0]
+    return {
+        "count": len(ordered),
+        "p50_ms": round(p50 * 1000, 1),
+        "p95_ms": round(p95 * 1000, 1),
+        "p99_ms": round(p99 * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+def make_pdf(kind, pages) -> bytes:
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as file:
+        if kind == "scan":
+            scan_pdf(file.name, pages, seed=1, side=1000)
+        else:
+            text_pdf(file.name, pages, seed=1)
+        return open(file.name, "rb").read()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Synthetic load on the dispatcher")
+    parser.add_argument("--rate", type=float, default=10, help="new sessions per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to keep starting sessions")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help="flow=weight,...")
+    parser.add_argument("--file-kind", choices=("text", "scan"), default="text")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every Bot API call")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="seconds between memory samples")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    content = make_pdf(args.file_kind, args.pages)
+    fake_api = FakeBotAPI(TOKEN, latency=args.latency)
+    await fake_api.start()
+    directory = tempfile.mkdtemp()
+    for name in ("input", "output"):
+        os.makedirs(os.path.join(directory, name))
+    os.environ.update(
+        TOKEN=TOKEN,
+        BOT_API_BASE_URL=fake_api.base_url,
+        DATABASE_PATH=os.path.join(directory, "bot.sqlite3"),
+        FILE_INPUT_LOCATION=os.path.join(directory, "input"),
+        FILE_OUTPUT_LOCATION=os.path.join(directory, "output"),
+        LOGLEVEL=os.getenv("LOGLEVEL", "WARNING"),
+        METRICS_PORT=os.getenv("METRICS_PORT", "0"),
+    )
+    import app
+
+    recorder = LatencyRecorder()
+    app.dp.message.middleware(recorder)
+    app.dp.callback_query.middleware(recorder)
+
+    rng = random.Random(args.seed)
+    file_ids = itertools.count(1)
+    user_ids = itertools.count(100000)
+    flows = {name: {"started": 0, "completed": 0, "failed": 0, "seconds": []} for name in args.mix}
+    updates_fed = 0
+
+    def new_file() -> dict:
+        file_id = "load" + str(next(file_ids))
+        fake_api.add_file(file_id, content)
+        return document(file_id, file_id + ".pdf", len(content))
+
+    async def run_session(name) -> None:
+        nonlocal updates_fed
+        flow = flows[name]
+        flow["started"] += 1
+        started = time.perf_counter()
+        try:
+            for update in FLOWS[name](next(user_ids), new_file):
+                await app.dp.feed_raw_update(app.bot, update)
+                updates_fed += 1
+        except Exception as error:
+            flow["failed"] += 1
+            print("Session " + name + " failed: " + repr(error))
+            return
+        flow["completed"] += 1
+        flow["seconds"].append(time.perf_counter() - started)
+
+    # Loads the translations and starts the worker pool, as polling or the webhook server would
+    await app.dp.emit_startup(bot=app.bot, dispatcher=app.dp)
+    samples = []
+    started = time.perf_counter()
+    sampler = asyncio.create_task(sample_memory(samples, started, args.sample_interval))
+    sessions = []
+    try:
+        names, weights = list(args.mix), list(args.mix.values())
+        while time.perf_counter() - started < args.duration:
+            sessions.append(asyncio.create_task(run_session(rng.choices(names, weights)[0])))
+            await asyncio.sleep(rng.expovariate(args.rate))
+        await asyncio.gather(*sessions)
+        elapsed = time.perf_counter() - started
+    finally:
+        sampler.cancel()
+        await app.dp.emit_shutdown(bot=app.bot, dispatcher=app.dp)
+        await app.bot.session.close()
+        await fake_api.stop()
+
+    report = {
+        "seconds": round(elapsed, 2),
+        "sessions_per_second": round(sum(flow["completed"] for flow in flows.values()) / elapsed, 2),
+        "updates_per_second": round(updates_fed / elapsed, 2),
+        "uploaded_bytes": fake_api.uploaded_bytes,
+        "downloaded_bytes": fake_api.downloaded_bytes,
+        "flows": {
+            name: {
+                "started": flow["started"],
+                "completed": flow["completed"],
+                "failed": flow["failed"],
+                **({"session": percentiles(flow["seconds"])} if flow["seconds"] else {}),
+            }
+            for name, flow in flows.items()
+        },
+        "handlers": {name: percentiles(latencies) for name, latencies in sorted(recorder.latencies.items())},
+        "memory": {
+            "peak_bot_rss_mb": max((sample["bot_rss_mb"] for sample in samples), default=0),
+            "peak_workers_rss_mb": max((sample["workers_rss_mb"] for sample in samples), default=0),
+            "samples": samples,
+        },
+    }
+    print(json.dumps({key: value for key, value in report.items() if key != "memory"}, indent=2))
+    print(json.dumps({key: value for key, value in report["memory"].items() if key != "samples"}))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+import os
+import random
+from io import BytesIO
+from PIL import Image
+from pypdf import PdfWriter
+from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject
+
+# Generates the PDFs the workload benchmarks run on. Everything comes from a seeded Random,
+# so the same seed gives the same pages on every machine.
+
+STANDARD_FONTS = [
+    "Helvetica", "Helvetica-Bold", "Helvetica-Oblique", "Helvetica-BoldOblique",
+    "Times-Roman", "Times-Bold", "Times-Italic", "Times-BoldItalic",
+    "Courier", "Courier-Bold", "Courier-Oblique", "Courier-BoldOblique",
+]
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+    "et dolore magna aliqua invoice contract report quarterly payment delivery schedule signature"
+).split()
+NEAR_LIMIT_SIZE = 19 * 1024 * 1024
+
+
+def _font(writer, base_font):
+    return writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/" + base_font),
+    }))
+
+
+def _text_page(writer, rng, fonts) -> None:
+    page = writer.add_blank_page(595, 842)
+    lines = ["BT", "12 TL", "50 800 Td"]
+    for _ in range(60):
+        font_name = rng.choice(list(fonts))
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 12)))
+        lines.append(font_name + " 10 Tf (" + text + ") Tj T*")
+    lines.append("ET")
+    content = DecodedStreamObject()
+    content.set_data("\n".join(lines).encode())
+    content = content.flate_encode()
+    page[NameObject("/Contents")] = writer._add_object(content)
+    page[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/Font"): DictionaryObject({NameObject(name): font for name, font in fonts.items()}),
+        NameObject("/ProcSet"): ArrayObject([NameObject("/PDF"), NameObject("/Text")]),
+    })
+
+
+def text_pdf(path, pages, seed, font_count=1) -> None:
+    rng = random.Random(seed)
+    writer = PdfWriter()
+    fonts = {
+        "/F" + str(i): _font(writer, STANDARD_FONTS[i % len(STANDARD_FONTS)]) for i in range(font_count)
+    }
+    for _ in range(pages):
+        _text_page(writer, rng, fonts)
+    with open(path, "wb") as file:
+        writer.write(file)
+
+
+# Looks like a scanned page: a smooth background with grain, which JPEG encodes about as well as
+# it does real scans
+def _scan_image(rng, side) -> Image.Image:
+    background = Image.frombytes("L", (side // 16, side // 16), rng.randbytes((side // 16) ** 2))
+    background = background.resize((side, side), Image.BICUBIC)
+    grain = Image.frombytes("L", (side, side), rng.randbytes(side * side))
+    return Image.blend(background, grain, 0.25).convert("RGB")
+
+
+def scan_pdf(path, pages, seed, side=1600, quality=90) -> None:
+    rng = random.Random(seed)
+    images = [_scan_image(rng, side) for _ in range(pages)]
+    images[0].save(path, "PDF", save_all=True, append_images=images[1:], quality=quality, resolution=150)
+
+
+# Adds scanned pages until the file is just under the 20 MB the bot accepts
+def near_limit_pdf(path, seed, size=NEAR_LIMIT_SIZE) -> None:
+    rng = random.Random(seed)
+    page = BytesIO()
+    _scan_image(rng, 2400).save(page, "PDF", quality=95, resolution=200)
+    pages = max(1, size // len(page.getvalue()))
+    images = [_scan_image(rng, 2400) for _ in range(pages)]
+    images[0].save(path, "PDF", save_all=True, append_images=images[1:], quality=95, resolution=200)
+
+
+CORPUS = {
+    "text.pdf": lambda path, seed: text_pdf(path, 20, seed),
+    "scan.pdf": lambda path, seed: scan_pdf(path, 8, seed),
+    "many_pages.pdf": lambda path, seed: text_pdf(path, 500, seed),
+    "many_fonts.pdf": lambda path, seed: text_pdf(path, 40, seed, font_count=200),
+    "near_limit.pdf": lambda path, seed: near_limit_pdf(path, seed),
+}
+
+
+# Files already generated with the same seed are reused
+def build_corpus(directory, seed=1, names=None) -> dict[str, str]:
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for name, generate in CORPUS.items():
+        if names is not None and name not in names:
+            continue
+        path = os.path.join(directory, str(seed) + "_" + name)
+        if not os.path.exists(path):
+            generate(path + ".part", seed)
+            os.replace(path + ".part", path)
+        paths[name] = path
+    return paths
@@ -0,0 +1,62 @@
+import itertools
+import time
+
+# Builders for Telegram update payloads shaped like what a private chat sends the bot
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+def _user(user_id) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": "User" + str(user_id), "language_code": "en"}
+
+
+def _chat(user_id) -> dict:
+    return {"id": user_id, "type": "private", "first_name": "User" + str(user_id)}
+
+
+def message_update(user_id, text=None, document=None, media_group_id=None) -> dict:
+    message = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": _chat(user_id),
+        "from": _user(user_id),
+    }
+    if text is not None:
+        message["text"] = text
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    if document is not None:
+        message["document"] = document
+    if media_group_id is not None:
+        message["media_group_id"] = media_group_id
+    return {"update_id": next(_update_ids), "message": message}
+
+
+def document(file_id, file_name, file_size, mime_type="application/pdf") -> dict:
+    return {
+        "file_id": file_id,
+        "file_unique_id": "u" + file_id,
+        "file_name": file_name,
+        "mime_type": mime_type,
+        "file_size": file_size,
+    }
+
+
+def callback_update(user_id, data) -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": next(_message_ids),
+                "date": int(time.time()),
+                "chat": _chat(user_id),
+                "from": {"id": 1, "is_bot": True, "first_name": "FakeBot"},
+                "text": "menu",
+            },
+        },
+    }
@@ -10,4 +10,11 @@ menu_items = [
 menu_items_admin = [
     BotCommand(command="start", description="Back to user menu"),
     BotCommand(command="cancel", description="Cancel"),
-]
\ No newline at end of file
+]
+
+# Command sets a chat can be switched to, chats without a scope of their own get the default one
+DEFAULT_COMMAND_SET = "user"
+COMMAND_SETS = {
+    "user": menu_items,
+    "admin": menu_items_admin,
+}
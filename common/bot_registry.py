@@ -0,0 +1,69 @@
+import os
+import ssl
+import certifi
+from aiogram import Bot, __version__ as aiogram_version
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+from aiohttp import ClientSession, TCPConnector
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from dotenv import find_dotenv, load_dotenv
+
+load_dotenv(find_dotenv())
+
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL")
+BOT_CONNECTION_LIMIT = int(os.getenv("BOT_CONNECTION_LIMIT", 100))
+BOT_KEEPALIVE_TIMEOUT = float(os.getenv("BOT_KEEPALIVE_TIMEOUT", 60))
+BOT_DNS_CACHE_TTL = int(os.getenv("BOT_DNS_CACHE_TTL", 3600))
+
+_bot: Bot | None = None
+
+
+# AiohttpSession with a connection pool sized for the bot, the connector is built here instead of
+# from the one aiogram configures
+class PooledSession(AiohttpSession):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._client_session: ClientSession | None = None
+
+    async def create_session(self) -> ClientSession:
+        if self._client_session is None or self._client_session.closed:
+            self._client_session = ClientSession(
+                connector=TCPConnector(
+                    ssl=ssl.create_default_context(cafile=certifi.where()),
+                    limit=BOT_CONNECTION_LIMIT,
+                    keepalive_timeout=BOT_KEEPALIVE_TIMEOUT,
+                    ttl_dns_cache=BOT_DNS_CACHE_TTL,
+                ),
+                headers={USER_AGENT: SERVER_SOFTWARE + " aiogram/" + aiogram_version},
+            )
+        return self._client_session
+
+    async def close(self) -> None:
+        if self._client_session is not None and not self._client_session.closed:
+            await self._client_session.close()
+
+
+def create_session(api_base_url=BOT_API_BASE_URL) -> AiohttpSession:
+    api = TelegramAPIServer.from_base(api_base_url) if api_base_url else PRODUCTION
+    return PooledSession(api=api)
+
+
+def set_bot(bot: Bot) -> None:
+    global _bot
+    _bot = bot
+
+
+# Every Telegram API call goes through this one Bot so polling, downloads and uploads share a connection pool
+def get_bot() -> Bot:
+    global _bot
+    if _bot is None:
+        _bot = Bot(token=os.getenv("TOKEN"), session=create_session())
+    return _bot
+
+
+async def close() -> None:
+    global _bot
+    if _bot is not None:
+        await _bot.session.close()
+        _bot = None
@@ -0,0 +1,144 @@
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+from dotenv import find_dotenv, load_dotenv
+
+load_dotenv(find_dotenv())
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(trace_id)s - %(name)s - %(message)s"
+LOG_JSON = os.getenv("LOG_JSON", "0") == "1"
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
+
+# Fields passed with extra= that are written out when a record has them
+STAGE_FIELDS = ("stage", "duration", "size")
+
+# The update being handled, set by TracingMiddleware. Tasks, threads started with asyncio.to_thread
+# and jobs in the worker pool carry it along, so every line of one job shares the id.
+trace_id: contextvars.ContextVar[str] = contextvars.ContextVar("trace_id", default="-")
+
+_listeners: list[logging.handlers.QueueListener] = []
+_root_handler: logging.Handler | None = None
+_target: logging.Handler | None = None
+_worker_queue = None
+
+
+class TraceIdFilter(logging.Filter):
+    def filter(self, record) -> bool:
+        if not hasattr(record, "trace_id"):
+            record.trace_id = trace_id.get()
+        return True
+
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, json_output=False) -> None:
+        super().__init__(LOG_FORMAT)
+        self.json_output = json_output
+
+    def format(self, record) -> str:
+        fields = {name: getattr(record, name) for name in STAGE_FIELDS if hasattr(record, name)}
+        if not self.json_output:
+            line = super().format(record)
+            if fields:
+                line += " | " + " ".join(name + "=" + str(value) for name, value in fields.items())
+            return line
+
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "trace_id": getattr(record, "trace_id", "-"),
+            "logger": record.name,
+            "message": record.getMessage(),
+            **fields,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# The stock prepare() formats the traceback into the message and drops exc_info, which can not be
+# pickled. Here the traceback is kept apart in exc_text, where both formats pick it up.
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def _queue_handler(target_queue) -> logging.handlers.QueueHandler:
+    handler = RecordQueueHandler(target_queue)
+    handler.addFilter(TraceIdFilter())
+    return handler
+
+
+# Handlers only put records on a queue and a listener thread does the formatting and the writing,
+# so a slow disk never stalls the event loop. The file is rotated by size instead of being
+# truncated on every start. Worker pool processes log through a multiprocessing queue of their own
+# that the same listener setup drains.
+def setup_logging(
+    filename=None, level=None, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, json_output=LOG_JSON
+) -> None:
+    global _root_handler, _target, _worker_queue
+    stop_logging()
+
+    if filename:
+        _target = logging.handlers.RotatingFileHandler(
+            filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+    else:
+        _target = logging.StreamHandler()
+    _target.setFormatter(StructuredFormatter(json_output))
+
+    records = queue.SimpleQueue()
+    # Made in the spawn context so webhook workers can be given it, forked pool processes inherit it either way
+    _worker_queue = multiprocessing.get_context("spawn").Queue()
+    for source in (records, _worker_queue):
+        listener = logging.handlers.QueueListener(source, _target, respect_handler_level=True)
+        listener.start()
+        _listeners.append(listener)
+
+    _root_handler = _queue_handler(records)
+    logging.getLogger().addHandler(_root_handler)
+    if level:
+        logging.getLogger().setLevel(level)
+
+
+def stop_logging() -> None:
+    global _root_handler, _target
+    if _root_handler is not None:
+        logging.getLogger().removeHandler(_root_handler)
+        _root_handler = None
+    while _listeners:
+        _listeners.pop().stop()
+    if _target is not None:
+        _target.close()
+        _target = None
+
+
+def worker_log_queue():
+    return _worker_queue
+
+
+# Initializer of the worker pool and webhook worker processes. Their records go to the queue of the
+# process that started them, so only that one writes (and rotates) the log file. Pools started by a
+# webhook worker pass the same queue on.
+def configure_worker(log_queue, level) -> None:
+    global _worker_queue
+    _worker_queue = log_queue
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if log_queue is not None:
+        root.addHandler(_queue_handler(log_queue))
+    root.setLevel(level)
@@ -0,0 +1,162 @@
+import bisect
+import logging
+import os
+import time
+from contextlib import contextmanager
+from aiohttp import web
+from dotenv import find_dotenv, load_dotenv
+
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9101))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_registry: list["_Metric"] = []
+_runner: web.AppRunner | None = None
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(name + '="' + value + '"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Metrics in the Prometheus text format, kept in plain dicts: the bot runs one event loop per
+# process, so there is no locking. A metric built with a function reads its value at scrape time.
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, function=None) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self._values: dict[tuple, float] = {}
+        _registry.append(self)
+
+    @staticmethod
+    def _key(labels) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    def _samples(self):
+        if self.function is not None:
+            yield self.name, (), self.function()
+            return
+        for labels, value in self._values.items():
+            yield self.name, labels, value
+
+    def render(self) -> str:
+        lines = ["# HELP " + self.name + " " + self.documentation, "# TYPE " + self.name + " " + self.kind]
+        for name, labels, value in self._samples():
+            lines.append(name + _format_labels(labels) + " " + _format_value(value))
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+        # Per label set: a count for every bucket (not cumulative yet), the sum and the total count
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value, **labels) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series is not None else 0
+
+    def _samples(self):
+        for labels, (bucket_counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                yield self.name + "_bucket", labels + (("le", _format_value(float(bound))),), cumulative
+            yield self.name + "_bucket", labels + (("le", "+Inf"),), count
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, count
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(body=render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+# Serves /metrics for Prometheus on a local port. With several webhook workers only the first one
+# gets the port, the others keep running without it.
+async def start_server(host=METRICS_HOST, port=METRICS_PORT) -> None:
+    global _runner
+    if not port or _runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as error:
+        logger.warning("Metrics endpoint not started on %s:%s: %r", host, port, error)
+        await runner.cleanup()
+        return
+    _runner = runner
+    logger.info("Metrics served on http://%s:%s/metrics", host, port)
+
+
+async def stop_server() -> None:
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from dotenv import find_dotenv, load_dotenv
+
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", 60))
+
+
+# Waits for updates that are still being handled before the bot session is closed
+class DrainingRequestHandler(SimpleRequestHandler):
+    async def close(self) -> None:
+        pending = set(self._background_feed_update_tasks)
+        if pending:
+            logger.info("Draining %s updates in progress", len(pending))
+            done, not_done = await asyncio.wait(pending, timeout=WEBHOOK_DRAIN_TIMEOUT)
+            if not_done:
+                logger.warning("%s updates were still running after the drain timeout", len(not_done))
+        await super().close()
+
+
+def create_app(dispatcher: Dispatcher, bot: Bot, path, secret_token=None) -> web.Application:
+    app = web.Application()
+    # The handler goes first so its drain runs before the dispatcher shutdown hooks release resources
+    DrainingRequestHandler(dispatcher=dispatcher, bot=bot, secret_token=secret_token).register(app, path=path)
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+
+# Starts the given number of server processes. They bind the same port with SO_REUSEPORT and the kernel
+# spreads incoming webhook connections between them. args are passed to target in every worker.
+def run_workers(target, workers, *args) -> None:
+    if workers <= 1:
+        target()
+        return
+
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=target, args=args, name="webhook-worker-" + str(i)) for i in range(workers)]
+    for process in processes:
+        process.start()
+    logger.info("Started %s webhook workers", workers)
+
+    def stop_workers(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+    for process in processes:
+        process.join()
@@ -8,8 +8,9 @@ from aiogram.fsm.context import FSMContext
 from dotenv import find_dotenv, load_dotenv
 
 from filters.chat_types import ChatTypeFilter, IsAdmin
-from common.bot_commands import menu_items_admin
 from keyboards.inline_keyboard import build_inline_callback_keyboard
+from storages.command_scopes import command_scopes
+from storages.temp_files import temp_files
 
 load_dotenv(find_dotenv())
 log_file_path = os.getenv("LOGFILEPATH")
@@ -25,13 +26,17 @@ admin_handlers_router.message.filter(ChatTypeFilter(["private"]), IsAdmin())
 
 logger = logging.getLogger(__name__)
 
+ADMIN_KEYBOARD = build_inline_callback_keyboard(
+    buttons={"Restart bot": f"restart", "Get logfile": f"logfile", "Storage usage": f"storage"}
+)
+
 
 @admin_handlers_router.message(StateFilter("*"), Command("cancel"))
 @admin_handlers_router.message(
     StateFilter("*"), or_f(F.data.contains("cancel"), F.text.casefold() == "cancel")
 )
 async def cancel_handler(message: types.Message, state: FSMContext) -> None:
-    logger.info("cancel_handler from state " + str(state.get_state()))
+    logger.info("cancel_handler from state %s", state.get_state())
     current_state = await state.get_state()
     if current_state is None:
         return
@@ -46,14 +51,11 @@ async def cancel_handler(message: types.Message, state: FSMContext) -> None:
 @admin_handlers_router.message(StateFilter(None), Command("admin"))
 async def admin_features(message: types.Message, state: FSMContext) -> None:
     logger.info("admin_features")
-    await message.bot.delete_my_commands(scope=types.BotCommandScopeChat(chat_id=message.chat.id))
-    await message.bot.set_my_commands(
-        commands=menu_items_admin, scope=types.BotCommandScopeChat(chat_id=message.chat.id)
-    )
+    await command_scopes.request(message.chat.id, "admin")
     await state.set_state(AdminFeatures.selectOption)
     await message.answer(
         "Hey, Admin",
-        reply_markup=build_inline_callback_keyboard(buttons={"Restart bot": f"restart", "Get logfile": f"logfile"})
+        reply_markup=ADMIN_KEYBOARD
     )
 
 
@@ -72,6 +74,17 @@ async def logfile_callback(callback: types.CallbackQuery, state: FSMContext) ->
     await callback.message.answer_document(types.FSInputFile(log_file_path))
     await callback.message.answer(
         "Let's start it over",
-        reply_markup=build_inline_callback_keyboard(buttons={"Restart bot": f"restart", "Get logfile": f"logfile"})
+        reply_markup=ADMIN_KEYBOARD
     )
 
+
+@admin_handlers_router.callback_query(StateFilter(AdminFeatures.selectOption), F.data.contains("storage"))
+async def storage_callback(callback: types.CallbackQuery, state: FSMContext) -> None:
+    logger.info("storage_callback")
+    await callback.answer()
+    usage = temp_files.usage()
+    await callback.message.answer(
+        "Temporary files: " + str(usage["tracked_files"]) + "\n"
+        + "Bytes in use: " + str(usage["bytes_in_use"]) + "\n"
+        + "Disk used: " + str(round(usage["disk_used_fraction"] * 100, 1)) + "%"
+    )
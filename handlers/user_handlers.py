@@ -1,31 +1,49 @@
+import asyncio
 import logging
 import os
+import time
 from aiogram import F, types, Router, methods
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import CommandStart, Command, StateFilter, or_f
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram_i18n import I18nContext, LazyProxy, I18nMiddleware
 
 from filters.chat_types import ChatTypeFilter
+from keyboards import keyboard_cache
 from keyboards.inline_keyboard import build_inline_callback_keyboard
-from workload_handlers.pdf_compressor import compressPDF
+from middlewares.media_group import MediaGroupMiddleware
+from workload_handlers.pdf_compressor import compressPDF, COMPRESSION_PROFILES
 from workload_handlers.pdf_converter import convertToPDF
 from workload_handlers.file_downloader import fileDownloader
-from workload_handlers.pdf_merger import mergeTwoPDF
-from common.bot_commands import menu_items
+from workload_handlers.pdf_merger import mergePDF
+from workload_handlers.file_archiver import zipFiles
+from workload_handlers.job_queue import job_queue
+from workload_handlers import preflight
+from common.metrics import Counter, Histogram
+from storages.command_scopes import command_scopes
+from storages.result_cache import result_cache
+from storages.upload_index import upload_index, hash_file, hash_bytes
+from storages import workspace
 
 from dotenv import find_dotenv, load_dotenv
-from workload_handlers.pdf_rotator import rotatePDF
+from workload_handlers.pdf_rotator import rotatePDF, parse_page_ranges
 
 load_dotenv(find_dotenv())
 
 logger = logging.getLogger(__name__)
 
 file_input_location = os.getenv("FILE_INPUT_LOCATION")
-file_output_location = os.getenv("FILE_OUTPUT_LOCATION")
+merge_max_files = int(os.getenv("MERGE_MAX_FILES", 20))
+
+UPLOAD_BYTES = Counter("bot_upload_bytes_total", "Bytes of generated documents uploaded to Telegram")
+UPLOAD_SECONDS = Histogram("bot_upload_seconds", "Time to upload a generated document to Telegram")
+DOCUMENTS_SENT = Counter("bot_documents_sent_total", "Documents sent, by whether they were uploaded or re-sent by file_id")
+PREFLIGHT_REJECTIONS = Counter("bot_preflight_rejections_total", "Documents turned away before processing, by reason")
 
 user_handlers_router = Router()
 user_handlers_router.message.filter(ChatTypeFilter(["private"]))
+user_handlers_router.message.middleware(MediaGroupMiddleware())
 
 
 INITIAL_KEYBOARD = build_inline_callback_keyboard(
@@ -33,7 +51,7 @@ INITIAL_KEYBOARD = build_inline_callback_keyboard(
         LazyProxy("Convert to PDF"): f"topdf",
         LazyProxy("Compress PDF file"): f"compress",
         LazyProxy("Rotate PDF"): f"rotate",
-        LazyProxy("Merge two PDFs"): f"merge",
+        LazyProxy("Merge PDFs"): f"merge",
     }
 )
 
@@ -42,7 +60,7 @@ FILE_FIRST_KEYBOARD_PDF_FILE = build_inline_callback_keyboard(
     buttons={
         LazyProxy("Compress PDF file"): f"compress_file_first",
         LazyProxy("Rotate PDF"): f"rotate_file_first",
-        LazyProxy("Merge two PDFs"): f"merge_file_first",
+        LazyProxy("Merge PDFs"): f"merge_file_first",
     }
 )
 
@@ -54,15 +72,69 @@ FILE_FIRST_KEYBOARD_NON_PDF_FILE = build_inline_callback_keyboard(
 )
 
 
+COMPRESS_PROFILE_KEYBOARD = build_inline_callback_keyboard(
+    buttons={
+        LazyProxy("Fast"): f"profile_fast",
+        LazyProxy("Balanced"): f"profile_balanced",
+        LazyProxy("Maximum compression"): f"profile_maximum",
+        LazyProxy("Fit under N MB"): f"profile_target",
+    }
+)
+
+
+MERGE_DONE_KEYBOARD = build_inline_callback_keyboard(
+    buttons={
+        LazyProxy("Done, combine the files"): f"combine_files",
+    }
+)
+
+
+ALBUM_KEYBOARD_PDF_FILES = build_inline_callback_keyboard(
+    buttons={
+        LazyProxy("Combine into one PDF"): f"combine_files",
+        LazyProxy("Pack into a ZIP file"): f"pack_zip",
+    }
+)
+
+
+ALBUM_KEYBOARD = build_inline_callback_keyboard(
+    buttons={
+        LazyProxy("Pack into a ZIP file"): f"pack_zip",
+    }
+)
+
+
+ROTATE_ANGLE_BUTTONS = {
+    LazyProxy("Rotate left - 90°"): f"left90",
+    LazyProxy("Rotate right - 90°"): f"right90",
+    LazyProxy("Rotate - 180°"): f"right180",
+}
+
+
 ROTATE_KEYBOARD = build_inline_callback_keyboard(
     buttons={
-        LazyProxy("Rotate left - 90°"): f"left90",
-        LazyProxy("Rotate right - 90°"): f"right90",
-        LazyProxy("Rotate - 180°"): f"right180",
+        **ROTATE_ANGLE_BUTTONS,
+        LazyProxy("Only some pages"): f"pick_pages",
     }
 )
 
 
+ROTATE_ANGLE_KEYBOARD = build_inline_callback_keyboard(buttons=ROTATE_ANGLE_BUTTONS)
+
+
+keyboard_cache.register(
+    initial=INITIAL_KEYBOARD,
+    file_first_pdf_file=FILE_FIRST_KEYBOARD_PDF_FILE,
+    file_first_non_pdf_file=FILE_FIRST_KEYBOARD_NON_PDF_FILE,
+    compress_profile=COMPRESS_PROFILE_KEYBOARD,
+    merge_done=MERGE_DONE_KEYBOARD,
+    album_pdf_files=ALBUM_KEYBOARD_PDF_FILES,
+    album=ALBUM_KEYBOARD,
+    rotate=ROTATE_KEYBOARD,
+    rotate_angle=ROTATE_ANGLE_KEYBOARD,
+)
+
+
 SUPPORTED_FILES_LIST = [
     ".txt",
     ".csv",
@@ -98,9 +170,15 @@ class ToPDFFileFirst(StatesGroup):
 
 
 class CompressPDF(StatesGroup):
+    selectProfile = State()
+    targetSize = State()
     input = State()
 
-    texts = {"CompressPDF:input": "Upload your file"}
+    texts = {
+        "CompressPDF:selectProfile": "Select compression level",
+        "CompressPDF:targetSize": "Send the maximum size of the compressed file in MB",
+        "CompressPDF:input": "Upload your file",
+    }
 
 
 class CompressPDFFileFirst(StatesGroup):
@@ -112,8 +190,13 @@ class CompressPDFFileFirst(StatesGroup):
 class Rotate(StatesGroup):
     input = State()
     selectOption = State()
+    selectPages = State()
 
-    texts = {"Rotate:input": "Upload your file", "Rotate:option": "Select your option"}
+    texts = {
+        "Rotate:input": "Upload your file",
+        "Rotate:option": "Select your option",
+        "Rotate:selectPages": "Send the pages to rotate, for example 3-5 or 1,4,7",
+    }
 
 
 class RotateFileFirst(StatesGroup):
@@ -123,41 +206,185 @@ class RotateFileFirst(StatesGroup):
 
 
 class MergePDF(StatesGroup):
-    input_file1 = State()
-    input_file2 = State()
+    collect = State()
 
     texts = {
-        "MergePDF:input1": "Upload your first file",
-        "MergePDF:input2": "Upload your second file",
+        "MergePDF:collect": "Upload your PDF files one by one and press Done when all of them are sent",
     }
 
 
-class MergePDFFileFirst(StatesGroup):
-    input_file2 = State()
-    process = State()
+class DocumentWithoutCommand(StatesGroup):
+    selectOption = State()
 
-    texts = {
-        "MergePDFFileFirst:input2": "Upload your second file",
-        "MergePDFFileFirst:process": "Processing your files",
-    }
+    texts = {"DocumentWithoutCommand:selectOption": "Select desired option"}
 
 
-class DocumentWithoutCommand(StatesGroup):
+class DocumentAlbum(StatesGroup):
     selectOption = State()
 
-    texts = {"DocumentWithoutCommand:selectOption": "Select desired option"}
+    texts = {"DocumentAlbum:selectOption": "Select what you want to do with these files"}
+
+
+# Re-sends an output produced earlier for the same input instead of processing it again
+async def reply_from_result_cache(
+    message: types.Message, i18n: I18nContext, input_key, operation, params="", file_name=""
+) -> bool:
+    cached_file_id = result_cache.get(input_key, operation, params, file_name)
+    if cached_file_id is None:
+        return False
+
+    try:
+        await message.reply_document(cached_file_id)
+    except TelegramBadRequest:
+        logger.debug("Cached result %s was rejected, processing the file again", cached_file_id)
+        result_cache.remove(input_key, operation, params, file_name)
+        return False
+    logger.debug("Cached result %s sent to chat %s", cached_file_id, message.chat.id)
+    await message.answer(i18n.get("Here is your PDF"), reply_markup=INITIAL_KEYBOARD)
+    return True
+
+
+def read_file(file_path) -> bytes:
+    with open(file_path, "rb") as file:
+        return file.read()
+
+
+# Sends an identical output by its known file_id and uploads the bytes only the first time
+async def reply_with_document(message: types.Message, file_path_output, file_name) -> types.Message:
+    # A result in the in-memory workspace is read once, for the hash and for the upload
+    if workspace.in_memory(file_path_output):
+        content = await asyncio.to_thread(read_file, file_path_output)
+        content_hash = await hash_bytes(content)
+        input_file = types.BufferedInputFile(content, file_name)
+    else:
+        content_hash = await hash_file(file_path_output)
+        input_file = types.FSInputFile(file_path_output, file_name)
+    uploaded_file_id = upload_index.get(content_hash, file_name)
+
+    if uploaded_file_id is not None:
+        try:
+            sent_message = await message.reply_document(uploaded_file_id)
+            DOCUMENTS_SENT.inc(source="file_id")
+            return sent_message
+        except TelegramBadRequest:
+            logger.debug("Stored file_id for %s was rejected, uploading again", content_hash)
+            upload_index.remove(content_hash, file_name)
+
+    started = time.perf_counter()
+    sent_message = await message.reply_document(input_file)
+    elapsed = time.perf_counter() - started
+    size = os.path.getsize(file_path_output)
+    UPLOAD_SECONDS.observe(elapsed)
+    UPLOAD_BYTES.inc(size)
+    logger.info(
+        "Uploaded %s: %s bytes in %.3f s", file_name, size, elapsed,
+        extra={"stage": "upload", "duration": round(elapsed, 3), "size": size},
+    )
+    DOCUMENTS_SENT.inc(source="upload")
+    upload_index.put(content_hash, file_name, sent_message.document.file_id)
+    return sent_message
+
+
+# Raises PreflightError when the content does not match the extension (the download stops after
+# the first bytes) or when a PDF is over the page or object limits. None when the download failed.
+# The operation keeps files for the converter out of the in-memory workspace.
+async def download_checked(document: types.Document, operation=None) -> str | None:
+    file_path_input = await fileDownloader(document.file_id, document.file_name, document.file_unique_id, operation)
+    if file_path_input is not None and preflight.is_pdf(document.file_name):
+        await preflight.check_pdf_limits(file_path_input)
+    return file_path_input
+
+
+# Returns None when the document was turned away or could not be downloaded, after telling the user
+async def download_document(
+    message: types.Message, i18n: I18nContext, reply_markup=None, operation=None
+) -> str | None:
+    try:
+        file_path_input = await download_checked(message.document, operation)
+    except preflight.PreflightError as error:
+        PREFLIGHT_REJECTIONS.inc(reason=error.reason)
+        logger.info(
+            "Document %s from user %s rejected: %s", message.document.file_name, message.from_user.id, error.reason
+        )
+        if error.reason == "too_many_pages":
+            text = i18n.get(
+                "Your PDF has {pages} pages, the limit is {limit} \n Please try a smaller file", **error.details
+            )
+        elif error.reason == "too_many_objects":
+            text = i18n.get("Your PDF is too complex to process \n Please try a simpler file")
+        elif error.reason == "damaged":
+            text = i18n.get("Your PDF file is damaged \n Please try another file")
+        else:
+            text = i18n.get("The content of your file does not match its extension \n Please try another file")
+        await message.answer(text, reply_markup=reply_markup)
+        return None
+
+    if file_path_input is None:
+        logger.info(
+            "Something went wrong with the file %s from the user %s", message.document.file_name, message.from_user.id,
+        )
+        await message.answer(i18n.get("Something went wrong \n Please try again"), reply_markup=reply_markup)
+    return file_path_input
+
+
+# Downloads the documents of an album all at once. Returns the files that made it to disk,
+# in the order they were sent, ready to be stored as batch_files.
+async def download_album(message: types.Message, i18n: I18nContext, album, pdf_only=False) -> list[dict]:
+    documents = []
+    skipped = 0
+    for album_message in album:
+        document = album_message.document
+        if document is None:
+            continue
+        if document.file_size / (1024 * 1024) >= 20 or (
+            pdf_only and not preflight.accepts(document.file_name, document.mime_type, [".pdf"])
+        ):
+            skipped += 1
+            continue
+        documents.append(document)
+
+    results = await asyncio.gather(
+        *[download_checked(document) for document in documents], return_exceptions=True
+    )
+    batch_files = []
+    for document, result in zip(documents, results):
+        if isinstance(result, preflight.PreflightError):
+            PREFLIGHT_REJECTIONS.inc(reason=result.reason)
+            skipped += 1
+        elif isinstance(result, BaseException):
+            raise result
+        elif result is not None:
+            batch_files.append({"path": result, "unique_id": document.file_unique_id, "name": document.file_name})
+
+    if skipped:
+        await message.answer(i18n.get("{count} files were skipped, they are too big or not supported", count=skipped))
+    return batch_files
+
+
+# Keeps the user's "Please wait" message updated while their job waits in the queue
+def queue_position_reporter(message: types.Message, i18n: I18nContext, wait_message: types.Message | None = None):
+    async def report(position) -> None:
+        nonlocal wait_message
+        if position == 0:
+            text = i18n.get("Processing your file")
+        else:
+            text = i18n.get("Please wait, your file is number {position} in the queue", position=position)
+
+        if wait_message is None:
+            wait_message = await message.answer(text)
+        else:
+            await wait_message.edit_text(text)
+
+    return report
 
 @user_handlers_router.message(or_f(Command("start"), (F.text.lower() == "start")))
 @user_handlers_router.message(CommandStart())
 async def start_cmd(message: types.Message, i18n: I18nContext) -> None:
-    await message.bot.delete_my_commands(scope=types.BotCommandScopeChat(chat_id=message.chat.id))
-    await message.bot.set_my_commands(
-        commands=menu_items, scope=types.BotCommandScopeChat(chat_id=message.chat.id)
-    )
+    await command_scopes.request(message.chat.id, "user")
     await message.answer(
         i18n.get("Hi, I am your PDF converter assistant"), reply_markup=INITIAL_KEYBOARD
     )
-    logger.info("Started for user " + str(message.from_user.id))
+    logger.info("Started for user %s", message.from_user.id)
 
 
 async def switch_language(message: types.Message, i18n: I18nContext, locale_code: str) -> None:
@@ -169,75 +396,91 @@ async def switch_language(message: types.Message, i18n: I18nContext, locale_code
 
 @user_handlers_router.message(Command("en"))
 async def switch_to_en(message: types.Message, i18n: I18nContext) -> None:
-    logger.debug(str(message.from_user.id) + " switched the language to English")
+    logger.debug("%s switched the language to English", message.from_user.id)
     await switch_language(message, i18n,"en")
 
 
 @user_handlers_router.message(Command("ru"))
 async def switch_to_en(message: types.Message, i18n: I18nContext) -> None:
-    logger.debug(str(message.from_user.id) + " switched the language to Russian")
+    logger.debug("%s switched the language to Russian", message.from_user.id)
     await switch_language(message, i18n,"ru")
 
 
 # This is a handler for incoming document without a command
+@user_handlers_router.message(StateFilter(None), F.media_group_id, F.document, flags={"album": True})
+async def document_album(
+    message: types.Message, state: FSMContext, i18n: I18nContext, album: list[types.Message] | None = None
+) -> None:
+    album = album or [message]
+    logger.info("Recieved an album of %s documents from user %s", len(album), message.from_user.id)
+    await message.answer(i18n.get("Please wait"))
+
+    batch_files = await download_album(message, i18n, album)
+
+    if not batch_files:
+        await message.answer(
+            i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
+        )
+        return
+
+    await state.update_data(batch_files=batch_files)
+    await state.set_state(DocumentAlbum.selectOption)
+    if len(batch_files) > 1 and all(preflight.is_pdf(batch_file["name"]) for batch_file in batch_files):
+        reply_markup = ALBUM_KEYBOARD_PDF_FILES
+    else:
+        reply_markup = ALBUM_KEYBOARD
+    await message.answer(
+        i18n.get("Select what you want to do with these files"), reply_markup=reply_markup
+    )
+
+
 @user_handlers_router.message(StateFilter(None), F.document)
 async def document_without_command(message: types.Message, state: FSMContext, i18n: I18nContext) -> None:
     await state.set_state(DocumentWithoutCommand.selectOption)
     original_file_name = message.document.file_name
     file_id_telegram = message.document.file_id
+    file_unique_id = message.document.file_unique_id
     file_name_output_temp = os.path.splitext(original_file_name)
     temp_file_name_with_id = file_id_telegram + "_" + file_name_output_temp[0] + ".pdf"
-    logger.info(
-        "Recieved document "
-        + original_file_name
-        + " from user "
-        + str(message.from_user.id)
-    )
+    logger.info("Recieved document %s from user %s", original_file_name, message.from_user.id)
 
     if message.document.file_size / (1024 * 1024) >= 20:
-        logger.debug(original_file_name + " is more than 20MB")
+        logger.debug("%s is more than 20MB", original_file_name)
         await message.answer(i18n.get("Your file exceeds 20 MB \n Please try a smaller file"))
         return
 
-    file_path_input = await fileDownloader(file_id_telegram, original_file_name)
-    logger.debug("fileDownloader output is: " + file_path_input)
-
-    if not (os.path.exists(file_path_input)):
-        logger.info(
-            "Something went wrong with the file "
-            + file_path_input
-            + " from the user "
-            + str(message.from_user.id)
-        )
+    if not preflight.accepts(original_file_name, message.document.mime_type, SUPPORTED_FILES_LIST + [".pdf"]):
+        logger.debug("Input file is not in the supported file types list")
+        await state.clear()
         await message.answer(
-            i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
+            i18n.get("Your file is in an unsupported format \n Please try another file"),
+            reply_markup=INITIAL_KEYBOARD,
         )
         return
 
+    # Anything but a PDF can only be converted, and the converter needs the file on disk
+    operation = None if preflight.is_pdf(original_file_name) else "topdf"
+    file_path_input = await download_document(message, i18n, reply_markup=INITIAL_KEYBOARD, operation=operation)
+    logger.debug("fileDownloader output is: %s", file_path_input)
+
+    if file_path_input is None:
+        await state.clear()
+        return
+
     await state.update_data(file_path_input=file_path_input)
     await state.update_data(file_id_telegram=file_id_telegram)
+    await state.update_data(file_unique_id=file_unique_id)
     await state.update_data(original_file_name=original_file_name)
 
-    if file_name_output_temp[1] != ".pdf":
-        logger.debug("Input file is not a PDF")
-        if file_name_output_temp[1] not in SUPPORTED_FILES_LIST:
-            logger.debug("Input file is not in the supported file types list")
-            await message.answer(
-                i18n.get("Your file is in an unsupported format \n Please try another file"),
-                reply_markup=INITIAL_KEYBOARD,
-            )
-            os.remove(file_path_input)
-            logger.debug("File " + file_name_output_temp + " removed")
-            return
-        else:
-            logger.debug("Input file is in the supported file types list")
-            await message.answer(
-                i18n.get("Please select what you want to do with this file"),
-                reply_markup=FILE_FIRST_KEYBOARD_NON_PDF_FILE,
-            )
-            return
+    if not preflight.is_pdf(original_file_name):
+        logger.debug("Input file is in the supported file types list")
+        await message.answer(
+            i18n.get("Please select what you want to do with this file"),
+            reply_markup=FILE_FIRST_KEYBOARD_NON_PDF_FILE,
+        )
+        return
 
-    if file_name_output_temp[1] == ".pdf":
+    if preflight.is_pdf(original_file_name):
         logger.debug("Input file is not a PDF")
         await message.answer(
             i18n.get("Please select what you want to do with this file"),
@@ -258,18 +501,24 @@ async def topdf_file_first(callback: types.CallbackQuery, state: FSMContext, i18
 
     file_path_input = data["file_path_input"]
     file_id_telegram = data["file_id_telegram"]
+    file_unique_id = data["file_unique_id"]
     original_file_name = data["original_file_name"]
 
     file_name_output_temp = os.path.splitext(original_file_name)
-    file_name_output_original_pdf = file_name_output_temp[0] + ".pdf"
     temp_file_name_with_id = file_id_telegram + "_" + file_name_output_temp[0] + ".pdf"
+    file_name_output = "converted_" + file_name_output_temp[0] + ".pdf"
+
+    if await reply_from_result_cache(callback.message, i18n, file_unique_id, "topdf", file_name=file_name_output):
+        await state.clear()
+        return
 
     await callback.message.answer(i18n.get("Please wait"))
 
-    file_path_output = os.path.join(file_output_location, temp_file_name_with_id)
+    output_location = workspace.output_location(file_path_input, operation="topdf")
+    file_path_output = os.path.join(output_location, temp_file_name_with_id)
 
-    converter_exit_code = await convertToPDF(file_path_input, file_output_location)
-    logger.debug("Converter exit code is: " + str(converter_exit_code))
+    converter_exit_code = await convertToPDF(file_path_input, output_location)
+    logger.debug("Converter exit code is: %s", converter_exit_code)
 
     if converter_exit_code != 0:
         await state.clear()
@@ -279,22 +528,16 @@ async def topdf_file_first(callback: types.CallbackQuery, state: FSMContext, i18
         return
 
     if os.path.exists(file_path_output):
-        await callback.message.reply_document(
-            types.FSInputFile(
-                file_path_output, "converted_" + file_name_output_original_pdf
-            )
-        )
-        logger.debug(
-            "File " + file_path_output + " sent to user " + str(callback.from_user.id)
+        sent_message = await reply_with_document(
+            callback.message, file_path_output, file_name_output
         )
+        result_cache.put(file_unique_id, "topdf", "", sent_message.document.file_id, file_name_output)
+        logger.debug("File %s sent to user %s", file_path_output, callback.from_user.id)
         await callback.message.answer(i18n.get("Here is your PDF"), reply_markup=INITIAL_KEYBOARD)
     else:
         await state.clear()
         logger.debug(
-            "Something went wrong with the file "
-            + file_path_output
-            + " to user "
-            + str(callback.from_user.id)
+            "Something went wrong with the file %s to user %s", file_path_output, callback.from_user.id,
         )
         await callback.message.answer(
             i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
@@ -302,7 +545,7 @@ async def topdf_file_first(callback: types.CallbackQuery, state: FSMContext, i18
         return
 
     if os.path.isfile(file_path_output):
-        logger.debug("File " + file_path_output + " removed")
+        logger.debug("File %s removed", file_path_output)
         os.remove(file_path_output)
 
     await state.clear()
@@ -319,37 +562,42 @@ async def compress_file_first(callback: types.CallbackQuery, state: FSMContext,
     data = await state.get_data()
 
     file_path_input = data["file_path_input"]
-    file_id_telegram = data["file_id_telegram"]
+    file_unique_id = data["file_unique_id"]
     original_file_name = data["original_file_name"]
 
     file_name_output_temp = os.path.splitext(original_file_name)
-    file_name_output_original_pdf = file_name_output_temp[0] + ".pdf"
-    temp_file_name_with_id = file_id_telegram + "_" + file_name_output_temp[0] + ".pdf"
+    file_name_output = "compressed_" + file_name_output_temp[0] + ".pdf"
 
-    await callback.message.answer(i18n.get("Please wait"))
+    if await reply_from_result_cache(
+        callback.message, i18n, file_unique_id, "compress", "balanced", file_name_output
+    ):
+        await state.clear()
+        return
 
-    file_path_output = os.path.join(file_output_location, temp_file_name_with_id)
+    wait_message = await callback.message.answer(i18n.get("Please wait"))
 
-    compressor_result = await compressPDF(file_path_input, file_output_location)
-    logger.debug("Compressor result is: " + str(compressor_result))
+    output_location = workspace.output_location(file_path_input)
+    file_path_output = os.path.join(output_location, os.path.basename(file_path_input))
+
+    compressor_result = await job_queue.run(
+        callback.from_user.id,
+        os.path.getsize(file_path_input),
+        lambda: compressPDF(file_path_input, output_location),
+        queue_position_reporter(callback.message, i18n, wait_message),
+    )
+    logger.debug("Compressor result is: %s", compressor_result)
 
     if os.path.exists(file_path_output):
-        await callback.message.reply_document(
-            types.FSInputFile(
-                file_path_output, "compressed_" + file_name_output_original_pdf
-            )
-        )
-        logger.debug(
-            "File " + file_path_output + " sent to user " + str(callback.from_user.id)
+        sent_message = await reply_with_document(
+            callback.message, file_path_output, file_name_output
         )
+        result_cache.put(file_unique_id, "compress", "balanced", sent_message.document.file_id, file_name_output)
+        logger.debug("File %s sent to user %s", file_path_output, callback.from_user.id)
         await callback.message.answer(i18n.get("Here is your PDF"), reply_markup=INITIAL_KEYBOARD)
     else:
         await state.clear()
         logger.debug(
-            "Something went wrong with the file "
-            + file_path_output
-            + " to user "
-            + str(callback.from_user.id)
+            "Something went wrong with the file %s to user %s", file_path_output, callback.from_user.id,
         )
         await callback.message.answer(
             i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
@@ -357,7 +605,7 @@ async def compress_file_first(callback: types.CallbackQuery, state: FSMContext,
         return
 
     if os.path.isfile(file_path_output):
-        logger.debug("File " + file_path_output + " removed")
+        logger.debug("File %s removed", file_path_output)
         os.remove(file_path_output)
 
     await state.clear()
@@ -381,92 +629,24 @@ async def rotate_file_first(callback: types.CallbackQuery, state: FSMContext, i1
     StateFilter(DocumentWithoutCommand.selectOption),
     F.data.contains("merge_file_first"),
 )
-async def merge_file_first_input1(
-    callback: types.CallbackQuery, state: FSMContext, i18n: I18nContext
-) -> None:
-    logger.info("merge_file_first_input1")
-    await state.set_state(MergePDFFileFirst.input_file2)
-
-    await callback.message.answer(i18n.get("Upload your second file"))
-    await state.set_state(MergePDFFileFirst.process)
-
-
-@user_handlers_router.message(StateFilter(MergePDFFileFirst.process), F.document)
-async def merge_file_first_input2(message: types.Message, state: FSMContext, i18n: I18nContext) -> None:
-    logger.info("merge_file_first_input2")
+async def merge_file_first(callback: types.CallbackQuery, state: FSMContext, i18n: I18nContext) -> None:
+    logger.info("merge_file_first")
     data = await state.get_data()
-
-    file_path_input1 = data["file_path_input"]
-    original_file_name1 = data["original_file_name"]
-
-    original_file_name2 = message.document.file_name
-    file_id_telegram2 = message.document.file_id
-    file_name_output_temp2 = os.path.splitext(original_file_name2)
-
-    if file_name_output_temp2[1] != ".pdf":
-        logger.info("File " + original_file_name2 + " is not a PDF")
-        await message.answer(
-            i18n.get("Your response is not a PDF document\nPlease upload a PDF document")
-        )
-        await state.set_state(MergePDFFileFirst.process)
-        return
-
-    await message.answer("Please wait")
-
-    if message.document.file_size / (1024 * 1024) >= 20:
-        logger.debug(original_file_name2 + " is more than 20MB")
-        await message.answer(i18n.get("Your file exceeds 20 MB \n Please try a smaller file"))
-        await state.set_state(MergePDFFileFirst.process)
-        return
-
-    file_path_input2 = await fileDownloader(file_id_telegram2, original_file_name2)
-
-    if not (os.path.exists(file_path_input2)):
-        logger.debug("Something went wrong with the file " + file_path_input2)
-        await state.clear()
-        await message.answer(
-            i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
-        )
-        return
-
-    file_path_output = os.path.join(
-        file_output_location, os.path.basename(file_path_input1)
+    await state.update_data(
+        batch_files=[
+            {
+                "path": data["file_path_input"],
+                "unique_id": data["file_unique_id"],
+                "name": data["original_file_name"],
+            }
+        ]
     )
-
-    merger_exit_code = await mergeTwoPDF(
-        file_path_input1, file_path_input2, file_output_location
+    await callback.message.answer(
+        i18n.get("Upload the rest of your PDF files and press Done when all of them are sent")
     )
-    logger.debug("Merger result is: " + str(merger_exit_code))
+    await state.set_state(MergePDF.collect)
 
-    if os.path.exists(file_path_output):
-        await message.reply_document(
-            types.FSInputFile(file_path_output, "merged_" + original_file_name1)
-        )
-        logger.debug(
-            "File " + file_path_output + " sent to user " + str(message.from_user.id)
-        )
-        await message.answer(i18n.get("Here is your PDF"), reply_markup=INITIAL_KEYBOARD)
-    else:
-        await state.clear()
-        logger.debug(
-            "Something went wrong with the file "
-            + file_path_output
-            + " to user "
-            + str(message.from_user.id)
-        )
-        await message.answer(
-            i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
-        )
-        return
-
-    if os.path.isfile(file_path_output):
-        logger.debug("File " + file_path_output + " removed")
-        os.remove(file_path_output)
 
-    await state.clear()
-
-
-# This is a ToPDF command handler
 @user_handlers_router.message(StateFilter(None), Command("topdf"))
 @user_handlers_router.callback_query(F.data.contains("topdf"))
 async def convert_to_pdf_callback(
@@ -485,8 +665,10 @@ async def compress_pdf_callback(
 ) -> None:
     logger.info("compress_pdf_callback")
     await callback.answer(i18n.get("Compress PDF"))
-    await callback.message.answer(i18n.get("Upload your file"))
-    await state.set_state(CompressPDF.input)
+    await callback.message.answer(
+        i18n.get("Select compression level"), reply_markup=COMPRESS_PROFILE_KEYBOARD
+    )
+    await state.set_state(CompressPDF.selectProfile)
 
 
 @user_handlers_router.message(StateFilter(None), Command("rotate"))
@@ -503,8 +685,11 @@ async def rotate_pdf_callback(callback: types.CallbackQuery, state: FSMContext,
 async def merge_pdf_callback(callback: types.CallbackQuery, state: FSMContext, i18n: I18nContext) -> None:
     logger.info("merge_pdf_callback")
     await callback.answer(i18n.get("Merge your PDFs"))
-    await callback.message.answer(i18n.get("Upload your first file"))
-    await state.set_state(MergePDF.input_file1)
+    await callback.message.answer(
+        i18n.get("Upload your PDF files one by one and press Done when all of them are sent")
+    )
+    await state.update_data(batch_files=[])
+    await state.set_state(MergePDF.collect)
 
 
 @user_handlers_router.message(StateFilter("*"), Command("cancel"))
@@ -512,7 +697,7 @@ async def merge_pdf_callback(callback: types.CallbackQuery, state: FSMContext, i
     StateFilter("*"), or_f(F.data.contains("cancel"), F.text.casefold() == "cancel")
 )
 async def cancel_handler(message: types.Message, state: FSMContext, i18n: I18nContext) -> None:
-    logger.info("cancel_handler from state " + str(state.get_state()))
+    logger.info("cancel_handler from state %s", state.get_state())
     current_state = await state.get_state()
     if current_state is None:
         return
@@ -530,11 +715,12 @@ async def to_pdf_input(message: types.Message, state: FSMContext, i18n: I18nCont
     logger.info("to_pdf_input")
     original_file_name = message.document.file_name
     file_id_telegram = message.document.file_id
+    file_unique_id = message.document.file_unique_id
     file_name_output_temp = os.path.splitext(original_file_name)
-    file_name_output_original_pdf = file_name_output_temp[0] + ".pdf"
+    file_name_output = "converted_" + file_name_output_temp[0] + ".pdf"
     temp_file_name_with_id = file_id_telegram + "_" + file_name_output_temp[0] + ".pdf"
 
-    if file_name_output_temp[1] not in SUPPORTED_FILES_LIST:
+    if not preflight.accepts(original_file_name, message.document.mime_type, SUPPORTED_FILES_LIST):
         logger.debug("Input file is not in the supported file types list")
         await message.answer(
             i18n.get("Your file is in an unsupported format \n Please try another file")
@@ -542,8 +728,8 @@ async def to_pdf_input(message: types.Message, state: FSMContext, i18n: I18nCont
         await state.set_state(ToPDF.input)
         return
 
-    if file_name_output_temp[1] == ".pdf":
-        logger.debug(original_file_name + " is already a PDF")
+    if preflight.is_pdf(original_file_name):
+        logger.debug("%s is already a PDF", original_file_name)
         await message.answer(
             i18n.get("Your file is already in PDF format \n Please try another file")
         )
@@ -551,58 +737,46 @@ async def to_pdf_input(message: types.Message, state: FSMContext, i18n: I18nCont
         return
 
     if message.document.file_size / (1024 * 1024) >= 20:
-        logger.debug(original_file_name + " is more than 20MB")
+        logger.debug("%s is more than 20MB", original_file_name)
         await message.answer(i18n.get("Your file exceeds 20 MB \n Please try a smaller file"))
         await state.set_state(ToPDF.input)
         return
 
-    await message.answer(i18n.get("Please wait"))
+    if await reply_from_result_cache(message, i18n, file_unique_id, "topdf", file_name=file_name_output):
+        await state.clear()
+        return
 
-    file_path_input = await fileDownloader(file_id_telegram, original_file_name)
+    await message.answer(i18n.get("Please wait"))
 
-    if not (os.path.exists(file_path_input)):
-        logger.debug(
-            "Something went wrong with the file "
-            + file_path_input
-            + " to user "
-            + str(message.from_user.id)
-        )
-        await state.clear()
-        await message.answer(
-            i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
-        )
+    file_path_input = await download_document(message, i18n, operation="topdf")
+    if file_path_input is None:
         return
 
-    file_path_output = os.path.join(file_output_location, temp_file_name_with_id)
+    output_location = workspace.output_location(file_path_input, operation="topdf")
+    file_path_output = os.path.join(output_location, temp_file_name_with_id)
 
-    converter_exit_code = await convertToPDF(file_path_input, file_output_location)
-    logger.debug("Converter exit code is " + str(converter_exit_code))
+    converter_exit_code = await convertToPDF(file_path_input, output_location)
+    logger.debug("Converter exit code is %s", converter_exit_code)
 
     if converter_exit_code != 0:
         await state.clear()
-        logger.debug("Converter exit code is: " + str(converter_exit_code))
+        logger.debug("Converter exit code is: %s", converter_exit_code)
         await message.answer(
             i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
         )
         return
 
     if os.path.exists(file_path_output):
-        await message.reply_document(
-            types.FSInputFile(
-                file_path_output, "converted_" + file_name_output_original_pdf
-            )
-        )
-        logger.debug(
-            "File " + file_path_output + " sent to user " + str(message.from_user.id)
+        sent_message = await reply_with_document(
+            message, file_path_output, file_name_output
         )
+        result_cache.put(file_unique_id, "topdf", "", sent_message.document.file_id, file_name_output)
+        logger.debug("File %s sent to user %s", file_path_output, message.from_user.id)
         await message.answer(i18n.get("Here is your PDF"), reply_markup=INITIAL_KEYBOARD)
     else:
         await state.clear()
         logger.debug(
-            "Something went wrong with the file "
-            + file_path_output
-            + " from the user "
-            + str(message.from_user.id)
+            "Something went wrong with the file %s from the user %s", file_path_output, message.from_user.id,
         )
         await message.answer(
             i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
@@ -610,7 +784,7 @@ async def to_pdf_input(message: types.Message, state: FSMContext, i18n: I18nCont
         return
 
     if os.path.isfile(file_path_output):
-        logger.debug("File " + file_path_output + " removed")
+        logger.debug("File %s removed", file_path_output)
         os.remove(file_path_output)
 
     await state.clear()
@@ -624,6 +798,47 @@ async def to_pdf_input_improper(message: types.Message, state: FSMContext, i18n:
     return
 
 
+# Compress - User selected a compression profile
+@user_handlers_router.callback_query(
+    StateFilter(CompressPDF.selectProfile), F.data.startswith("profile_")
+)
+async def compress_profile_callback(
+    callback: types.CallbackQuery, state: FSMContext, i18n: I18nContext
+) -> None:
+    logger.info("compress_profile_callback %s", callback.data)
+    await callback.answer()
+    profile = callback.data.removeprefix("profile_")
+
+    if profile == "target":
+        await callback.message.answer(i18n.get("Send the maximum size of the compressed file in MB"))
+        await state.set_state(CompressPDF.targetSize)
+        return
+
+    if profile not in COMPRESSION_PROFILES:
+        profile = "balanced"
+    await state.update_data(compress_profile=profile, compress_target_size=None)
+    await callback.message.answer(i18n.get("Upload your file"))
+    await state.set_state(CompressPDF.input)
+
+
+# Compress - User sent the size the compressed file has to fit under
+@user_handlers_router.message(StateFilter(CompressPDF.targetSize), F.text)
+async def compress_target_size_input(message: types.Message, state: FSMContext, i18n: I18nContext) -> None:
+    logger.info("compress_target_size_input")
+    try:
+        target_size_mb = float(message.text.replace(",", ".").lower().removesuffix("mb").strip())
+    except ValueError:
+        target_size_mb = 0
+
+    if not 0 < target_size_mb < 20:
+        await message.answer(i18n.get("Please send a number of megabytes less than 20, for example 5"))
+        return
+
+    await state.update_data(compress_profile=None, compress_target_size=target_size_mb)
+    await message.answer(i18n.get("Upload your file"))
+    await state.set_state(CompressPDF.input)
+
+
 # Compress - User sent a proper document
 @user_handlers_router.message(
     StateFilter(CompressPDF.input), CompressPDF.input, F.document
@@ -632,62 +847,75 @@ async def compress_pdf_input(message: types.Message, state: FSMContext, i18n: I1
     logger.info("compress_pdf_input")
     original_file_name = message.document.file_name
     file_id_telegram = message.document.file_id
+    file_unique_id = message.document.file_unique_id
     file_name_output_temp = os.path.splitext(original_file_name)
 
-    if file_name_output_temp[1] != ".pdf":
-        logger.debug(original_file_name + " is already a PDF")
+    if not preflight.accepts(original_file_name, message.document.mime_type, [".pdf"]):
+        logger.debug("%s is already a PDF", original_file_name)
         await message.answer(
             i18n.get("Your response is not a PDF document\nPlease upload a PDF document")
         )
         await state.set_state(CompressPDF.input)
         return
 
-    await message.answer(i18n.get("Please wait"))
+    wait_message = await message.answer(i18n.get("Please wait"))
 
     if message.document.file_size / (1024 * 1024) >= 20:
-        logger.debug(original_file_name + " is more than 20MB")
+        logger.debug("%s is more than 20MB", original_file_name)
         await message.answer(i18n.get("Your file exceeds 20 MB \n Please try a smaller file"))
         await state.set_state(CompressPDF.input)
         return
 
-    file_path_input = await fileDownloader(file_id_telegram, original_file_name)
-    logger.debug("Downloader result is " + file_path_input)
+    data = await state.get_data()
+    target_size_mb = data.get("compress_target_size")
+    profile = data.get("compress_profile") or "balanced"
+    # Every profile and target size gives a different file, so each has its own cache entry
+    if target_size_mb is not None:
+        cache_params = "target_" + format(target_size_mb, "g")
+        target_size = int(target_size_mb * 1024 * 1024)
+    else:
+        cache_params = profile
+        target_size = None
 
-    if not (os.path.exists(file_path_input)):
+    file_name_output = "compressed_" + original_file_name
+    if await reply_from_result_cache(message, i18n, file_unique_id, "compress", cache_params, file_name_output):
         await state.clear()
-        logger.debug(
-            "Something went wrong with the file "
-            + file_path_output
-            + " from the user "
-            + str(message.from_user.id)
-        )
-        await message.answer(
-            i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
-        )
         return
 
-    file_path_output = os.path.join(
-        file_output_location, os.path.basename(file_path_input)
-    )
+    file_path_input = await download_document(message, i18n)
+    if file_path_input is None:
+        return
+    logger.debug("Downloader result is %s", file_path_input)
+
+    output_location = workspace.output_location(file_path_input)
+    file_path_output = os.path.join(output_location, os.path.basename(file_path_input))
 
-    compressor_result = await compressPDF(file_path_input, file_output_location)
-    logger.debug("Compressor result is " + compressor_result)
+    compressor_result = await job_queue.run(
+        message.from_user.id,
+        message.document.file_size,
+        lambda: compressPDF(file_path_input, output_location, profile, target_size),
+        queue_position_reporter(message, i18n, wait_message),
+    )
+    logger.debug("Compressor result is %s", compressor_result)
 
     if os.path.exists(file_path_output):
-        await message.reply_document(
-            types.FSInputFile(file_path_output, "compressed_" + original_file_name)
-        )
-        logger.debug(
-            "File " + file_path_output + " sent to user " + str(message.from_user.id)
+        sent_message = await reply_with_document(
+            message, file_path_output, file_name_output
         )
+        result_cache.put(file_unique_id, "compress", cache_params, sent_message.document.file_id, file_name_output)
+        logger.debug("File %s sent to user %s", file_path_output, message.from_user.id)
+        if target_size is not None and os.path.getsize(file_path_output) > target_size:
+            await message.answer(
+                i18n.get(
+                    "It was not possible to fit the file under {size} MB, this is the smallest version",
+                    size=format(target_size_mb, "g"),
+                )
+            )
         await message.answer(i18n.get("Here is your PDF"), reply_markup=INITIAL_KEYBOARD)
     else:
         await state.clear()
         logger.debug(
-            "Something went wrong with the file "
-            + file_path_output
-            + " from the user "
-            + str(message.from_user.id)
+            "Something went wrong with the file %s from the user %s", file_path_output, message.from_user.id,
         )
         await message.answer(
             i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
@@ -695,7 +923,7 @@ async def compress_pdf_input(message: types.Message, state: FSMContext, i18n: I1
         return
 
     if os.path.isfile(file_path_output):
-        logger.debug("File " + file_path_output + " removed")
+        logger.debug("File %s removed", file_path_output)
         os.remove(file_path_output)
 
     await state.clear()
@@ -717,10 +945,11 @@ async def rotate_pdf_input(message: types.Message, state: FSMContext, i18n: I18n
     logger.info("rotate_pdf_input")
     original_file_name = message.document.file_name
     file_id_telegram = message.document.file_id
+    file_unique_id = message.document.file_unique_id
     file_name_output_temp = os.path.splitext(original_file_name)
 
-    if file_name_output_temp[1] != ".pdf":
-        logger.info("File " + original_file_name + " is not a PDF")
+    if not preflight.accepts(original_file_name, message.document.mime_type, [".pdf"]):
+        logger.info("File %s is not a PDF", original_file_name)
         await message.answer(
             i18n.get("Your response is not a PDF document\nPlease upload a PDF document")
         )
@@ -730,28 +959,18 @@ async def rotate_pdf_input(message: types.Message, state: FSMContext, i18n: I18n
     await message.answer(i18n.get("Please wait"))
 
     if message.document.file_size / (1024 * 1024) >= 20:
-        logger.debug(original_file_name + " is more than 20MB")
+        logger.debug("%s is more than 20MB", original_file_name)
         await message.answer(i18n.get("Your file exceeds 20 MB \n Please try a smaller file"))
         await state.set_state(Rotate.input)
         return
 
-    file_path_input = await fileDownloader(file_id_telegram, original_file_name)
-    logger.debug("Downloader result is: " + str(file_path_input))
-
-    if not (os.path.exists(file_path_input)):
-        logger.debug(
-            "Something went wrong with the file "
-            + file_path_input
-            + " to user "
-            + str(message.from_user.id)
-        )
-        await state.clear()
-        await message.answer(
-            i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
-        )
+    file_path_input = await download_document(message, i18n)
+    if file_path_input is None:
         return
+    logger.debug("Downloader result is: %s", file_path_input)
 
     await state.update_data(file_path_input=file_path_input)
+    await state.update_data(file_unique_id=file_unique_id)
     await state.update_data(original_file_name=original_file_name)
 
     await message.answer(
@@ -781,35 +1000,53 @@ async def rotate_pdf_right90_callback(
     file_path_input = data["file_path_input"]
     original_file_name = data["original_file_name"]
 
-    file_name_output_temp = os.path.splitext(original_file_name)
-
-    if file_name_output_temp[1] != ".pdf":
-        logger.info("File " + original_file_name + " is not a PDF")
+    if not preflight.is_pdf(original_file_name):
+        logger.info("File %s is not a PDF", original_file_name)
         await data.answer(i18n.get("Your response is not a PDF document\nPlease upload a PDF document"))
         await state.set_state(Rotate.input)
         return
 
-    file_path_output = os.path.join(
-        file_output_location, os.path.basename(file_path_input)
-    )
+    # The file may have been cleaned up if the session was left alone for too long
+    if not os.path.exists(file_path_input):
+        await state.clear()
+        await callback.message.answer(
+            i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
+        )
+        return
+
+    pages = data.get("rotate_pages")
+    cache_params = 90 if pages is None else "90:" + pages
+
+    file_name_output = "rotated_" + original_file_name
+    if await reply_from_result_cache(
+        callback.message, i18n, data["file_unique_id"], "rotate", cache_params, file_name_output
+    ):
+        await state.clear()
+        return
 
-    rotator_result = await rotatePDF(file_path_input, file_output_location, 90)
-    logger.debug("Rotator result is: " + str(rotator_result))
+    output_location = workspace.output_location(file_path_input)
+    file_path_output = os.path.join(output_location, os.path.basename(file_path_input))
+
+    rotator_result = await job_queue.run(
+        callback.from_user.id,
+        os.path.getsize(file_path_input),
+        lambda: rotatePDF(file_path_input, output_location, 90, pages),
+        queue_position_reporter(callback.message, i18n),
+    )
+    logger.debug("Rotator result is: %s", rotator_result)
 
     if os.path.exists(file_path_output) and os.path.getsize(file_path_input) > 0:
-        logger.debug(
-            "File " + file_path_output + " sent to user " + str(callback.from_user.id)
+        logger.debug("File %s sent to user %s", file_path_output, callback.from_user.id)
+        sent_message = await reply_with_document(
+            callback.message, file_path_output, file_name_output
         )
-        await callback.message.reply_document(
-            types.FSInputFile(file_path_output, "rotated_" + original_file_name)
+        result_cache.put(
+            data["file_unique_id"], "rotate", cache_params, sent_message.document.file_id, file_name_output
         )
         await callback.message.reply("Here is your PDF", reply_markup=INITIAL_KEYBOARD)
     else:
         logger.debug(
-            "Something went wrong with the file "
-            + file_path_output
-            + " to user "
-            + str(callback.from_user.id)
+            "Something went wrong with the file %s to user %s", file_path_output, callback.from_user.id,
         )
         await state.clear()
         await callback.message.answer(
@@ -818,7 +1055,7 @@ async def rotate_pdf_right90_callback(
         return
 
     if os.path.isfile(file_path_output):
-        logger.debug("File " + file_path_output + " removed")
+        logger.debug("File %s removed", file_path_output)
         os.remove(file_path_output)
 
     await state.clear()
@@ -835,35 +1072,53 @@ async def rotate_pdf_left90_callback(
     file_path_input = data["file_path_input"]
     original_file_name = data["original_file_name"]
 
-    file_name_output_temp = os.path.splitext(original_file_name)
-
-    if file_name_output_temp[1] != ".pdf":
-        logger.info("File " + original_file_name + " is not a PDF")
+    if not preflight.is_pdf(original_file_name):
+        logger.info("File %s is not a PDF", original_file_name)
         await data.answer(i18n.get("Your response is not a PDF document\nPlease upload a PDF document"))
         await state.set_state(Rotate.input)
         return
 
-    file_path_output = os.path.join(
-        file_output_location, os.path.basename(file_path_input)
-    )
+    # The file may have been cleaned up if the session was left alone for too long
+    if not os.path.exists(file_path_input):
+        await state.clear()
+        await callback.message.answer(
+            i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
+        )
+        return
+
+    pages = data.get("rotate_pages")
+    cache_params = 270 if pages is None else "270:" + pages
+
+    file_name_output = "rotated_" + original_file_name
+    if await reply_from_result_cache(
+        callback.message, i18n, data["file_unique_id"], "rotate", cache_params, file_name_output
+    ):
+        await state.clear()
+        return
+
+    output_location = workspace.output_location(file_path_input)
+    file_path_output = os.path.join(output_location, os.path.basename(file_path_input))
 
-    rotator_result = await rotatePDF(file_path_input, file_output_location, 270)
-    logger.debug("Rotator result is: " + str(rotator_result))
+    rotator_result = await job_queue.run(
+        callback.from_user.id,
+        os.path.getsize(file_path_input),
+        lambda: rotatePDF(file_path_input, output_location, 270, pages),
+        queue_position_reporter(callback.message, i18n),
+    )
+    logger.debug("Rotator result is: %s", rotator_result)
 
     if os.path.exists(file_path_output) and os.path.getsize(file_path_input) > 0:
-        logger.debug(
-            "File " + file_path_output + " sent to user " + str(callback.from_user.id)
+        logger.debug("File %s sent to user %s", file_path_output, callback.from_user.id)
+        sent_message = await reply_with_document(
+            callback.message, file_path_output, file_name_output
         )
-        await callback.message.reply_document(
-            types.FSInputFile(file_path_output, "rotated_" + original_file_name)
+        result_cache.put(
+            data["file_unique_id"], "rotate", cache_params, sent_message.document.file_id, file_name_output
         )
         await callback.message.reply("Here is your PDF", reply_markup=INITIAL_KEYBOARD)
     else:
         logger.debug(
-            "Something went wrong with the file "
-            + file_path_output
-            + " to user "
-            + str(callback.from_user.id)
+            "Something went wrong with the file %s to user %s", file_path_output, callback.from_user.id,
         )
         await state.clear()
         await callback.message.answer(
@@ -872,7 +1127,7 @@ async def rotate_pdf_left90_callback(
         return
 
     if os.path.isfile(file_path_output):
-        logger.debug("File " + file_path_output + " removed")
+        logger.debug("File %s removed", file_path_output)
         os.remove(file_path_output)
 
     await state.clear()
@@ -889,35 +1144,53 @@ async def rotate_pdf_right180_callback(
     file_path_input = data["file_path_input"]
     original_file_name = data["original_file_name"]
 
-    file_name_output_temp = os.path.splitext(original_file_name)
-
-    if file_name_output_temp[1] != ".pdf":
-        logger.info("File " + original_file_name + " is not a PDF")
+    if not preflight.is_pdf(original_file_name):
+        logger.info("File %s is not a PDF", original_file_name)
         await data.answer(i18n.get("Your response is not a PDF document\nPlease upload a PDF document"))
         await state.set_state(Rotate.input)
         return
 
-    file_path_output = os.path.join(
-        file_output_location, os.path.basename(file_path_input)
-    )
+    # The file may have been cleaned up if the session was left alone for too long
+    if not os.path.exists(file_path_input):
+        await state.clear()
+        await callback.message.answer(
+            i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
+        )
+        return
 
-    rotator_result = await rotatePDF(file_path_input, file_output_location, 180)
-    logger.debug("Rotator result is: " + str(rotator_result))
+    pages = data.get("rotate_pages")
+    cache_params = 180 if pages is None else "180:" + pages
+
+    file_name_output = "rotated_" + original_file_name
+    if await reply_from_result_cache(
+        callback.message, i18n, data["file_unique_id"], "rotate", cache_params, file_name_output
+    ):
+        await state.clear()
+        return
+
+    output_location = workspace.output_location(file_path_input)
+    file_path_output = os.path.join(output_location, os.path.basename(file_path_input))
+
+    rotator_result = await job_queue.run(
+        callback.from_user.id,
+        os.path.getsize(file_path_input),
+        lambda: rotatePDF(file_path_input, output_location, 180, pages),
+        queue_position_reporter(callback.message, i18n),
+    )
+    logger.debug("Rotator result is: %s", rotator_result)
 
     if os.path.exists(file_path_output) and os.path.getsize(file_path_input) > 0:
-        logger.debug(
-            "File " + file_path_output + " sent to user " + str(callback.from_user.id)
+        logger.debug("File %s sent to user %s", file_path_output, callback.from_user.id)
+        sent_message = await reply_with_document(
+            callback.message, file_path_output, file_name_output
         )
-        await callback.message.reply_document(
-            types.FSInputFile(file_path_output, "rotated_" + original_file_name)
+        result_cache.put(
+            data["file_unique_id"], "rotate", cache_params, sent_message.document.file_id, file_name_output
         )
         await callback.message.reply("Here is your PDF", reply_markup=INITIAL_KEYBOARD)
     else:
         logger.debug(
-            "Something went wrong with the file "
-            + file_path_output
-            + " to user "
-            + str(callback.from_user.id)
+            "Something went wrong with the file %s to user %s", file_path_output, callback.from_user.id,
         )
         await state.clear()
         await callback.message.answer(
@@ -926,12 +1199,39 @@ async def rotate_pdf_right180_callback(
         return
 
     if os.path.isfile(file_path_output):
-        logger.debug("File " + file_path_output + " removed")
+        logger.debug("File %s removed", file_path_output)
         os.remove(file_path_output)
 
     await state.clear()
 
 
+# Rotate PDF - User wants to rotate only some of the pages
+@user_handlers_router.callback_query(StateFilter(Rotate.selectOption), F.data == "pick_pages")
+async def rotate_pdf_pick_pages(callback: types.CallbackQuery, state: FSMContext, i18n: I18nContext) -> None:
+    logger.info("rotate_pdf_pick_pages")
+    await callback.answer()
+    await callback.message.answer(i18n.get("Send the pages to rotate, for example 3-5 or 1,4,7"))
+    await state.set_state(Rotate.selectPages)
+
+
+# Rotate PDF - User sent the pages to rotate
+@user_handlers_router.message(StateFilter(Rotate.selectPages), F.text)
+async def rotate_pdf_pages_input(message: types.Message, state: FSMContext, i18n: I18nContext) -> None:
+    logger.info("rotate_pdf_pages_input")
+    pages = parse_page_ranges(message.text)
+
+    if pages is None:
+        await message.answer(i18n.get("Send the pages to rotate, for example 3-5 or 1,4,7"))
+        return
+
+    await state.update_data(rotate_pages=pages)
+    await message.answer(
+        i18n.get("Select how you want to rotate pages {pages}", pages=pages),
+        reply_markup=ROTATE_ANGLE_KEYBOARD,
+    )
+    await state.set_state(Rotate.selectOption)
+
+
 @user_handlers_router.message(StateFilter(Rotate.selectOption), Rotate.selectOption)
 async def rotate_pdf_option(message: types.Message, state: FSMContext, i18n: I18nContext) -> None:
     logger.info("rotate_pdf_option")
@@ -941,141 +1241,217 @@ async def rotate_pdf_option(message: types.Message, state: FSMContext, i18n: I18
     return
 
 
-# Merge PDF - Input1 - User sent a proper document
+# Merge PDF - User sent several documents as an album
 @user_handlers_router.message(
-    StateFilter(MergePDF.input_file1), MergePDF.input_file1, F.document
+    StateFilter(MergePDF.collect), F.media_group_id, F.document, flags={"album": True}
 )
-async def merge_pdf_input1(message: types.Message, state: FSMContext, i18n: I18nContext) -> None:
-    logger.info("merge_pdf_input1")
+async def merge_pdf_album(
+    message: types.Message, state: FSMContext, i18n: I18nContext, album: list[types.Message] | None = None
+) -> None:
+    album = album or [message]
+    logger.info("merge_pdf_album of %s documents", len(album))
+    data = await state.get_data()
+    free_slots = merge_max_files - len(data.get("batch_files", []))
+    if free_slots <= 0:
+        await message.answer(
+            i18n.get("You can combine up to {count} files, press Done to combine them", count=merge_max_files),
+            reply_markup=MERGE_DONE_KEYBOARD,
+        )
+        return
+
+    downloaded_files = await download_album(message, i18n, album[:free_slots], pdf_only=True)
+
+    data = await state.get_data()
+    batch_files = data.get("batch_files", []) + downloaded_files
+    await state.update_data(batch_files=batch_files)
+    await message.answer(
+        i18n.get("File {count} added. Send the next one or press Done", count=len(batch_files)),
+        reply_markup=MERGE_DONE_KEYBOARD,
+    )
+
+
+# Merge PDF - User sent one more document
+@user_handlers_router.message(StateFilter(MergePDF.collect), MergePDF.collect, F.document)
+async def merge_pdf_input(message: types.Message, state: FSMContext, i18n: I18nContext) -> None:
+    logger.info("merge_pdf_input")
     original_file_name = message.document.file_name
     file_id_telegram = message.document.file_id
+    file_unique_id = message.document.file_unique_id
     file_name_output_temp = os.path.splitext(original_file_name)
 
-    if file_name_output_temp[1] != ".pdf":
-        logger.info("File " + original_file_name + " is not a PDF")
+    if not preflight.accepts(original_file_name, message.document.mime_type, [".pdf"]):
+        logger.info("File %s is not a PDF", original_file_name)
         await message.answer(
             i18n.get("Your response is not a PDF document\nPlease upload a PDF document")
         )
-        await state.set_state(MergePDF.input_file1)
         return
 
     if message.document.file_size / (1024 * 1024) >= 20:
-        logger.debug(original_file_name + " is more than 20MB")
+        logger.debug("%s is more than 20MB", original_file_name)
         await message.answer(i18n.get("Your file exceeds 20 MB \n Please try a smaller file"))
-        await state.set_state(MergePDF.input_file1)
         return
 
-    file_path_input = await fileDownloader(file_id_telegram, original_file_name)
-    logger.debug("Downloader result is: " + str(file_path_input))
-
-    if not (os.path.exists(file_path_input)):
-        logger.debug("Something went wrong with the file " + file_path_input)
-        await state.clear()
+    data = await state.get_data()
+    if len(data.get("batch_files", [])) >= merge_max_files:
         await message.answer(
-            i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
+            i18n.get("You can combine up to {count} files, press Done to combine them", count=merge_max_files),
+            reply_markup=MERGE_DONE_KEYBOARD,
         )
         return
 
-    await state.update_data(file_path_input1=file_path_input)
-    await state.update_data(original_file_name1=original_file_name)
-    await message.answer(i18n.get("Upload your second file"))
-    await state.set_state(MergePDF.input_file2)
+    file_path_input = await download_document(message, i18n, reply_markup=MERGE_DONE_KEYBOARD)
+    if file_path_input is None:
+        return
+    logger.debug("Downloader result is: %s", file_path_input)
+
+    # Read again after the download, other files of the session may have been added meanwhile
+    data = await state.get_data()
+    batch_files = data.get("batch_files", []) + [
+        {"path": file_path_input, "unique_id": file_unique_id, "name": original_file_name}
+    ]
+    await state.update_data(batch_files=batch_files)
+    await message.answer(
+        i18n.get("File {count} added. Send the next one or press Done", count=len(batch_files)),
+        reply_markup=MERGE_DONE_KEYBOARD,
+    )
 
 
-# Merge PDF - Input1 - User sent an improper document
-@user_handlers_router.message(StateFilter(MergePDF.input_file1), MergePDF.input_file1)
-async def merge_pdf_input1_improper(message: types.Message, state: FSMContext, i18n: I18nContext) -> None:
-    logger.info("merge_pdf_Input1_Improper")
+# Merge PDF - User sent an improper document
+@user_handlers_router.message(StateFilter(MergePDF.collect), MergePDF.collect)
+async def merge_pdf_input_improper(message: types.Message, state: FSMContext, i18n: I18nContext) -> None:
+    logger.info("merge_pdf_input_improper")
     await message.answer(
-        i18n.get("Your response is not a PDF document\nPlease upload a PDF document")
+        i18n.get("Your response is not a PDF document \n Please upload a PDF document"),
+        reply_markup=MERGE_DONE_KEYBOARD,
     )
     return
 
 
-# Merge PDF - Input2 - User sent a proper document
-@user_handlers_router.message(
-    StateFilter(MergePDF.input_file2), MergePDF.input_file2, F.document
+# Merge PDF - User has sent all the files
+@user_handlers_router.callback_query(
+    StateFilter(MergePDF.collect, DocumentAlbum.selectOption), F.data == "combine_files"
 )
-async def merge_pdf_input2(message: types.Message, state: FSMContext, i18n: I18nContext) -> None:
-    logger.info("merge_pdf_input2")
+async def merge_pdf_done(callback: types.CallbackQuery, state: FSMContext, i18n: I18nContext) -> None:
+    logger.info("merge_pdf_done")
+    await callback.answer()
+    message = callback.message
     data = await state.get_data()
+    batch_files = data.get("batch_files", [])
 
-    file_path_input1 = data["file_path_input1"]
-    original_file_name1 = data["original_file_name1"]
+    if len(batch_files) < 2:
+        await message.answer(i18n.get("Upload at least two PDF files to combine"))
+        return
 
-    original_file_name2 = message.document.file_name
-    file_id_telegram2 = message.document.file_id
-    file_name_output_temp2 = os.path.splitext(original_file_name2)
+    merge_key = "+".join(batch_file["unique_id"] for batch_file in batch_files)
+    input_items = [batch_file["path"] for batch_file in batch_files]
 
-    if file_name_output_temp2[1] != ".pdf":
-        logger.info("File " + original_file_name2 + " is not a PDF")
+    file_name_output = "merged_" + batch_files[0]["name"]
+
+    if await reply_from_result_cache(message, i18n, merge_key, "merge", file_name=file_name_output):
+        await state.clear()
+        return
+
+    if not all(os.path.exists(input_item) for input_item in input_items):
+        logger.debug("Some of the files to merge are gone for user %s", callback.from_user.id)
+        await state.clear()
         await message.answer(
-            i18n.get("Your response is not a PDF document\nPlease upload a PDF document")
+            i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
         )
-        await state.set_state(MergePDF.input_file2)
         return
 
-    await message.answer(i18n.get("Please wait"))
+    wait_message = await message.answer(i18n.get("Please wait"))
 
-    if message.document.file_size / (1024 * 1024) >= 20:
-        logger.debug(original_file_name2 + " is more than 20MB")
-        await message.answer(i18n.get("Your file exceeds 20 MB \n Please try a smaller file"))
-        await state.set_state(MergePDF.input_file2)
+    output_location = workspace.output_location(*input_items)
+    file_path_output = os.path.join(output_location, os.path.basename(input_items[0]))
+
+    merger_result = await job_queue.run(
+        callback.from_user.id,
+        sum(os.path.getsize(input_item) for input_item in input_items),
+        lambda: mergePDF(input_items, output_location),
+        queue_position_reporter(message, i18n, wait_message),
+    )
+    logger.debug("Merger result is: %s", merger_result)
+
+    if os.path.exists(file_path_output):
+        logger.debug("File %s sent to user %s", file_path_output, callback.from_user.id)
+        sent_message = await reply_with_document(
+            message, file_path_output, file_name_output
+        )
+        result_cache.put(merge_key, "merge", "", sent_message.document.file_id, file_name_output)
+        await message.answer(i18n.get("Here is your PDF"), reply_markup=INITIAL_KEYBOARD)
+    else:
+        logger.debug(
+            "Something went wrong with the file %s to user %s", file_path_output, callback.from_user.id,
+        )
+        await state.clear()
+        await message.answer(
+            i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
+        )
         return
 
-    file_path_input2 = await fileDownloader(file_id_telegram2, original_file_name2)
-    logger.debug("Downloader result is: " + str(file_path_input2))
+    if os.path.isfile(file_path_output):
+        logger.debug("File %s removed", file_path_output)
+        os.remove(file_path_output)
+
+    await state.clear()
+
+
+# Album - User wants all the files in one ZIP file
+@user_handlers_router.callback_query(StateFilter(DocumentAlbum.selectOption), F.data == "pack_zip")
+async def album_zip(callback: types.CallbackQuery, state: FSMContext, i18n: I18nContext) -> None:
+    logger.info("album_zip")
+    await callback.answer()
+    message = callback.message
+    data = await state.get_data()
+    batch_files = data.get("batch_files", [])
+    zip_key = "+".join(batch_file["unique_id"] for batch_file in batch_files)
+    # The archive holds the files under the names they were sent with
+    zip_names = "/".join(batch_file["name"] for batch_file in batch_files)
+    input_items = [batch_file["path"] for batch_file in batch_files]
 
-    if not (os.path.exists(file_path_input2)):
-        logger.debug("Something went wrong with the file " + file_path_output)
+    if await reply_from_result_cache(message, i18n, zip_key, "zip", zip_names):
+        await state.clear()
+        return
+
+    if not batch_files or not all(os.path.exists(input_item) for input_item in input_items):
+        logger.debug("Some of the files to pack are gone for user %s", callback.from_user.id)
         await state.clear()
         await message.answer(
             i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
         )
         return
 
+    wait_message = await message.answer(i18n.get("Please wait"))
+
     file_path_output = os.path.join(
-        file_output_location, os.path.basename(file_path_input1)
+        workspace.output_location(*input_items),
+        str(callback.from_user.id) + "_" + batch_files[0]["unique_id"] + ".zip",
     )
 
-    merger_exit_code = await mergeTwoPDF(
-        file_path_input1, file_path_input2, file_output_location
+    await job_queue.run(
+        callback.from_user.id,
+        sum(os.path.getsize(input_item) for input_item in input_items),
+        lambda: zipFiles(input_items, [batch_file["name"] for batch_file in batch_files], file_path_output),
+        queue_position_reporter(message, i18n, wait_message),
     )
-    logger.debug("Merger result is: " + str(merger_exit_code))
 
     if os.path.exists(file_path_output):
-        logger.debug(
-            "File " + file_path_output + " sent to user " + str(message.from_user.id)
-        )
-        await message.reply_document(
-            types.FSInputFile(file_path_output, "merged_" + original_file_name1)
-        )
-        await message.answer(i18n.get("Here is your PDF"), reply_markup=INITIAL_KEYBOARD)
+        sent_message = await reply_with_document(message, file_path_output, "files.zip")
+        result_cache.put(zip_key, "zip", zip_names, sent_message.document.file_id)
+        logger.debug("File %s sent to user %s", file_path_output, callback.from_user.id)
+        await message.answer(i18n.get("Here are your files"), reply_markup=INITIAL_KEYBOARD)
     else:
+        await state.clear()
         logger.debug(
-            "Something went wrong with the file "
-            + file_path_output
-            + " to user "
-            + str(message.from_user.id)
+            "Something went wrong with the file %s to user %s", file_path_output, callback.from_user.id,
         )
-        await state.clear()
         await message.answer(
             i18n.get("Something went wrong \n Please try again"), reply_markup=INITIAL_KEYBOARD
         )
         return
 
     if os.path.isfile(file_path_output):
-        logger.debug("File " + file_path_output + " removed")
+        logger.debug("File %s removed", file_path_output)
         os.remove(file_path_output)
 
     await state.clear()
-
-
-# Merge PDF - Input2 - User sent an improper document
-@user_handlers_router.message(StateFilter(MergePDF.input_file2), MergePDF.input_file2)
-async def merge_pdf_input2_improper(message: types.Message, state: FSMContext, i18n: I18nContext) -> None:
-    logger.info("merge_pdf_input2_Improper")
-    await message.answer(
-        i18n.get("Your response is not a PDF document \n Please upload a PDF document")
-    )
-    return
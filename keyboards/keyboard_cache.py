@@ -0,0 +1,62 @@
+import logging
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram_i18n import I18nContext, LazyProxy
+
+logger = logging.getLogger(__name__)
+
+# Keyboards are built at import time with LazyProxy labels, which are resolved through the catalog
+# on every send. The module-level keyboards registered here under a name are rendered once per
+# locale when the bot starts, and the requests carry the one for the locale of the update instead.
+# Keyboards built per message are sent as they are.
+_keyboards: dict[str, InlineKeyboardMarkup] = {}
+_rendered: dict[tuple[str, str], InlineKeyboardMarkup] = {}
+
+
+def register(**markups: InlineKeyboardMarkup) -> None:
+    _keyboards.update(markups)
+
+
+def _render(markup, core, locale) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(
+                text=core.get(button.text.key, locale, **button.text.kwargs)
+                if isinstance(button.text, LazyProxy) else button.text,
+                callback_data=button.callback_data,
+            )
+            for button in row
+        ]
+        for row in markup.inline_keyboard
+    ])
+
+
+def build(core) -> None:
+    _rendered.clear()
+    for locale in core.available_locales:
+        for name, markup in _keyboards.items():
+            _rendered[(locale, name)] = _render(markup, core, locale)
+    logger.info("Rendered %s keyboards for locales %s", len(_keyboards), ", ".join(core.available_locales))
+
+
+def localized(name, locale) -> InlineKeyboardMarkup:
+    return _rendered.get((locale, name), _keyboards[name])
+
+
+def _registered_name(markup) -> str | None:
+    for name, registered in _keyboards.items():
+        if registered is markup:
+            return name
+    return None
+
+
+# Swaps a registered keyboard in an outgoing request for the one rendered in the user's locale
+class LocalizedKeyboards(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        reply_markup = getattr(method, "reply_markup", None)
+        i18n = I18nContext.get_current()
+        if reply_markup is not None and i18n is not None:
+            name = _registered_name(reply_markup)
+            if name is not None:
+                method.reply_markup = _rendered.get((i18n.locale, name), reply_markup)
+        return await make_request(bot, method)
@@ -1,26 +1,66 @@
 import os
+from pathlib import Path
+from babel.messages.pofile import read_po
+from aiogram_i18n.cores.gnu_text_core import GNUTextCore
 from aiogram_i18n.managers import BaseManager
 from aiogram.types.user import User
 import logging
 
+from storages.locale_store import locale_store
+
 logger = logging.getLogger(__name__)
 
-userLang: dict[int, str] = {}
+
+# Messages without parameters, which are most of them, are rendered for every locale when the
+# catalogs are loaded, so i18n.get and the LazyProxy labels are a dictionary lookup instead of
+# gettext and str.format on each call
+class PrecompiledGNUTextCore(GNUTextCore):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.rendered: dict[str, dict[str, str]] = {}
+
+    # The compiled catalogs can not list their msgids, so they are read from the .pot template and the
+    # .po sources next to them. A message missing from one catalog (en has only the ones with
+    # parameters) is still rendered for that locale, through gettext like any other.
+    async def startup(self) -> None:
+        await super().startup()
+        messages = set()
+        for source in Path(self.path).glob("**/*.po*"):
+            with source.open("rb") as file:
+                messages.update(
+                    message.id for message in read_po(file) if isinstance(message.id, str) and message.id
+                )
+        self.rendered = {
+            locale: {message: GNUTextCore.get(self, message, locale) for message in messages}
+            for locale in self.locales
+        }
+
+    async def shutdown(self) -> None:
+        self.rendered = {}
+        await super().shutdown()
+
+    def get(self, message, locale=None, /, **kwargs) -> str:
+        if not kwargs:
+            rendered = self.rendered.get(self.get_locale(locale), {}).get(message)
+            if rendered is not None:
+                return rendered
+        return super().get(message, locale, **kwargs)
+
 
 class UserManager(BaseManager):
     async def get_locale(self, event_from_user: User) -> str:
         default = self.default_locale
         if event_from_user.id is not None:
-            if event_from_user.id in userLang:
-                logger.debug("There is a saved user locale " + str(userLang[event_from_user.id]) + " for the user " + str(event_from_user.id))
-                return userLang[event_from_user.id]
-            logger.debug("There is no saved user locale for the user " + str(event_from_user.id))
+            locale = await locale_store.get_locale(event_from_user.id)
+            if locale is not None:
+                logger.debug("There is a saved user locale %s for the user %s", locale, event_from_user.id)
+                return locale
+            logger.debug("There is no saved user locale for the user %s", event_from_user.id)
         return default
 
 
     async def set_locale(self, locale: str, event_from_user: User) -> None:
         userID = event_from_user.id 
-        userLang[userID] = locale
-        logger.debug("Added new locale " + locale + " for the user" + str(userID))
+        await locale_store.set_locale(userID, locale)
+        logger.debug("Added new locale %s for the user%s", locale, userID)
         return
-
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import os
+import time
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import Message
+from dotenv import find_dotenv, load_dotenv
+
+from storages import database
+
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger(__name__)
+
+MEDIA_GROUP_WAIT = float(os.getenv("MEDIA_GROUP_WAIT", 0.6))
+
+
+# Telegram delivers every file of an album as a separate update. For handlers flagged with
+# flags={"album": True} the parts sharing a media_group_id are collected and the handler is called
+# once, with all of them in the "album" argument. Other handlers keep getting one message at a time.
+# With shared=True the parts are collected in the database, for webhook workers that each get some
+# of them.
+class MediaGroupMiddleware(BaseMiddleware):
+    def __init__(self, wait=MEDIA_GROUP_WAIT, shared=database.MULTI_PROCESS, connection=None) -> None:
+        self.wait = wait
+        self.shared = shared
+        self._connection = connection
+        self._table_ready = False
+        self._groups: dict[str, list[Message]] = {}
+        self._last_seen: dict[str, float] = {}
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = database.get_connection()
+        if not self._table_ready:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS media_groups (media_group_id TEXT PRIMARY KEY, last_seen REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS media_group_parts ("
+                "media_group_id TEXT NOT NULL, message_id INTEGER NOT NULL, message TEXT NOT NULL, "
+                "PRIMARY KEY (media_group_id, message_id))"
+            )
+            self._table_ready = True
+        return self._connection
+
+    async def __call__(self, handler, event: Message, data: dict):
+        if event.media_group_id is None or not get_flag(data, "album"):
+            return await handler(event, data)
+
+        if self.shared:
+            group = await self._collect_shared(event, data.get("bot"))
+        else:
+            group = await self._collect(event)
+        if group is None:
+            return None
+
+        logger.debug("Collected %s messages of media group %s", len(group), event.media_group_id)
+        data["album"] = sorted(group, key=lambda message: message.message_id)
+        return await handler(event, data)
+
+    async def _collect(self, event: Message) -> list[Message] | None:
+        loop = asyncio.get_running_loop()
+        group = self._groups.get(event.media_group_id)
+        if group is not None:
+            group.append(event)
+            self._last_seen[event.media_group_id] = loop.time()
+            return None
+
+        group = self._groups[event.media_group_id] = [event]
+        self._last_seen[event.media_group_id] = loop.time()
+        # The parts arrive right after each other, so the album is complete once none came for a while
+        while (delay := self._last_seen[event.media_group_id] + self.wait - loop.time()) > 0:
+            await asyncio.sleep(delay)
+        del self._groups[event.media_group_id]
+        del self._last_seen[event.media_group_id]
+        return group
+
+    # Every part waits for the album to go quiet, then tries to claim it. Only the claim made with the
+    # latest last_seen succeeds, and that one takes all the parts.
+    async def _collect_shared(self, event: Message, bot) -> list[Message] | None:
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        connection.execute(
+            "INSERT OR REPLACE INTO media_group_parts (media_group_id, message_id, message) VALUES (?, ?, ?)",
+            (event.media_group_id, event.message_id, event.model_dump_json(exclude_none=True)),
+        )
+        connection.execute(
+            "INSERT INTO media_groups (media_group_id, last_seen) VALUES (?, ?) "
+            "ON CONFLICT(media_group_id) DO UPDATE SET last_seen = excluded.last_seen",
+            (event.media_group_id, time.time()),
+        )
+        connection.execute("COMMIT")
+
+        while True:
+            row = connection.execute(
+                "SELECT last_seen FROM media_groups WHERE media_group_id = ?", (event.media_group_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            delay = row[0] + self.wait - time.time()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+
+        connection.execute("BEGIN IMMEDIATE")
+        claimed = connection.execute(
+            "DELETE FROM media_groups WHERE media_group_id = ? AND last_seen = ?", (event.media_group_id, row[0])
+        ).rowcount
+        parts = []
+        if claimed:
+            parts = connection.execute(
+                "SELECT message FROM media_group_parts WHERE media_group_id = ?", (event.media_group_id,)
+            ).fetchall()
+            connection.execute("DELETE FROM media_group_parts WHERE media_group_id = ?", (event.media_group_id,))
+        connection.execute("COMMIT")
+        if not claimed:
+            return None
+        return [Message.model_validate_json(part[0], context={"bot": bot}) for part in parts]
@@ -0,0 +1,25 @@
+import logging
+import time
+from aiogram import BaseMiddleware
+
+from common.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+UPDATE_SECONDS = Histogram("bot_update_handling_seconds", "Time spent handling an update, per handler")
+
+
+# Registered as an inner middleware on the dispatcher, so it runs for the handler that matched
+# in any router and can label the measurement with its name
+class MetricsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data: dict):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = await handler(event, data)
+            status = "ok"
+            return result
+        finally:
+            UPDATE_SECONDS.observe(time.perf_counter() - started, handler=name, status=status)
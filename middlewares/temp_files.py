@@ -0,0 +1,31 @@
+import logging
+from aiogram import BaseMiddleware
+
+from storages.temp_files import current_owner, temp_files
+
+logger = logging.getLogger(__name__)
+
+
+# Marks the files downloaded while handling an update as belonging to its user, and frees them
+# once the user's FSM session is over and none of their other updates is still being handled
+class TempFilesMiddleware(BaseMiddleware):
+    def __init__(self) -> None:
+        self._active: dict[int, int] = {}
+
+    async def __call__(self, handler, event, data: dict):
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        self._active[user.id] = self._active.get(user.id, 0) + 1
+        token = current_owner.set(user.id)
+        try:
+            return await handler(event, data)
+        finally:
+            current_owner.reset(token)
+            self._active[user.id] -= 1
+            if not self._active[user.id]:
+                del self._active[user.id]
+                state = data.get("state")
+                if state is not None and await state.get_state() is None:
+                    temp_files.release_owner(user.id)
@@ -0,0 +1,14 @@
+from aiogram import BaseMiddleware
+
+from common.logging_config import trace_id
+
+
+# Gives every log line written while an update is handled the id of that update, including the
+# lines of the downloads, worker pool jobs and uploads it starts
+class TracingMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data: dict):
+        token = trace_id.set("u" + str(event.update_id))
+        try:
+            return await handler(event, data)
+        finally:
+            trace_id.reset(token)
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from aiogram import types
+from aiogram.exceptions import TelegramAPIError
+from dotenv import find_dotenv, load_dotenv
+
+from common.bot_commands import COMMAND_SETS, DEFAULT_COMMAND_SET
+from common.bot_registry import get_bot
+from storages import database
+
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger(__name__)
+
+COMMAND_SCOPE_CACHE_SIZE = 0 if database.MULTI_PROCESS else int(os.getenv("COMMAND_SCOPE_CACHE_SIZE", 50000))
+COMMAND_SCOPE_FLUSH_INTERVAL = float(os.getenv("COMMAND_SCOPE_FLUSH_INTERVAL", 1))
+COMMAND_SCOPE_MAX_CONCURRENT = int(os.getenv("COMMAND_SCOPE_MAX_CONCURRENT", 5))
+
+
+# The command set each chat has in Telegram. Handlers only say which set a chat should have; the
+# API is called when that differs from what the chat already has, in batches off the handler, and
+# only the last request of a chat within a batch is sent. Chats on the default set have no
+# command scope of their own (they get the one set for all private chats at startup), so the
+# default is applied by deleting the chat scope. A chat without a record may still have a scope
+# set before the records were kept, so its first request is always sent.
+class CommandScopes:
+    def __init__(
+        self, connection=None, cache_size=COMMAND_SCOPE_CACHE_SIZE, flush_interval=COMMAND_SCOPE_FLUSH_INTERVAL
+    ) -> None:
+        self._connection = connection
+        self._table_ready = False
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self._cache: OrderedDict[int, str | None] = OrderedDict()
+        self._pending: dict[int, str] = {}
+        # Sent in the flush that is running, what the chat will have once it is done
+        self._applying: dict[int, str] = {}
+        self._api_slots = asyncio.Semaphore(COMMAND_SCOPE_MAX_CONCURRENT)
+        self._flush_task: asyncio.Task | None = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = database.get_connection()
+        if not self._table_ready:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS chat_commands ("
+                "chat_id INTEGER PRIMARY KEY, command_set TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            self._table_ready = True
+        return self._connection
+
+    def _remember(self, chat_id, command_set) -> None:
+        self._cache[chat_id] = command_set
+        self._cache.move_to_end(chat_id)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # None when it is not known what the chat has
+    def current(self, chat_id) -> str | None:
+        if chat_id in self._cache:
+            self._cache.move_to_end(chat_id)
+            return self._cache[chat_id]
+        row = self.connection.execute(
+            "SELECT command_set FROM chat_commands WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        command_set = row[0] if row is not None else None
+        self._remember(chat_id, command_set)
+        return command_set
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        self._flush_task = None
+        await self.flush()
+
+    async def request(self, chat_id, command_set) -> None:
+        if command_set == self._applying.get(chat_id) or (
+            chat_id not in self._applying and command_set == self.current(chat_id)
+        ):
+            self._pending.pop(chat_id, None)
+            return
+        self._pending[chat_id] = command_set
+        self._schedule_flush()
+
+    async def _apply(self, chat_id, command_set) -> bool:
+        scope = types.BotCommandScopeChat(chat_id=chat_id)
+        try:
+            async with self._api_slots:
+                if command_set == DEFAULT_COMMAND_SET:
+                    await get_bot().delete_my_commands(scope=scope)
+                else:
+                    await get_bot().set_my_commands(commands=COMMAND_SETS[command_set], scope=scope)
+        except TelegramAPIError as error:
+            # Left as it was, the next request for the chat tries again
+            logger.warning("Could not set the %s commands for chat %s: %r", command_set, chat_id, error)
+            return False
+        return True
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        self._applying = pending
+        try:
+            applied = await asyncio.gather(
+                *[self._apply(chat_id, command_set) for chat_id, command_set in pending.items()]
+            )
+        finally:
+            self._applying = {}
+        changes = [(chat_id, command_set) for (chat_id, command_set), ok in zip(pending.items(), applied) if ok]
+        now = time.time()
+
+        self.connection.execute("BEGIN")
+        self.connection.executemany(
+            "INSERT INTO chat_commands (chat_id, command_set, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET command_set = excluded.command_set, updated = excluded.updated",
+            [(chat_id, command_set, now) for chat_id, command_set in changes],
+        )
+        self.connection.execute("COMMIT")
+        for chat_id, command_set in changes:
+            self._remember(chat_id, command_set)
+        logger.debug("Updated the commands of %s chats, %s failed", len(changes), len(pending) - len(changes))
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+
+command_scopes = CommandScopes()
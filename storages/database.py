@@ -0,0 +1,34 @@
+import os
+import sqlite3
+from dotenv import find_dotenv, load_dotenv
+
+load_dotenv(find_dotenv())
+
+DATABASE_PATH = os.getenv("DATABASE_PATH", "bot.sqlite3")
+# Webhook workers are separate processes that share this database. A write made while handling one
+# update has to be visible to the process that gets the next one, so the stores turn off their
+# in-process caches and write-behind buffers.
+MULTI_PROCESS = os.getenv("BOT_MODE", "polling") == "webhook" and int(os.getenv("WEBHOOK_WORKERS", 1)) > 1
+
+_connection: sqlite3.Connection | None = None
+
+
+def connect(path) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def get_connection() -> sqlite3.Connection:
+    global _connection
+    if _connection is None:
+        _connection = connect(DATABASE_PATH)
+    return _connection
+
+
+def close() -> None:
+    global _connection
+    if _connection is not None:
+        _connection.close()
+        _connection = None
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from dotenv import find_dotenv, load_dotenv
+
+from storages import database
+
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger(__name__)
+
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")
+FSM_CACHE_SIZE = 0 if database.MULTI_PROCESS else int(os.getenv("FSM_CACHE_SIZE", 10000))
+FSM_FLUSH_INTERVAL = 0 if database.MULTI_PROCESS else float(os.getenv("FSM_FLUSH_INTERVAL", 0.2))
+FSM_FLUSH_BATCH = int(os.getenv("FSM_FLUSH_BATCH", 500))
+
+
+class _Record:
+    __slots__ = ("state", "data")
+
+    def __init__(self, state: Optional[str] = None, data: Dict[str, Any] | None = None) -> None:
+        self.state = state
+        self.data = data if data is not None else {}
+
+
+# FSM storage kept in SQLite so merge/rotate sessions survive restarts.
+# Reads are served from an in-memory LRU; writes are collected and flushed in one transaction
+# every FSM_FLUSH_INTERVAL seconds or as soon as FSM_FLUSH_BATCH keys are pending.
+# With cache_size=0 and flush_interval=0 every read and write goes to the database, which is what
+# several webhook workers sharing the database file get.
+class SQLiteStorage(BaseStorage):
+    def __init__(
+        self,
+        connection=None,
+        cache_size=FSM_CACHE_SIZE,
+        flush_interval=FSM_FLUSH_INTERVAL,
+        flush_batch=FSM_FLUSH_BATCH,
+    ) -> None:
+        self.connection = connection if connection is not None else database.get_connection()
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS fsm_storage (key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL)"
+        )
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._cache: OrderedDict[StorageKey, _Record] = OrderedDict()
+        self._dirty: dict[StorageKey, _Record] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(
+            (str(key.bot_id), str(key.chat_id), str(key.user_id), str(key.thread_id), key.destiny)
+        )
+
+    def _load(self, key: StorageKey) -> _Record:
+        record = self._cache.get(key)
+        if record is not None:
+            self._cache.move_to_end(key)
+            return record
+
+        record = self._dirty.get(key)
+        if record is None:
+            row = self.connection.execute(
+                "SELECT state, data FROM fsm_storage WHERE key = ?", (self._key(key),)
+            ).fetchone()
+            record = _Record(row[0], json.loads(row[1])) if row is not None else _Record()
+
+        if self.cache_size > 0:
+            self._cache[key] = record
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return record
+
+    def _mark_dirty(self, key: StorageKey, record: _Record) -> None:
+        self._dirty[key] = record
+        if self.flush_interval <= 0 or len(self._dirty) >= self.flush_batch:
+            self.flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        self._flush_task = None
+        self.flush()
+
+    def flush(self) -> None:
+        if not self._dirty:
+            return
+
+        dirty, self._dirty = self._dirty, {}
+        upserts = []
+        deletes = []
+        for key, record in dirty.items():
+            if record.state is None and not record.data:
+                deletes.append((self._key(key),))
+            else:
+                upserts.append((self._key(key), record.state, json.dumps(record.data)))
+
+        self.connection.execute("BEGIN")
+        try:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO fsm_storage (key, state, data) VALUES (?, ?, ?)", upserts
+            )
+            self.connection.executemany("DELETE FROM fsm_storage WHERE key = ?", deletes)
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            # Keep the writes pending, newer ones win
+            dirty.update(self._dirty)
+            self._dirty = dirty
+            raise
+        logger.debug("Flushed %s FSM records", len(dirty))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = self._load(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return self._load(key).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = self._load(key)
+        record.data = data.copy()
+        self._mark_dirty(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return self._load(key).data.copy()
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self.flush()
+
+
+def create_storage() -> BaseStorage:
+    if FSM_STORAGE == "memory":
+        if database.MULTI_PROCESS:
+            raise RuntimeError("FSM_STORAGE=memory cannot be shared by several webhook workers")
+        return MemoryStorage()
+    return SQLiteStorage()
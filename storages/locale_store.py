@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dotenv import find_dotenv, load_dotenv
+
+from storages import database
+
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger(__name__)
+
+LOCALE_CACHE_SIZE = 0 if database.MULTI_PROCESS else int(os.getenv("LOCALE_CACHE_SIZE", 50000))
+LOCALE_FLUSH_INTERVAL = float(os.getenv("LOCALE_FLUSH_INTERVAL", 2))
+LOCALE_WARMUP_USERS = int(os.getenv("LOCALE_WARMUP_USERS", 5000))
+
+
+# Saved user locales: a bounded LRU in front of SQLite. Locale changes and activity counters are
+# written behind in batches, and the most active users are loaded into the LRU at startup.
+class LocaleStore:
+    def __init__(self, connection=None, cache_size=LOCALE_CACHE_SIZE, flush_interval=LOCALE_FLUSH_INTERVAL) -> None:
+        self._connection = connection
+        self._table_ready = False
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        # None is cached too, so users on the default locale do not hit the database on every update
+        self._cache: OrderedDict[int, str | None] = OrderedDict()
+        self._pending_locales: dict[int, str] = {}
+        self._pending_hits: dict[int, int] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = database.get_connection()
+        if not self._table_ready:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS user_locales ("
+                "user_id INTEGER PRIMARY KEY, locale TEXT NOT NULL, hits INTEGER NOT NULL DEFAULT 0, last_seen REAL NOT NULL)"
+            )
+            self._table_ready = True
+        return self._connection
+
+    def _remember(self, user_id, locale) -> None:
+        self._cache[user_id] = locale
+        self._cache.move_to_end(user_id)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        self._flush_task = None
+        self.flush()
+
+    async def get_locale(self, user_id) -> str | None:
+        if user_id in self._cache:
+            locale = self._cache[user_id]
+            self._cache.move_to_end(user_id)
+        elif user_id in self._pending_locales:
+            locale = self._pending_locales[user_id]
+            self._remember(user_id, locale)
+        else:
+            row = self.connection.execute(
+                "SELECT locale FROM user_locales WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            locale = row[0] if row is not None else None
+            self._remember(user_id, locale)
+
+        if locale is not None:
+            self._pending_hits[user_id] = self._pending_hits.get(user_id, 0) + 1
+            self._schedule_flush()
+        return locale
+
+    async def set_locale(self, user_id, locale) -> None:
+        self._remember(user_id, locale)
+        self._pending_locales[user_id] = locale
+        if self.cache_size == 0:
+            # Nothing is cached, other processes read the locale from the database
+            self.flush()
+        else:
+            self._schedule_flush()
+
+    def flush(self) -> None:
+        if not self._pending_locales and not self._pending_hits:
+            return
+
+        pending_locales, self._pending_locales = self._pending_locales, {}
+        pending_hits, self._pending_hits = self._pending_hits, {}
+        now = time.time()
+
+        self.connection.execute("BEGIN")
+        self.connection.executemany(
+            "INSERT INTO user_locales (user_id, locale, last_seen) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET locale = excluded.locale, last_seen = excluded.last_seen",
+            [(user_id, locale, now) for user_id, locale in pending_locales.items()],
+        )
+        self.connection.executemany(
+            "UPDATE user_locales SET hits = hits + ?, last_seen = ? WHERE user_id = ?",
+            [(hits, now, user_id) for user_id, hits in pending_hits.items()],
+        )
+        self.connection.execute("COMMIT")
+        logger.debug("Flushed %s locales and %s activity counters", len(pending_locales), len(pending_hits))
+
+    def warm_up(self, limit=LOCALE_WARMUP_USERS) -> int:
+        rows = self.connection.execute(
+            "SELECT user_id, locale FROM user_locales ORDER BY hits DESC, last_seen DESC LIMIT ?",
+            (min(limit, self.cache_size),),
+        ).fetchall()
+        # Least active first, so the most active users end up at the hot end of the LRU
+        for user_id, locale in reversed(rows):
+            self._remember(user_id, locale)
+        logger.info("Preloaded locales for %s users", len(rows))
+        return len(rows)
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self.flush()
+
+
+locale_store = LocaleStore()
@@ -0,0 +1,95 @@
+import logging
+import os
+import time
+from dotenv import find_dotenv, load_dotenv
+
+from common.metrics import Counter
+from storages import database
+
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 10000))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 7 * 24 * 3600))
+
+
+# Maps (input file, operation, parameters, output name) to the Telegram file_id of an output that was
+# already sent, so a repeated request is answered without downloading or processing anything. A
+# document sent by file_id keeps the name it was uploaded with, so every name has its own entry.
+class ResultCache:
+    def __init__(self, connection=None, max_entries=RESULT_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL) -> None:
+        self._connection = connection
+        self._table_ready = False
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = database.get_connection()
+        if not self._table_ready:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS result_cache ("
+                "key TEXT PRIMARY KEY, file_id TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS result_cache_last_used ON result_cache (last_used)"
+            )
+            self._table_ready = True
+        return self._connection
+
+    @staticmethod
+    def make_key(input_key, operation, params="", file_name="") -> str:
+        return input_key + ":" + operation + ":" + str(params) + ":" + file_name
+
+    def get(self, input_key, operation, params="", file_name="") -> str | None:
+        key = self.make_key(input_key, operation, params, file_name)
+        now = time.time()
+        row = self.connection.execute(
+            "SELECT file_id, created_at FROM result_cache WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None or now - row[1] > self.ttl:
+            if row is not None:
+                self.connection.execute("DELETE FROM result_cache WHERE key = ?", (key,))
+            self.misses += 1
+            logger.debug("Result cache miss for %s", key)
+            return None
+
+        self.connection.execute("UPDATE result_cache SET last_used = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        logger.debug("Result cache hit for %s", key)
+        return row[0]
+
+    def put(self, input_key, operation, params, file_id, file_name="") -> None:
+        key = self.make_key(input_key, operation, params, file_name)
+        now = time.time()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO result_cache (key, file_id, created_at, last_used) VALUES (?, ?, ?, ?)",
+            (key, file_id, now, now),
+        )
+        self._evict(now)
+
+    def remove(self, input_key, operation, params="", file_name="") -> None:
+        self.connection.execute(
+            "DELETE FROM result_cache WHERE key = ?", (self.make_key(input_key, operation, params, file_name),)
+        )
+
+    def _evict(self, now) -> None:
+        self.connection.execute("DELETE FROM result_cache WHERE created_at < ?", (now - self.ttl,))
+        self.connection.execute(
+            "DELETE FROM result_cache WHERE key IN ("
+            "SELECT key FROM result_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+result_cache = ResultCache()
+Counter("bot_result_cache_hits_total", "Requests answered from the result cache", function=lambda: result_cache.hits)
+Counter("bot_result_cache_misses_total", "Requests the result cache had no answer for", function=lambda: result_cache.misses)
@@ -0,0 +1,171 @@
+import asyncio
+import contextvars
+import logging
+import os
+import shutil
+import time
+from dotenv import find_dotenv, load_dotenv
+
+from storages import workspace
+
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger(__name__)
+
+TEMP_FILE_TTL = float(os.getenv("TEMP_FILE_TTL", 3600))
+TEMP_SWEEP_INTERVAL = float(os.getenv("TEMP_SWEEP_INTERVAL", 60))
+TEMP_HIGH_WATER = float(os.getenv("TEMP_HIGH_WATER", 0.9))
+TEMP_LOW_WATER = float(os.getenv("TEMP_LOW_WATER", 0.8))
+TEMP_MAX_BYTES = int(os.getenv("TEMP_MAX_BYTES", 0))
+TEMP_MIN_AGE = float(os.getenv("TEMP_MIN_AGE", 120))
+
+# The user whose update is being handled, set by TempFilesMiddleware
+current_owner: contextvars.ContextVar[int | None] = contextvars.ContextVar("current_owner", default=None)
+
+
+class _Entry:
+    __slots__ = ("owners", "size", "last_used")
+
+    def __init__(self, size) -> None:
+        self.owners: set[int] = set()
+        self.size = size
+        self.last_used = time.time()
+
+
+# Keeps track of the files in FILE_INPUT_LOCATION / FILE_OUTPUT_LOCATION (and the in-memory
+# workspace) and who they belong to.
+# A user's files are removed when their FSM session ends, files of abandoned sessions after
+# TEMP_FILE_TTL, and when the volume gets above TEMP_HIGH_WATER (or the files above TEMP_MAX_BYTES)
+# the least recently used files are evicted until it is back under TEMP_LOW_WATER.
+class TempFileManager:
+    def __init__(self, directories=(), ttl=TEMP_FILE_TTL, sweep_interval=TEMP_SWEEP_INTERVAL) -> None:
+        self.directories = [directory for directory in directories if directory]
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._entries: dict[str, _Entry] = {}
+        self._sweeper: asyncio.Task | None = None
+
+    @property
+    def bytes_in_use(self) -> int:
+        return sum(entry.size for entry in self._entries.values())
+
+    def track(self, path, owner=None) -> None:
+        owner = owner if owner is not None else current_owner.get()
+        entry = self._entries.get(path)
+        if entry is None:
+            try:
+                entry = self._entries[path] = _Entry(os.path.getsize(path))
+            except OSError:
+                return
+        entry.last_used = time.time()
+        if owner is not None:
+            entry.owners.add(owner)
+
+    def _remove(self, path) -> int:
+        entry = self._entries.pop(path, None)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            logger.warning("Could not remove %s: %r", path, error)
+        return entry.size if entry is not None else 0
+
+    # Files shared with another user's session stay until that session ends too
+    def release_owner(self, owner) -> int:
+        freed = 0
+        for path, entry in list(self._entries.items()):
+            if owner in entry.owners:
+                entry.owners.discard(owner)
+                if not entry.owners:
+                    freed += self._remove(path)
+        if freed:
+            logger.debug("Released %s bytes of user %s", freed, owner)
+        return freed
+
+    def _untracked_files(self) -> list[tuple[str, float, int]]:
+        files = []
+        for directory in self.directories:
+            try:
+                with os.scandir(directory) as scan:
+                    for item in scan:
+                        if item.is_file(follow_symlinks=False) and item.path not in self._entries:
+                            stat = item.stat(follow_symlinks=False)
+                            files.append((item.path, stat.st_mtime, stat.st_size))
+            except FileNotFoundError:
+                continue
+        return files
+
+    def _disk_used_fraction(self) -> float:
+        fractions = []
+        for directory in self.directories:
+            try:
+                usage = shutil.disk_usage(directory)
+            except FileNotFoundError:
+                continue
+            fractions.append(usage.used / usage.total)
+        return max(fractions, default=0.0)
+
+    # TEMP_MAX_BYTES works as a quota with the same high and low water marks as the volume
+    def _over_limit(self, mark) -> bool:
+        if TEMP_MAX_BYTES and self.bytes_in_use > TEMP_MAX_BYTES * mark:
+            return True
+        return self._disk_used_fraction() > mark
+
+    def sweep(self) -> int:
+        now = time.time()
+        freed = 0
+
+        # Files nobody touched for a TTL belong to abandoned sessions or to a previous run of the bot
+        for path, entry in list(self._entries.items()):
+            if now - entry.last_used > self.ttl:
+                freed += self._remove(path)
+        for path, modified, size in self._untracked_files():
+            if now - modified > self.ttl:
+                self._remove(path)
+                freed += size
+
+        if self._over_limit(TEMP_HIGH_WATER):
+            # Files used in the last TEMP_MIN_AGE seconds may belong to a job that is still running
+            candidates = sorted(
+                (entry.last_used, path) for path, entry in self._entries.items()
+                if now - entry.last_used > TEMP_MIN_AGE
+            )
+            for last_used, path in candidates:
+                if not self._over_limit(TEMP_LOW_WATER):
+                    break
+                freed += self._remove(path)
+            logger.warning("Temporary files were above the high-water mark, %s bytes freed", freed)
+
+        logger.info(
+            "Temporary files: %s tracked, %s bytes in use, %s bytes freed by this sweep",
+            len(self._entries), self.bytes_in_use, freed,
+        )
+        return freed
+
+    def usage(self) -> dict:
+        return {
+            "tracked_files": len(self._entries),
+            "bytes_in_use": self.bytes_in_use,
+            "disk_used_fraction": round(self._disk_used_fraction(), 3),
+        }
+
+    async def _sweep_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as error:
+                logger.error("Temporary files sweep failed: %r", error)
+
+    def start(self) -> None:
+        if self._sweeper is None:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_periodically())
+
+    async def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+
+temp_files = TempFileManager(workspace.directories())
@@ -0,0 +1,90 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from dotenv import find_dotenv, load_dotenv
+
+from storages import database
+
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_INDEX_MAX_ENTRIES = int(os.getenv("UPLOAD_INDEX_MAX_ENTRIES", 50000))
+
+
+def _hash_file(file_path) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def hash_file(file_path) -> str:
+    return await asyncio.to_thread(_hash_file, file_path)
+
+
+async def hash_bytes(content) -> str:
+    return await asyncio.to_thread(lambda: hashlib.sha256(content).hexdigest())
+
+
+# Maps the SHA-256 and the name of a generated document to the Telegram file_id it got when it was
+# first uploaded. A document sent by file_id keeps its uploaded name, so the same content sent under
+# another name is uploaded again.
+class UploadIndex:
+    def __init__(self, connection=None, max_entries=UPLOAD_INDEX_MAX_ENTRIES) -> None:
+        self._connection = connection
+        self._table_ready = False
+        self.max_entries = max_entries
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = database.get_connection()
+        if not self._table_ready:
+            # The first version was keyed by the hash alone
+            self._connection.execute("DROP TABLE IF EXISTS upload_index")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS uploaded_documents ("
+                "content_hash TEXT NOT NULL, file_name TEXT NOT NULL, file_id TEXT NOT NULL, last_used REAL NOT NULL, "
+                "PRIMARY KEY (content_hash, file_name))"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS uploaded_documents_last_used ON uploaded_documents (last_used)"
+            )
+            self._table_ready = True
+        return self._connection
+
+    def get(self, content_hash, file_name) -> str | None:
+        row = self.connection.execute(
+            "SELECT file_id FROM uploaded_documents WHERE content_hash = ? AND file_name = ?", (content_hash, file_name)
+        ).fetchone()
+        if row is None:
+            return None
+
+        self.connection.execute(
+            "UPDATE uploaded_documents SET last_used = ? WHERE content_hash = ? AND file_name = ?",
+            (time.time(), content_hash, file_name),
+        )
+        return row[0]
+
+    def put(self, content_hash, file_name, file_id) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO uploaded_documents (content_hash, file_name, file_id, last_used) VALUES (?, ?, ?, ?)",
+            (content_hash, file_name, file_id, time.time()),
+        )
+        self.connection.execute(
+            "DELETE FROM uploaded_documents WHERE rowid IN ("
+            "SELECT rowid FROM uploaded_documents ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def remove(self, content_hash, file_name) -> None:
+        self.connection.execute(
+            "DELETE FROM uploaded_documents WHERE content_hash = ? AND file_name = ?", (content_hash, file_name)
+        )
+
+
+upload_index = UploadIndex()
@@ -0,0 +1,80 @@
+import logging
+import os
+import shutil
+from dotenv import find_dotenv, load_dotenv
+
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger(__name__)
+
+file_input_location = os.getenv("FILE_INPUT_LOCATION")
+file_output_location = os.getenv("FILE_OUTPUT_LOCATION")
+
+# A directory on a RAM-backed file system (tmpfs, e.g. under /dev/shm). Empty turns the mode off.
+WORKSPACE_MEMORY_DIR = os.getenv("WORKSPACE_MEMORY_DIR", "")
+WORKSPACE_MEMORY_THRESHOLD = int(os.getenv("WORKSPACE_MEMORY_THRESHOLD", 5 * 1024 * 1024))
+WORKSPACE_MEMORY_BUDGET = int(os.getenv("WORKSPACE_MEMORY_BUDGET", 256 * 1024 * 1024))
+
+memory_input_location = os.path.join(WORKSPACE_MEMORY_DIR, "input") if WORKSPACE_MEMORY_DIR else None
+memory_output_location = os.path.join(WORKSPACE_MEMORY_DIR, "output") if WORKSPACE_MEMORY_DIR else None
+
+# The LibreOffice container is only sent the file name, it reads the input from and writes the
+# result to the shared FILE_INPUT_LOCATION / FILE_OUTPUT_LOCATION volume itself
+DISK_OPERATIONS = ("topdf",)
+
+
+# Small files are kept in memory from the download to the upload: the worker processes read them
+# from the page cache instead of the disk, which a BytesIO handed over to the pool could not do
+# without pickling the whole file twice. Bigger files, and small ones once the budget is used up,
+# spill to FILE_INPUT_LOCATION / FILE_OUTPUT_LOCATION as before.
+def enabled() -> bool:
+    return bool(WORKSPACE_MEMORY_DIR)
+
+
+def prepare() -> None:
+    if enabled():
+        os.makedirs(memory_input_location, exist_ok=True)
+        os.makedirs(memory_output_location, exist_ok=True)
+        logger.info(
+            "In-memory workspace for files up to %s bytes in %s",
+            WORKSPACE_MEMORY_THRESHOLD, WORKSPACE_MEMORY_DIR,
+        )
+
+
+def memory_allowed(operation=None) -> bool:
+    return enabled() and operation not in DISK_OPERATIONS
+
+
+def in_memory(path) -> bool:
+    return enabled() and os.path.dirname(path) in (memory_input_location, memory_output_location)
+
+
+# The input and the output of a job live in the workspace at the same time
+def _has_room(size) -> bool:
+    try:
+        usage = shutil.disk_usage(WORKSPACE_MEMORY_DIR)
+    except FileNotFoundError:
+        return False
+    return usage.used + 2 * size <= WORKSPACE_MEMORY_BUDGET and usage.free >= 2 * size
+
+
+def directories() -> list[str]:
+    locations = [file_input_location, file_output_location]
+    if enabled():
+        locations += [memory_input_location, memory_output_location]
+    return locations
+
+
+def input_location(file_size, operation=None) -> str:
+    if memory_allowed(operation) and file_size is not None and file_size <= WORKSPACE_MEMORY_THRESHOLD and _has_room(file_size):
+        return memory_input_location
+    return file_input_location
+
+
+# Results stay in memory only when everything they are made from is there already
+def output_location(*input_items, operation=None) -> str:
+    if memory_allowed(operation) and input_items and all(in_memory(input_item) for input_item in input_items):
+        total_size = sum(os.path.getsize(input_item) for input_item in input_items)
+        if total_size <= WORKSPACE_MEMORY_THRESHOLD and _has_room(total_size):
+            return memory_output_location
+    return file_output_location
@@ -0,0 +1,22 @@
+import pytest
+from pypdf import PdfWriter
+
+from benchmarks.pdf_corpus import scan_pdf
+
+
+# The test PDFs come from the benchmark corpus generator, blank pages where only the page count matters
+@pytest.fixture
+def make_scanned_pdf():
+    def make(path, pages=3, side=800):
+        scan_pdf(path, pages, seed=1, side=side)
+    return make
+
+
+@pytest.fixture
+def make_pdf():
+    def make(path, pages=6):
+        writer = PdfWriter()
+        for _ in range(pages):
+            writer.add_blank_page(200, 300)
+        writer.write(path)
+    return make
@@ -0,0 +1,26 @@
+import pytest
+from aiogram import Bot
+from aiogram.types import BufferedInputFile
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from common import bot_registry
+
+TOKEN = "123456:ABCdef"
+
+
+@pytest.mark.asyncio
+async def test_uploaded_documents_are_counted():
+    fake_api = FakeBotAPI(TOKEN)
+    await fake_api.start()
+    bot = Bot(token=TOKEN, session=bot_registry.create_session(fake_api.base_url))
+    content = b"%PDF-1.7\n" + bytes(1000)
+    try:
+        message = await bot.send_document(42, BufferedInputFile(content, "report.pdf"))
+        resent = await bot.send_document(42, message.document.file_id)
+    finally:
+        await bot.session.close()
+        await fake_api.stop()
+
+    assert fake_api.uploaded_bytes == len(content)
+    assert fake_api.files[message.document.file_id] == content
+    assert resent.document.file_id == message.document.file_id
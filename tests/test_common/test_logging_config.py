@@ -0,0 +1,80 @@
+import json
+import logging
+import pytest
+
+from common import logging_config
+from workload_handlers import worker_pool
+from workload_handlers.file_archiver import zipFiles
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "bot.log"
+    level = logging.getLogger().level
+    yield path
+    logging_config.stop_logging()
+    logging.getLogger().setLevel(level)
+
+
+def test_lines_carry_the_trace_id_and_stage_fields(log_file):
+    logging_config.setup_logging(str(log_file), "DEBUG")
+    logger = logging.getLogger("test_logging_config")
+
+    token = logging_config.trace_id.set("u42")
+    logger.info("Downloaded %s", "file.pdf", extra={"stage": "download", "duration": 0.25})
+    logging_config.trace_id.reset(token)
+    logger.info("Outside of an update")
+    logging_config.stop_logging()
+
+    lines = log_file.read_text().splitlines()
+    assert "- u42 -" in lines[0] and lines[0].endswith("Downloaded file.pdf | stage=download duration=0.25")
+    assert "- - -" in lines[1]
+
+
+def test_log_file_is_rotated_instead_of_truncated(log_file):
+    log_file.write_text("from the previous run\n")
+    logging_config.setup_logging(str(log_file), "INFO", max_bytes=200, backup_count=2)
+    for number in range(20):
+        logging.getLogger("test_logging_config").info("Line %s", number)
+    logging_config.stop_logging()
+
+    rotated = sorted(log_file.parent.glob("bot.log.*"))
+    assert len(rotated) == 2
+    assert "Line 19" in log_file.read_text()
+
+
+
+def test_json_lines_keep_the_exception_apart(log_file):
+    logging_config.setup_logging(str(log_file), "INFO", json_output=True)
+    try:
+        raise ValueError("broken page tree")
+    except ValueError:
+        logging.getLogger("test_logging_config").exception("Conversion failed for %s", "file.pdf")
+    logging_config.stop_logging()
+
+    entry = json.loads(log_file.read_text())
+    assert entry["message"] == "Conversion failed for file.pdf"
+    assert entry["exception"].startswith("Traceback") and "ValueError: broken page tree" in entry["exception"]
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_jobs_log_with_the_trace_id(log_file, tmp_path):
+    input_item = tmp_path / "input.txt"
+    input_item.write_text("content")
+
+    logging_config.setup_logging(str(log_file), "INFO", json_output=True)
+    worker_pool.shutdown()
+    worker_pool.start()
+    token = logging_config.trace_id.set("u7")
+    try:
+        await zipFiles([str(input_item)], ["input.txt"], str(tmp_path / "out.zip"))
+    finally:
+        logging_config.trace_id.reset(token)
+        worker_pool.shutdown()
+        logging_config.stop_logging()
+
+    entries = [json.loads(line) for line in log_file.read_text().splitlines()]
+    packed = next(entry for entry in entries if entry["message"].startswith("Packed 1 files"))
+    finished = next(entry for entry in entries if entry.get("stage") == "process")
+    assert packed["trace_id"] == "u7"
+    assert finished["trace_id"] == "u7" and finished["duration"] >= 0
@@ -0,0 +1,58 @@
+import socket
+import aiohttp
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Update
+
+from benchmarks.synthetic_updates import message_update
+from common import metrics
+from middlewares.metrics import MetricsMiddleware, UPDATE_SECONDS
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics.Histogram("test_seconds", "Test histogram", buckets=(0.1, 1))
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+    histogram.observe(5, stage="a")
+    counter = metrics.Counter("test_total", "Test counter")
+    counter.inc(3, status="200")
+
+    text = metrics.render()
+
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{stage="a",le="1.0"} 2' in text
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in text
+    assert 'test_seconds_count{stage="a"} 3' in text
+    assert "# TYPE test_total counter" in text
+    assert 'test_total{status="200"} 3' in text
+
+
+@pytest.mark.asyncio
+async def test_handler_latency_is_served_over_http():
+    router = Router()
+
+    @router.message()
+    async def echo_for_metrics(message) -> None:
+        pass
+
+    dispatcher = Dispatcher()
+    dispatcher.message.middleware(MetricsMiddleware())
+    dispatcher.include_router(router)
+    bot = Bot(token="123456:ABCdef")
+    await dispatcher.feed_update(bot, Update.model_validate(message_update(1, "hi"), context={"bot": bot}))
+    assert UPDATE_SECONDS.count(handler="echo_for_metrics", status="ok") == 1
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    await metrics.start_server("127.0.0.1", port)
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get("http://127.0.0.1:" + str(port) + "/metrics") as response:
+                text = await response.text()
+                assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    finally:
+        await metrics.stop_server()
+        await bot.session.close()
+
+    assert 'bot_update_handling_seconds_count{handler="echo_for_metrics",status="ok"} 1' in text
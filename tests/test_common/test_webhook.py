@@ -0,0 +1,52 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+from aiogram import Bot, Dispatcher, Router
+from aiohttp.test_utils import TestClient, TestServer
+
+from benchmarks.synthetic_updates import message_update
+from common import webhook
+
+SECRET = "webhook-secret"
+
+
+def make_app(handled, delay=0.0):
+    router = Router()
+
+    @router.message()
+    async def echo(message) -> None:
+        await asyncio.sleep(delay)
+        handled.append(message.text)
+
+    dispatcher = Dispatcher()
+    dispatcher.include_router(router)
+    bot = Bot(token="123456:ABCdef")
+    bot.session.close = AsyncMock()
+    return webhook.create_app(dispatcher, bot, "/webhook", SECRET)
+
+
+@pytest.mark.asyncio
+async def test_webhook_rejects_wrong_secret():
+    handled = []
+    async with TestClient(TestServer(make_app(handled))) as client:
+        response = await client.post("/webhook", json=message_update(1, "hi"))
+        assert response.status == 401
+        response = await client.post(
+            "/webhook", json=message_update(1, "hi"), headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}
+        )
+        assert response.status == 200
+        await asyncio.sleep(0.05)
+    assert handled == ["hi"]
+
+
+@pytest.mark.asyncio
+async def test_webhook_drains_updates_on_shutdown():
+    handled = []
+    client = TestClient(TestServer(make_app(handled, delay=0.2)))
+    await client.start_server()
+    for i in range(5):
+        await client.post(
+            "/webhook", json=message_update(i, str(i)), headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}
+        )
+    await client.close()
+    assert sorted(handled) == ["0", "1", "2", "3", "4"]
@@ -1,14 +1,24 @@
 import pytest
 from unittest.mock import AsyncMock, Mock
 from aiogram.fsm.context import FSMContext
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.storage.base import StorageKey
 
 from handlers.user_handlers import document_without_command, start_cmd, switch_language
-from handlers.user_handlers import INITIAL_KEYBOARD
+from handlers.user_handlers import INITIAL_KEYBOARD, reply_with_document
+from handlers import user_handlers
+from storages import command_scopes, database
+from storages.command_scopes import CommandScopes
+from storages.result_cache import ResultCache
+from storages.upload_index import UploadIndex
 
 @pytest.mark.asyncio
-async def test_start_cmds():
+async def test_start_cmds(tmp_path, monkeypatch):
+    monkeypatch.setattr(command_scopes, "get_bot", lambda: AsyncMock())
+    monkeypatch.setattr(user_handlers, "command_scopes", CommandScopes(connection=database.connect(tmp_path / "commands.sqlite3")))
     message = AsyncMock()
+    message.chat.id = 42
     mock_i18n = Mock()
     mock_i18n.get.return_value = "Hi, I am your PDF converter assistant"
     await start_cmd(message, mock_i18n)
@@ -33,3 +43,73 @@ async def test_switch_language_ru():
     await switch_language(message, mock_i18n, "ru")
     message.answer.assert_called()
     message.answer.assert_called_once_with("Язык переключен на : ru", reply_markup=INITIAL_KEYBOARD)
+
+
+@pytest.mark.asyncio
+async def test_reply_with_document_reuses_uploaded_file_id(tmp_path, monkeypatch):
+    monkeypatch.setattr(user_handlers, "upload_index", UploadIndex(connection=database.connect(tmp_path / "index.sqlite3")))
+    output_file = tmp_path / "output.pdf"
+    output_file.write_bytes(b"%PDF-1.4 generated output")
+    message = AsyncMock()
+    message.reply_document.return_value.document.file_id = "uploaded_file_id"
+
+    await reply_with_document(message, str(output_file), "compressed_output.pdf")
+    await reply_with_document(message, str(output_file), "compressed_output.pdf")
+
+    first_upload = message.reply_document.call_args_list[0].args[0]
+    assert isinstance(first_upload, types.FSInputFile)
+    message.reply_document.assert_called_with("uploaded_file_id")
+
+
+@pytest.mark.asyncio
+async def test_same_content_under_another_name_keeps_that_name(tmp_path, monkeypatch):
+    monkeypatch.setattr(user_handlers, "upload_index", UploadIndex(connection=database.connect(tmp_path / "index.sqlite3")))
+    cache = ResultCache(connection=database.connect(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(user_handlers, "result_cache", cache)
+    output_file = tmp_path / "output.pdf"
+    output_file.write_bytes(b"%PDF-1.4 generated output")
+    first_user = AsyncMock()
+    first_user.reply_document.return_value.document.file_id = "report_file_id"
+    second_user = AsyncMock()
+    second_user.reply_document.return_value.document.file_id = "invoice_file_id"
+
+    # Both users sent the same file, one as report.pdf and one as invoice.pdf
+    sent = await reply_with_document(first_user, str(output_file), "compressed_report.pdf")
+    cache.put("unique", "compress", "balanced", sent.document.file_id, "compressed_report.pdf")
+    assert not await user_handlers.reply_from_result_cache(
+        second_user, Mock(), "unique", "compress", "balanced", "compressed_invoice.pdf"
+    )
+    await reply_with_document(second_user, str(output_file), "compressed_invoice.pdf")
+
+    upload = second_user.reply_document.call_args.args[0]
+    assert isinstance(upload, types.FSInputFile) and upload.filename == "compressed_invoice.pdf"
+    assert await user_handlers.reply_from_result_cache(
+        first_user, Mock(), "unique", "compress", "balanced", "compressed_report.pdf"
+    )
+    first_user.reply_document.assert_called_with("report_file_id")
+
+
+@pytest.mark.asyncio
+async def test_rejected_cached_result_is_dropped(tmp_path, monkeypatch):
+    cache = ResultCache(connection=database.connect(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(user_handlers, "result_cache", cache)
+    cache.put("unique", "compress", "balanced", "stale_file_id")
+    message = AsyncMock()
+    message.reply_document.side_effect = TelegramBadRequest(method=None, message="wrong file identifier")
+
+    assert not await user_handlers.reply_from_result_cache(message, Mock(), "unique", "compress", "balanced")
+    assert cache.get("unique", "compress", "balanced") is None
+    message.answer.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_upper_case_pdf_gets_the_pdf_limits(tmp_path, monkeypatch):
+    input_item = tmp_path / "file_id_SCAN.PDF"
+    input_item.write_bytes(b"%PDF-1.4")
+    monkeypatch.setattr(user_handlers, "fileDownloader", AsyncMock(return_value=str(input_item)))
+    check_pdf_limits = AsyncMock()
+    monkeypatch.setattr(user_handlers.preflight, "check_pdf_limits", check_pdf_limits)
+    document = Mock(file_id="file_id", file_unique_id="unique", file_name="SCAN.PDF")
+
+    assert await user_handlers.download_checked(document) == str(input_item)
+    check_pdf_limits.assert_awaited_once_with(str(input_item))
@@ -0,0 +1,65 @@
+import pytest
+from aiogram.methods import SendMessage
+from aiogram_i18n import I18nContext
+
+from handlers.user_handlers import INITIAL_KEYBOARD
+from keyboards import keyboard_cache
+from keyboards.inline_keyboard import build_inline_callback_keyboard
+from middlewares.i18nmiddleware import PrecompiledGNUTextCore, UserManager
+
+
+@pytest.mark.asyncio
+async def test_messages_are_rendered_for_every_locale():
+    core = PrecompiledGNUTextCore(path="locales", default_locale="en")
+    await core.startup()
+
+    assert core.rendered["ru"]["Convert to PDF"] == "Конвертировать в PDF"
+    assert core.get("Convert to PDF", "en") == "Convert to PDF"
+    assert core.get("Convert to PDF", "de") == "Convert to PDF"
+    assert core.get("File {count} added. Send the next one or press Done", "en", count=2).startswith("File 2 added")
+
+
+@pytest.mark.asyncio
+async def test_requests_carry_the_keyboard_of_the_user_locale():
+    core = PrecompiledGNUTextCore(path="locales", default_locale="en")
+    await core.startup()
+    keyboard_cache.build(core)
+    sent = []
+
+    async def make_request(bot, method):
+        sent.append(method.reply_markup)
+
+    method = SendMessage(chat_id=1, text="menu", reply_markup=INITIAL_KEYBOARD)
+    token = I18nContext.set_current(I18nContext(locale="ru", core=core, manager=UserManager(), data={}))
+    try:
+        await keyboard_cache.LocalizedKeyboards()(make_request, None, method)
+    finally:
+        I18nContext.reset_current(token)
+
+    assert keyboard_cache.localized("initial", "ru").inline_keyboard[0][0].text == "Конвертировать в PDF"
+    assert sent[0] is keyboard_cache.localized("initial", "ru")
+    assert sent[0].model_dump(exclude_none=True)["inline_keyboard"][0][0] == {
+        "text": "Конвертировать в PDF", "callback_data": "topdf"
+    }
+
+
+@pytest.mark.asyncio
+async def test_keyboards_built_per_message_are_not_kept():
+    core = PrecompiledGNUTextCore(path="locales", default_locale="en")
+    await core.startup()
+    keyboard_cache.build(core)
+    registered = len(keyboard_cache._keyboards)
+    sent = []
+
+    async def make_request(bot, method):
+        sent.append(method.reply_markup)
+
+    markup = build_inline_callback_keyboard(buttons={"Restart bot": "restart"})
+    token = I18nContext.set_current(I18nContext(locale="ru", core=core, manager=UserManager(), data={}))
+    try:
+        await keyboard_cache.LocalizedKeyboards()(make_request, None, SendMessage(chat_id=1, text="admin", reply_markup=markup))
+    finally:
+        I18nContext.reset_current(token)
+
+    assert len(keyboard_cache._keyboards) == registered
+    assert sent == [markup]
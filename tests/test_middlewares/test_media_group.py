@@ -0,0 +1,72 @@
+import asyncio
+import datetime
+import pytest
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.types import Chat, Message
+
+from middlewares.media_group import MediaGroupMiddleware
+from storages import database
+
+
+def album_message(message_id, media_group_id="album1") -> Message:
+    return Message(
+        message_id=message_id,
+        date=datetime.datetime.now(),
+        chat=Chat(id=1, type="private"),
+        media_group_id=media_group_id,
+    )
+
+
+@pytest.mark.asyncio
+async def test_album_reaches_flagged_handler_once():
+    middleware = MediaGroupMiddleware(wait=0.05)
+    calls = []
+
+    async def handler(event, data):
+        calls.append([message.message_id for message in data["album"]])
+
+    handler_object = HandlerObject(callback=handler, flags={"album": True})
+    await asyncio.gather(
+        *[middleware(handler, album_message(message_id), {"handler": handler_object}) for message_id in (3, 1, 2)]
+    )
+
+    assert calls == [[1, 2, 3]]
+
+
+@pytest.mark.asyncio
+async def test_other_handlers_get_every_message():
+    middleware = MediaGroupMiddleware(wait=0.05)
+    calls = []
+
+    async def handler(event, data):
+        calls.append(event.message_id)
+
+    handler_object = HandlerObject(callback=handler)
+    for message_id in (1, 2):
+        await middleware(handler, album_message(message_id), {"handler": handler_object})
+
+    assert calls == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_album_split_between_processes_reaches_handler_once(tmp_path):
+    # Two middlewares on one database file stand in for two webhook workers
+    workers = [
+        MediaGroupMiddleware(wait=0.05, shared=True, connection=database.connect(tmp_path / "bot.sqlite3"))
+        for _ in range(2)
+    ]
+    calls = []
+
+    async def handler(event, data):
+        calls.append([message.message_id for message in data["album"]])
+
+    handler_object = HandlerObject(callback=handler, flags={"album": True})
+    await asyncio.gather(
+        *[
+            workers[message_id % 2](handler, album_message(message_id), {"handler": handler_object})
+            for message_id in (3, 1, 2, 4)
+        ]
+    )
+
+    assert calls == [[1, 2, 3, 4]]
+    assert workers[0].connection.execute("SELECT COUNT(*) FROM media_group_parts").fetchone()[0] == 0
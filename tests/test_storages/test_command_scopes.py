@@ -0,0 +1,60 @@
+import pytest
+from unittest.mock import AsyncMock
+from aiogram.exceptions import TelegramBadRequest
+
+from storages import command_scopes, database
+from storages.command_scopes import CommandScopes
+
+
+@pytest.mark.asyncio
+async def test_api_is_called_only_when_the_command_set_changes(tmp_path, monkeypatch):
+    bot = AsyncMock()
+    monkeypatch.setattr(command_scopes, "get_bot", lambda: bot)
+    scopes = CommandScopes(connection=database.connect(tmp_path / "commands.sqlite3"), flush_interval=60)
+
+    # Chats without a record may have an admin scope from before, so the first request is sent
+    await scopes.request(42, "user")
+    await scopes.request(7, "admin")
+    await scopes.request(7, "user")
+    await scopes.flush()
+    assert bot.delete_my_commands.await_count == 2
+    assert {call.kwargs["scope"].chat_id for call in bot.delete_my_commands.await_args_list} == {42, 7}
+
+    await scopes.request(42, "user")
+    await scopes.request(7, "user")
+    await scopes.flush()
+    assert bot.delete_my_commands.await_count == 2
+    bot.reset_mock()
+
+    await scopes.request(42, "admin")
+    await scopes.request(42, "admin")
+    await scopes.close()
+    bot.set_my_commands.assert_awaited_once()
+    assert bot.set_my_commands.await_args.kwargs["scope"].chat_id == 42
+
+    restarted = CommandScopes(connection=database.connect(tmp_path / "commands.sqlite3"), flush_interval=60)
+    await restarted.request(42, "admin")
+    assert restarted.current(42) == "admin"
+    await restarted.request(42, "user")
+    await restarted.close()
+    bot.delete_my_commands.assert_awaited_once()
+    assert restarted.connection.execute(
+        "SELECT command_set FROM chat_commands WHERE chat_id = ?", (42,)
+    ).fetchone()[0] == "user"
+
+
+@pytest.mark.asyncio
+async def test_failed_update_is_retried_on_the_next_request(tmp_path, monkeypatch):
+    bot = AsyncMock()
+    bot.set_my_commands.side_effect = [TelegramBadRequest(method=None, message="Too Many Requests"), True]
+    monkeypatch.setattr(command_scopes, "get_bot", lambda: bot)
+    scopes = CommandScopes(connection=database.connect(tmp_path / "commands.sqlite3"), flush_interval=60)
+
+    await scopes.request(42, "admin")
+    await scopes.flush()
+    assert scopes.current(42) is None
+
+    await scopes.request(42, "admin")
+    await scopes.flush()
+    assert scopes.current(42) == "admin"
+    assert bot.set_my_commands.await_count == 2
@@ -0,0 +1,64 @@
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from storages import database
+from storages.fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+@pytest.mark.asyncio
+async def test_state_survives_restart(tmp_path):
+    storage = SQLiteStorage(connection=database.connect(tmp_path / "fsm.sqlite3"))
+    await storage.set_state(KEY, "MergePDF:input_file2")
+    await storage.update_data(KEY, {"file_path_input1": "/input/file.pdf"})
+    await storage.close()
+
+    restarted = SQLiteStorage(connection=database.connect(tmp_path / "fsm.sqlite3"))
+    assert await restarted.get_state(KEY) == "MergePDF:input_file2"
+    assert await restarted.get_data(KEY) == {"file_path_input1": "/input/file.pdf"}
+
+
+@pytest.mark.asyncio
+async def test_writes_are_batched_and_evicted_keys_reload(tmp_path):
+    connection = database.connect(tmp_path / "fsm.sqlite3")
+    storage = SQLiteStorage(connection=connection, cache_size=2, flush_interval=60, flush_batch=1000)
+    keys = [StorageKey(bot_id=1, chat_id=i, user_id=i) for i in range(5)]
+    for key in keys:
+        await storage.set_state(key, "Rotate:selectOption")
+
+    assert connection.execute("SELECT COUNT(*) FROM fsm_storage").fetchone()[0] == 0
+    assert await storage.get_state(keys[0]) == "Rotate:selectOption"
+
+    storage.flush()
+    assert connection.execute("SELECT COUNT(*) FROM fsm_storage").fetchone()[0] == 5
+    assert await storage.get_state(keys[1]) == "Rotate:selectOption"
+
+
+@pytest.mark.asyncio
+async def test_cleared_state_is_deleted(tmp_path):
+    connection = database.connect(tmp_path / "fsm.sqlite3")
+    storage = SQLiteStorage(connection=connection)
+    await storage.set_state(KEY, "ToPDF:input")
+    storage.flush()
+    await storage.set_state(KEY, None)
+    await storage.set_data(KEY, {})
+    await storage.close()
+
+    assert connection.execute("SELECT COUNT(*) FROM fsm_storage").fetchone()[0] == 0
+
+
+@pytest.mark.asyncio
+async def test_write_through_storages_see_each_other(tmp_path):
+    # Two storages on one database file stand in for two webhook workers
+    workers = [
+        SQLiteStorage(connection=database.connect(tmp_path / "fsm.sqlite3"), cache_size=0, flush_interval=0)
+        for _ in range(2)
+    ]
+    await workers[0].set_state(KEY, "MergePDF:input_file2")
+    await workers[0].update_data(KEY, {"file_path_input1": "/input/file.pdf"})
+
+    assert await workers[1].get_state(KEY) == "MergePDF:input_file2"
+    await workers[1].set_state(KEY, None)
+    assert await workers[0].get_state(KEY) is None
+    assert await workers[0].get_data(KEY) == {"file_path_input1": "/input/file.pdf"}
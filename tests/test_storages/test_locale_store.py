@@ -0,0 +1,35 @@
+import pytest
+
+from storages import database
+from storages.locale_store import LocaleStore
+
+
+@pytest.mark.asyncio
+async def test_locale_is_written_behind_and_survives_restart(tmp_path):
+    connection = database.connect(tmp_path / "locales.sqlite3")
+    store = LocaleStore(connection=connection, flush_interval=60)
+    await store.set_locale(42, "ru")
+    await store.set_locale(42, "en")
+    await store.set_locale(42, "ru")
+
+    assert await store.get_locale(42) == "ru"
+    assert store.connection.execute("SELECT COUNT(*) FROM user_locales").fetchone()[0] == 0
+
+    await store.close()
+    restarted = LocaleStore(connection=database.connect(tmp_path / "locales.sqlite3"))
+    assert await restarted.get_locale(42) == "ru"
+    assert await restarted.get_locale(7) is None
+
+
+@pytest.mark.asyncio
+async def test_warm_up_loads_most_active_users(tmp_path):
+    store = LocaleStore(connection=database.connect(tmp_path / "locales.sqlite3"), flush_interval=60)
+    for user_id in range(5):
+        await store.set_locale(user_id, "ru")
+    for _ in range(3):
+        await store.get_locale(3)
+    await store.close()
+
+    restarted = LocaleStore(connection=database.connect(tmp_path / "locales.sqlite3"), cache_size=2)
+    assert restarted.warm_up() == 2
+    assert 3 in restarted._cache
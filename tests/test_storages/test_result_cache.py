@@ -0,0 +1,34 @@
+from storages import database
+from storages.result_cache import ResultCache
+
+
+def make_cache(tmp_path, **kwargs) -> ResultCache:
+    return ResultCache(connection=database.connect(tmp_path / "cache.sqlite3"), **kwargs)
+
+
+def test_result_cache_hit_and_miss(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.get("unique1", "rotate", 90) is None
+    cache.put("unique1", "rotate", 90, "output_file_id")
+
+    assert cache.get("unique1", "rotate", 90) == "output_file_id"
+    assert cache.get("unique1", "rotate", 180) is None
+    assert cache.stats() == {"hits": 1, "misses": 2}
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.put("unique1", "compress", "", "file1")
+    cache.put("unique2", "compress", "", "file2")
+    cache.get("unique1", "compress")
+    cache.put("unique3", "compress", "", "file3")
+
+    assert cache.get("unique1", "compress") == "file1"
+    assert cache.get("unique2", "compress") is None
+    assert cache.get("unique3", "compress") == "file3"
+
+
+def test_result_cache_expires_entries(tmp_path):
+    cache = make_cache(tmp_path, ttl=-1)
+    cache.put("unique1", "topdf", "", "file1")
+    assert cache.get("unique1", "topdf") is None
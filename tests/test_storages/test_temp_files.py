@@ -0,0 +1,60 @@
+import os
+import time
+
+from storages import temp_files as temp_files_module
+from storages.temp_files import TempFileManager
+
+
+def make_file(directory, name, size=100):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as file:
+        file.write(b"x" * size)
+    return path
+
+
+def test_files_are_released_when_no_session_uses_them(tmp_path):
+    manager = TempFileManager([str(tmp_path)])
+    own = make_file(tmp_path, "own.pdf")
+    shared = make_file(tmp_path, "shared.pdf")
+    manager.track(own, owner=1)
+    manager.track(shared, owner=1)
+    manager.track(shared, owner=2)
+    assert manager.bytes_in_use == 200
+
+    assert manager.release_owner(1) == 100
+    assert not os.path.exists(own)
+    assert os.path.exists(shared)
+
+    manager.release_owner(2)
+    assert not os.path.exists(shared)
+    assert manager.bytes_in_use == 0
+
+
+def test_sweep_removes_expired_and_leftover_files(tmp_path):
+    manager = TempFileManager([str(tmp_path)], ttl=60)
+    expired = make_file(tmp_path, "expired.pdf")
+    manager.track(expired, owner=1)
+    manager._entries[expired].last_used -= 120
+    leftover = make_file(tmp_path, "leftover.pdf")
+    os.utime(leftover, (time.time() - 120, time.time() - 120))
+    recent = make_file(tmp_path, "recent.pdf")
+
+    manager.sweep()
+
+    assert not os.path.exists(expired)
+    assert not os.path.exists(leftover)
+    assert os.path.exists(recent)
+
+
+def test_least_recently_used_files_go_above_the_high_water_mark(tmp_path, monkeypatch):
+    monkeypatch.setattr(temp_files_module, "TEMP_MAX_BYTES", 1000)
+    monkeypatch.setattr(temp_files_module, "TEMP_MIN_AGE", 0)
+    manager = TempFileManager([], ttl=3600)
+    paths = [make_file(tmp_path, "file" + str(i) + ".pdf", size=300) for i in range(4)]
+    for age, path in zip((40, 30, 20, 10), paths):
+        manager.track(path, owner=1)
+        manager._entries[path].last_used -= age
+
+    manager.sweep()
+
+    assert [os.path.exists(path) for path in paths] == [False, False, True, True]
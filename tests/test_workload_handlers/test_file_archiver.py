@@ -0,0 +1,18 @@
+import zipfile
+
+from workload_handlers.file_archiver import _zipFiles
+
+
+def test_files_with_the_same_name_are_all_packed(tmp_path):
+    input_items = []
+    for index in range(3):
+        input_item = tmp_path / ("input" + str(index))
+        input_item.write_bytes(b"content " + str(index).encode())
+        input_items.append(str(input_item))
+    output_item = tmp_path / "files.zip"
+
+    _zipFiles(input_items, ["scan.pdf", "scan.pdf", "notes.txt"], str(output_item))
+
+    with zipfile.ZipFile(output_item) as archive:
+        assert archive.namelist() == ["scan.pdf", "scan (2).pdf", "notes.txt"]
+        assert archive.read("scan (2).pdf") == b"content 1"
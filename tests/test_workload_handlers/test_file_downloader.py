@@ -0,0 +1,151 @@
+import asyncio
+import os
+import pytest
+import pytest_asyncio
+from aiogram import Bot
+from aiohttp import web
+
+from common import bot_registry
+from storages import workspace
+from workload_handlers import file_downloader, preflight
+from workload_handlers.file_downloader import fileDownloader
+
+TOKEN = "123456:ABCdef"
+FILE_CONTENT = b"%PDF-1.7\n" + bytes(range(256)) * 4096
+
+
+@pytest_asyncio.fixture
+async def fake_bot_api(tmp_path, monkeypatch):
+    stats = {"downloads": 0, "ranges": [], "break_first": False, "status": None}
+
+    async def get_file(request: web.Request) -> web.Response:
+        return web.json_response(
+            {"ok": True, "result": {
+                "file_id": "id", "file_unique_id": "unique", "file_path": "documents/file.pdf",
+                "file_size": len(FILE_CONTENT),
+            }}
+        )
+
+    async def download(request: web.Request) -> web.StreamResponse:
+        stats["downloads"] += 1
+        if stats["status"] is not None:
+            return web.Response(status=stats["status"])
+        offset = 0
+        if "Range" in request.headers:
+            offset = int(request.headers["Range"].split("=")[1].rstrip("-"))
+            stats["ranges"].append(offset)
+        response = web.StreamResponse(status=206 if offset else 200)
+        response.content_length = len(FILE_CONTENT) - offset
+        await response.prepare(request)
+        await asyncio.sleep(0.05)
+        if stats["break_first"]:
+            stats["break_first"] = False
+            await response.write(FILE_CONTENT[offset:offset + 100000])
+            request.transport.close()
+            return response
+        await response.write(FILE_CONTENT[offset:])
+        return response
+
+    app = web.Application()
+    app.router.add_post("/bot" + TOKEN + "/getFile", get_file)
+    app.router.add_get("/file/bot" + TOKEN + "/documents/file.pdf", download)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    session = bot_registry.create_session("http://127.0.0.1:" + str(port))
+    bot_registry.set_bot(Bot(token=TOKEN, session=session))
+    monkeypatch.setattr(workspace, "file_input_location", str(tmp_path))
+    monkeypatch.setattr(file_downloader, "DOWNLOAD_RETRY_BACKOFF", 0.01)
+    yield stats
+    await bot_registry.close()
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_transfer(fake_bot_api, tmp_path):
+    first, second = await asyncio.gather(
+        fileDownloader("file_id1", "file.pdf", "unique"),
+        fileDownloader("file_id2", "file.pdf", "unique"),
+    )
+
+    assert fake_bot_api["downloads"] == 1
+    assert open(first, "rb").read() == FILE_CONTENT
+    assert open(second, "rb").read() == FILE_CONTENT
+    assert list(tmp_path.glob("*.part")) == []
+
+
+@pytest.mark.asyncio
+async def test_interrupted_download_resumes(fake_bot_api):
+    fake_bot_api["break_first"] = True
+    file_local_path = await fileDownloader("file_id", "file.pdf", "unique")
+
+    assert fake_bot_api["downloads"] == 2
+    assert fake_bot_api["ranges"][0] > 0
+    assert open(file_local_path, "rb").read() == FILE_CONTENT
+
+
+@pytest.mark.asyncio
+async def test_missing_file_is_not_retried(fake_bot_api, tmp_path):
+    fake_bot_api["status"] = 404
+
+    assert await fileDownloader("file_id", "file.pdf", "unique") is None
+    assert fake_bot_api["downloads"] == 1
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_server_errors_are_retried(fake_bot_api):
+    fake_bot_api["status"] = 502
+
+    assert await fileDownloader("file_id", "file.pdf", "unique") is None
+    assert fake_bot_api["downloads"] == file_downloader.DOWNLOAD_RETRIES + 1
+
+
+@pytest.mark.asyncio
+async def test_content_not_matching_the_extension_aborts_the_download(fake_bot_api, tmp_path):
+    with pytest.raises(preflight.PreflightError) as error:
+        await fileDownloader("file_id", "file.docx", "unique")
+
+    assert error.value.reason == "content_mismatch"
+    assert fake_bot_api["downloads"] == 1
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_small_file_goes_to_the_memory_workspace(fake_bot_api, tmp_path, monkeypatch):
+    memory_dir = tmp_path / "memory"
+    monkeypatch.setattr(workspace, "WORKSPACE_MEMORY_DIR", str(memory_dir))
+    monkeypatch.setattr(workspace, "memory_input_location", str(memory_dir / "input"))
+    monkeypatch.setattr(workspace, "memory_output_location", str(memory_dir / "output"))
+    monkeypatch.setattr(workspace, "WORKSPACE_MEMORY_THRESHOLD", len(FILE_CONTENT))
+    monkeypatch.setattr(workspace, "WORKSPACE_MEMORY_BUDGET", 2 ** 62)
+    workspace.prepare()
+    fake_bot_api["break_first"] = True
+
+    file_local_path = await fileDownloader("file_id", "file.pdf", "unique")
+
+    assert workspace.in_memory(file_local_path)
+    assert fake_bot_api["ranges"][0] > 0
+    assert open(file_local_path, "rb").read() == FILE_CONTENT
+    assert workspace.output_location(file_local_path) == str(memory_dir / "output")
+
+    monkeypatch.setattr(workspace, "WORKSPACE_MEMORY_THRESHOLD", len(FILE_CONTENT) - 1)
+    assert workspace.output_location(file_local_path) == workspace.file_output_location
+
+
+@pytest.mark.asyncio
+async def test_file_for_the_converter_stays_on_disk(fake_bot_api, tmp_path, monkeypatch):
+    memory_dir = tmp_path / "memory"
+    monkeypatch.setattr(workspace, "WORKSPACE_MEMORY_DIR", str(memory_dir))
+    monkeypatch.setattr(workspace, "memory_input_location", str(memory_dir / "input"))
+    monkeypatch.setattr(workspace, "memory_output_location", str(memory_dir / "output"))
+    monkeypatch.setattr(workspace, "WORKSPACE_MEMORY_BUDGET", 2 ** 62)
+    workspace.prepare()
+
+    file_local_path = await fileDownloader("file_id", "file.pdf", "unique", operation="topdf")
+
+    assert os.path.dirname(file_local_path) == workspace.file_input_location
+    assert workspace.output_location(file_local_path, operation="topdf") == workspace.file_output_location
@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+
+from workload_handlers.job_queue import JobQueue, JOB_SMALL_FILE_SIZE
+
+LARGE_FILE_SIZE = JOB_SMALL_FILE_SIZE * 4
+
+
+async def run_jobs(queue, submissions):
+    started = []
+
+    def make_job(name):
+        async def job():
+            started.append(name)
+            await asyncio.sleep(0.01)
+            return name
+        return job
+
+    tasks = []
+    for name, user_id, size in submissions:
+        tasks.append(asyncio.create_task(queue.run(user_id, size, make_job(name))))
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    return started
+
+
+@pytest.mark.asyncio
+async def test_users_are_served_round_robin():
+    queue = JobQueue(concurrency=1)
+    submissions = [("a" + str(i), 1, 100) for i in range(4)] + [("b0", 2, 100), ("c0", 3, 100)]
+    started = await run_jobs(queue, submissions)
+    assert started == ["a0", "a1", "b0", "c0", "a2", "a3"]
+
+
+@pytest.mark.asyncio
+async def test_small_files_go_first():
+    queue = JobQueue(concurrency=1)
+    submissions = [("large0", 1, LARGE_FILE_SIZE), ("large1", 2, LARGE_FILE_SIZE), ("small", 3, 100)]
+    started = await run_jobs(queue, submissions)
+    assert started == ["large0", "small", "large1"]
+
+
+@pytest.mark.asyncio
+async def test_queue_positions_are_reported():
+    queue = JobQueue(concurrency=1)
+    positions = []
+
+    async def report(position):
+        positions.append(position)
+
+    async def job():
+        await asyncio.sleep(0.01)
+
+    first = asyncio.create_task(queue.run(1, 100, job))
+    await asyncio.sleep(0)
+    await queue.run(2, 100, job, report)
+    await first
+    await asyncio.sleep(0)
+    assert positions == [1, 0]
+    assert queue.running == 0 and queue.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_position_is_not_reported_after_the_job_started():
+    queue = JobQueue(concurrency=1)
+    positions = []
+
+    async def report(position):
+        # Editing the wait message takes a while, the job starts in the meantime
+        if position > 0:
+            await asyncio.sleep(0.05)
+        positions.append(position)
+
+    async def job():
+        await asyncio.sleep(0.01)
+
+    first = asyncio.create_task(queue.run(1, 100, job))
+    await asyncio.sleep(0)
+    await queue.run(2, 100, job, report)
+    await first
+    await asyncio.sleep(0.1)
+    assert positions == [0]
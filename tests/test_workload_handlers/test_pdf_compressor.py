@@ -0,0 +1,95 @@
+import os
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import NameObject
+
+from workload_handlers.pdf_compressor import _compressPDF
+from workload_handlers.worker_pool import peak_rss, reset_peak_rss
+
+
+def test_compress_keeps_every_page_and_image(tmp_path, make_scanned_pdf):
+    input_item = tmp_path / "scan.pdf"
+    make_scanned_pdf(input_item)
+    output_path = tmp_path / "output"
+    output_path.mkdir()
+
+    output_item = _compressPDF(str(input_item), str(output_path))
+
+    reader = PdfReader(output_item)
+    assert len(reader.pages) == 3
+    assert all(len(page.images) == 1 for page in reader.pages)
+
+
+def test_peak_rss_is_reported():
+    reset_peak_rss()
+    assert peak_rss() > 0
+
+
+def test_shared_image_is_kept_as_one_object(tmp_path, make_scanned_pdf):
+    single_page = tmp_path / "single.pdf"
+    make_scanned_pdf(single_page, pages=1)
+    writer = PdfWriter()
+    page = PdfReader(single_page).pages[0]
+    for _ in range(3):
+        writer.add_page(page)
+    input_item = tmp_path / "shared.pdf"
+    writer.write(input_item)
+    output_path = tmp_path / "output"
+    output_path.mkdir()
+
+    reader = PdfReader(_compressPDF(str(input_item), str(output_path)))
+
+    assert len({page.images[0].indirect_reference.idnum for page in reader.pages}) == 1
+
+
+def test_original_is_returned_when_output_is_not_smaller(tmp_path):
+    input_item = tmp_path / "small.pdf"
+    Image.effect_noise((300, 300), 60).convert("RGB").save(input_item, quality=10)
+    output_path = tmp_path / "output"
+    output_path.mkdir()
+
+    output_item = _compressPDF(str(input_item), str(output_path))
+
+    assert open(output_item, "rb").read() == input_item.read_bytes()
+
+
+def test_image_pypdf_can_not_decode_is_kept(tmp_path, make_scanned_pdf):
+    scan = tmp_path / "scan.pdf"
+    make_scanned_pdf(scan, pages=2)
+    writer = PdfWriter(clone_from=scan)
+    for image in writer.pages[0]["/Resources"]["/XObject"].values():
+        image.get_object()[NameObject("/Filter")] = NameObject("/JBIG2Decode")
+    input_item = tmp_path / "jbig2.pdf"
+    writer.write(input_item)
+    output_path = tmp_path / "output"
+    output_path.mkdir()
+
+    reader = PdfReader(_compressPDF(str(input_item), str(output_path)))
+
+    kept = [image.get_object() for image in reader.pages[0]["/Resources"]["/XObject"].values()]
+    original = [image.get_object() for image in PdfReader(input_item).pages[0]["/Resources"]["/XObject"].values()]
+    assert kept[0]["/Filter"] == "/JBIG2Decode" and kept[0]._data == original[0]._data
+    assert len(reader.pages[1].images) == 1
+
+
+def test_maximum_profile_downsamples_images(tmp_path):
+    input_item = tmp_path / "scan.pdf"
+    Image.effect_noise((2400, 2400), 60).convert("RGB").save(input_item)
+    output_path = tmp_path / "output"
+    output_path.mkdir()
+
+    reader = PdfReader(_compressPDF(str(input_item), str(output_path), profile="maximum"))
+
+    assert max(reader.pages[0].images[0].image.size) == 1600
+
+
+def test_target_size_is_met(tmp_path, make_scanned_pdf):
+    input_item = tmp_path / "scan.pdf"
+    make_scanned_pdf(input_item, pages=2, side=2000)
+    output_path = tmp_path / "output"
+    output_path.mkdir()
+    target_size = input_item.stat().st_size // 4
+
+    output_item = _compressPDF(str(input_item), str(output_path), target_size=target_size)
+
+    assert os.path.getsize(output_item) <= target_size
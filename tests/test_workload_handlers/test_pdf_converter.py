@@ -0,0 +1,63 @@
+import asyncio
+import time
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from workload_handlers import pdf_converter
+from workload_handlers.pdf_converter import convertToPDF
+
+CONVERSION_TIME = 0.2
+CONCURRENT_CONVERSIONS = 50
+
+
+@pytest_asyncio.fixture
+async def converter_stub(monkeypatch):
+    received = []
+    failures_left = {"count": 0}
+
+    async def convert(request: web.Request) -> web.Response:
+        form = await request.post()
+        received.append(form["filename"])
+        if failures_left["count"] > 0:
+            failures_left["count"] -= 1
+            return web.Response(status=503)
+        await asyncio.sleep(CONVERSION_TIME)
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_post("/convert", convert)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    monkeypatch.setattr(pdf_converter, "CONVERTER_URL", "http://127.0.0.1:" + str(port) + "/convert")
+    monkeypatch.setattr(pdf_converter, "CONVERTER_MAX_CONNECTIONS", CONCURRENT_CONVERSIONS)
+    monkeypatch.setattr(pdf_converter, "CONVERTER_RETRY_BACKOFF", 0.01)
+    yield received, failures_left
+    await pdf_converter.close()
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_conversions_do_not_serialize(converter_stub):
+    received, _ = converter_stub
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *[convertToPDF("/input/file" + str(i) + ".docx", "/output") for i in range(CONCURRENT_CONVERSIONS)]
+    )
+    elapsed = time.perf_counter() - started
+
+    assert results == [0] * CONCURRENT_CONVERSIONS
+    assert sorted(received) == sorted("file" + str(i) + ".docx" for i in range(CONCURRENT_CONVERSIONS))
+    assert elapsed < CONVERSION_TIME * CONCURRENT_CONVERSIONS / 5
+
+
+@pytest.mark.asyncio
+async def test_conversion_retries_on_server_error(converter_stub):
+    received, failures_left = converter_stub
+    failures_left["count"] = 2
+    assert await convertToPDF("/input/report.odt", "/output") == 0
+    assert received == ["report.odt"] * 3
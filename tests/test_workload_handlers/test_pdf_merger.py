@@ -0,0 +1,64 @@
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+from pypdf.annotations import Text
+from pypdf.generic import ArrayObject, NameObject
+
+from benchmarks.pdf_corpus import text_pdf
+from workload_handlers.pdf_merger import _mergePDF
+
+
+def test_merge_keeps_input_order(tmp_path):
+    input_items = []
+    for index, side in enumerate((100, 200, 300)):
+        input_item = tmp_path / ("input" + str(index) + ".pdf")
+        Image.new("RGB", (side, side), "white").save(input_item)
+        input_items.append(str(input_item))
+    output_path = tmp_path / "output"
+    output_path.mkdir()
+
+    reader = PdfReader(_mergePDF(input_items, str(output_path)))
+
+    assert [page.images[0].image.size[0] for page in reader.pages] == [100, 200, 300]
+
+
+def test_identical_resources_are_stored_once(tmp_path):
+    image = Image.effect_noise((300, 300), 60).convert("RGB")
+    input_items = []
+    for index in range(4):
+        input_item = tmp_path / ("input" + str(index) + ".pdf")
+        image.save(input_item)
+        input_items.append(str(input_item))
+    output_path = tmp_path / "output"
+    output_path.mkdir()
+
+    output_item = _mergePDF(input_items, str(output_path))
+
+    reader = PdfReader(output_item)
+    assert len(reader.pages) == 4
+    assert len({page.images[0].indirect_reference.idnum for page in reader.pages}) == 1
+    assert (output_path / "input0.pdf").stat().st_size < (tmp_path / "input0.pdf").stat().st_size * 2
+
+
+def test_only_shared_resources_are_folded(tmp_path):
+    input_items = []
+    for index in range(2):
+        # The same seed gives both inputs the same fonts
+        text_pdf(tmp_path / ("text" + str(index) + ".pdf"), 2, seed=1)
+        writer = PdfWriter(clone_from=tmp_path / ("text" + str(index) + ".pdf"))
+        for page in writer.pages:
+            # Without /P the annotations of both inputs are identical objects
+            annotation = Text(rect=(50, 550, 200, 650), text="Checked")
+            page[NameObject("/Annots")] = ArrayObject([writer._add_object(annotation)])
+        input_item = tmp_path / ("input" + str(index) + ".pdf")
+        writer.write(input_item)
+        input_items.append(str(input_item))
+    output_path = tmp_path / "output"
+    output_path.mkdir()
+
+    reader = PdfReader(_mergePDF(input_items, str(output_path)))
+
+    fonts = {page["/Resources"].raw_get("/Font").raw_get("/F0").idnum for page in reader.pages}
+    annotations = [page.raw_get("/Annots")[0].idnum for page in reader.pages]
+    assert len(fonts) == 1
+    assert len(set(annotations)) == len(reader.pages)
+
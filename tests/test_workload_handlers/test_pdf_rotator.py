@@ -0,0 +1,37 @@
+from pypdf import PdfReader
+
+from workload_handlers.pdf_rotator import _rotatePDF, parse_page_ranges
+
+
+def test_selected_pages_are_rotated_with_an_incremental_update(tmp_path, make_pdf):
+    input_item = tmp_path / "input.pdf"
+    make_pdf(input_item)
+    output_path = tmp_path / "output"
+    output_path.mkdir()
+
+    output_item = _rotatePDF(str(input_item), str(output_path), 90, "3-5")
+
+    original = input_item.read_bytes()
+    assert open(output_item, "rb").read().startswith(original)
+    reader = PdfReader(output_item, strict=True)
+    assert [page.rotation for page in reader.pages] == [0, 0, 90, 90, 90, 0]
+
+
+def test_broken_xref_falls_back_to_a_full_rewrite(tmp_path, make_pdf):
+    input_item = tmp_path / "input.pdf"
+    make_pdf(input_item, pages=2)
+    content = input_item.read_bytes()
+    startxref = content.rindex(b"startxref")
+    input_item.write_bytes(content[:startxref] + b"startxref\n1\n%%EOF\n")
+    output_path = tmp_path / "output"
+    output_path.mkdir()
+
+    output_item = _rotatePDF(str(input_item), str(output_path), 180)
+
+    assert [page.rotation for page in PdfReader(output_item).pages] == [180, 180]
+
+
+def test_page_ranges_are_normalized():
+    assert parse_page_ranges("3-5, 8") == "3-5,8"
+    assert parse_page_ranges("5-3") is None
+    assert parse_page_ranges("first") is None
@@ -0,0 +1,48 @@
+import pytest
+
+from workload_handlers import preflight
+
+
+def test_documents_are_accepted_by_extension_and_mime_type():
+    assert preflight.accepts("report.pdf", "application/pdf", [".pdf"])
+    assert not preflight.accepts("report.docx", "application/pdf", [".pdf"])
+    assert not preflight.accepts("clip.pdf", "video/mp4", [".pdf"])
+    assert not preflight.accepts(None, None, [".pdf"])
+    assert preflight.accepts("SCAN.PDF", "application/pdf", [".pdf"])
+    assert preflight.is_pdf("SCAN.PDF") and not preflight.is_pdf("scan.docx") and not preflight.is_pdf(None)
+
+
+def test_magic_bytes_are_checked_for_binary_formats_only():
+    preflight.check_magic("a.pdf", b"\n%PDF-1.4\n")
+    preflight.check_magic("a.docx", b"PK\x03\x04rest")
+    preflight.check_magic("a.csv", b"name,size\n")
+    with pytest.raises(preflight.PreflightError):
+        preflight.check_magic("a.pdf", b"PK\x03\x04rest")
+    with pytest.raises(preflight.PreflightError):
+        preflight.check_magic("a.png", b"\xff\xd8\xff\xe0")
+
+
+@pytest.mark.asyncio
+async def test_pdf_over_the_limits_is_rejected(tmp_path, make_pdf):
+    input_item = tmp_path / "input.pdf"
+    make_pdf(input_item, pages=6)
+
+    await preflight.check_pdf_limits(str(input_item), max_pages=6)
+    with pytest.raises(preflight.PreflightError) as error:
+        await preflight.check_pdf_limits(str(input_item), max_pages=5)
+    assert error.value.reason == "too_many_pages"
+    assert error.value.details == {"pages": 6, "limit": 5}
+
+    with pytest.raises(preflight.PreflightError) as error:
+        await preflight.check_pdf_limits(str(input_item), max_objects=3)
+    assert error.value.reason == "too_many_objects"
+
+
+@pytest.mark.asyncio
+async def test_unreadable_pdf_is_rejected_as_damaged(tmp_path):
+    input_item = tmp_path / "input.pdf"
+    input_item.write_bytes(b"%PDF-1.7\n" + b"\x00" * 1000)
+
+    with pytest.raises(preflight.PreflightError) as error:
+        await preflight.check_pdf_limits(str(input_item))
+    assert error.value.reason == "damaged"
@@ -0,0 +1,75 @@
+import asyncio
+import gc
+import statistics
+import time
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from handlers import user_handlers
+from handlers.user_handlers import start_cmd
+from storages import command_scopes, database
+from storages.command_scopes import CommandScopes
+from workload_handlers import worker_pool
+from workload_handlers.pdf_compressor import compressPDF
+
+CONCURRENT_JOBS = 4
+PROBE_INTERVAL = 0.01
+# A full collection over an unfrozen heap stalled the loop for about 400 ms, a job run in the
+# event loop holds it for seconds
+MAX_LOOP_STALL = 0.05
+
+
+async def start_latencies(duration) -> list[float]:
+    message = AsyncMock()
+    message.chat.id = 42
+    mock_i18n = Mock()
+    mock_i18n.get.return_value = "Hi, I am your PDF converter assistant"
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        expected = time.perf_counter() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        await start_cmd(message, mock_i18n)
+        latencies.append(time.perf_counter() - expected)
+    return latencies
+
+
+@pytest.mark.asyncio
+async def test_start_is_served_during_compress_jobs(tmp_path, monkeypatch, make_scanned_pdf):
+    monkeypatch.setattr(command_scopes, "get_bot", lambda: AsyncMock())
+    monkeypatch.setattr(user_handlers, "command_scopes", CommandScopes(connection=database.connect(tmp_path / "commands.sqlite3")))
+    pauses = []
+    collection_started = {}
+
+    def measure_collections(phase, info) -> None:
+        if phase == "start":
+            collection_started["at"] = time.perf_counter()
+        elif "at" in collection_started:
+            pauses.append(time.perf_counter() - collection_started.pop("at"))
+
+    # As app.py on_startup does
+    gc.freeze()
+    worker_pool.start()
+    gc.callbacks.append(measure_collections)
+    try:
+        inputs = []
+        for i in range(CONCURRENT_JOBS):
+            input_item = tmp_path / ("input" + str(i) + ".pdf")
+            make_scanned_pdf(input_item, side=1200)
+            inputs.append(str(input_item))
+        output_path = tmp_path / "output"
+        output_path.mkdir()
+
+        jobs = asyncio.gather(*[compressPDF(item, str(output_path)) for item in inputs])
+        latencies = await start_latencies(1.0)
+        results = await jobs
+
+        assert len(results) == CONCURRENT_JOBS
+        # The exact numbers are in benchmarks/bench_start_latency.py
+        assert statistics.quantiles(latencies, n=100)[98] < MAX_LOOP_STALL
+        assert sum(latency > MAX_LOOP_STALL for latency in latencies) <= 1
+        assert max(pauses, default=0) < MAX_LOOP_STALL
+    finally:
+        gc.callbacks.remove(measure_collections)
+        worker_pool.shutdown()
+        gc.unfreeze()
@@ -0,0 +1,43 @@
+import logging
+import os
+import time
+import zipfile
+
+from workload_handlers.worker_pool import run_in_pool
+
+logger = logging.getLogger(__name__)
+
+# These are compressed already, deflating them again costs CPU for almost no gain
+STORED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png", ".tif", ".zip", ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp"}
+
+
+def _unique_name(file_name, used_names) -> str:
+    name, extension = os.path.splitext(file_name)
+    candidate = file_name
+    counter = 2
+    while candidate in used_names:
+        candidate = name + " (" + str(counter) + ")" + extension
+        counter += 1
+    used_names.add(candidate)
+    return candidate
+
+
+def _zipFiles(input_items, file_names, output_item) -> str:
+    started = time.perf_counter()
+    used_names = set()
+
+    with zipfile.ZipFile(output_item, "w") as archive:
+        for input_item, file_name in zip(input_items, file_names):
+            extension = os.path.splitext(file_name)[1].lower()
+            compress_type = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+            archive.write(input_item, _unique_name(file_name, used_names), compress_type=compress_type)
+
+    logger.info(
+        "Packed %s files into %s in %s s",
+        len(input_items), os.path.basename(output_item), round(time.perf_counter() - started, 3),
+    )
+    return output_item
+
+
+async def zipFiles(input_items, file_names, output_item) -> str:
+    return await run_in_pool(_zipFiles, list(input_items), list(file_names), output_item)
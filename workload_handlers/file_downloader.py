@@ -1,21 +1,162 @@
+import asyncio
+import logging
 import os
-from aiogram import Bot
+import time
+import aiofiles
+import aiohttp
+from aiogram.exceptions import TelegramAPIError
 from dotenv import find_dotenv, load_dotenv
 from pydantic import ValidationError
 
+from common.bot_registry import get_bot
+from common.metrics import Counter, Histogram
+from storages import workspace
+from storages.temp_files import temp_files
+from workload_handlers import preflight
+
 load_dotenv(find_dotenv())
-bot = Bot(token=os.getenv("TOKEN"))
-file_input_location = os.getenv("FILE_INPUT_LOCATION")
 
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", 256 * 1024))
+DOWNLOAD_MAX_CONCURRENT = int(os.getenv("DOWNLOAD_MAX_CONCURRENT", 8))
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", 3))
+DOWNLOAD_RETRY_BACKOFF = float(os.getenv("DOWNLOAD_RETRY_BACKOFF", 0.5))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", 60))
+
+DOWNLOAD_BYTES = Counter("bot_download_bytes_total", "Bytes downloaded from Telegram")
+DOWNLOAD_SECONDS = Histogram("bot_download_seconds", "Time to download a file from Telegram")
+DOWNLOAD_FAILURES = Counter("bot_download_failures_total", "Downloads that failed after all retries")
+
+_download_slots = asyncio.Semaphore(DOWNLOAD_MAX_CONCURRENT)
+_in_flight: dict[str, asyncio.Future] = {}
+
+
+# Reads until there are size bytes or the body ends, a single read may return less
+async def _read_head(content, size) -> bytes:
+    head = b""
+    while len(head) < size:
+        chunk = await content.read(size - len(head))
+        if not chunk:
+            break
+        head += chunk
+    return head
+
+
+# Streams the file into a .part file, resuming from the bytes already received when a transfer breaks,
+# and renames it into place only once it is complete.
+# The first bytes of a fresh transfer are checked against the file extension, and a file that is
+# not what its name says is dropped before the rest of it is fetched.
+async def _stream_to_file(file_path_telegram, file_local_path) -> int:
+    part_path = file_local_path + ".part"
+    bot = get_bot()
+    url = bot.session.api.file_url(bot.token, file_path_telegram)
+    session = await bot.session.create_session()
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=DOWNLOAD_TIMEOUT)
+    received = 0
+
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        if attempt > 0:
+            await asyncio.sleep(DOWNLOAD_RETRY_BACKOFF * 2 ** (attempt - 1))
+        headers = {"Range": "bytes=" + str(received) + "-"} if received else {}
+        try:
+            async with session.get(url, headers=headers, timeout=timeout, raise_for_status=True) as response:
+                # The server ignored the range, so the transfer starts over
+                if response.status != 206:
+                    received = 0
+                head = b""
+                if received == 0:
+                    head = await _read_head(response.content, preflight.PDF_HEADER_WINDOW)
+                    preflight.check_magic(file_local_path, head)
+                    received = len(head)
+                async with aiofiles.open(part_path, "ab" if received > len(head) else "wb") as part_file:
+                    await part_file.write(head)
+                    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        await part_file.write(chunk)
+                        received += len(chunk)
+            os.replace(part_path, file_local_path)
+            return received
+        except aiohttp.ClientResponseError as error:
+            # The file is gone or the link expired, asking again gives the same answer
+            if error.status < 500:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
+            logger.warning(
+                "Download of %s failed with status %s (attempt %s)", file_path_telegram, error.status, attempt + 1
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            logger.warning(
+                "Download of %s interrupted at %s bytes (attempt %s): %r",
+                file_path_telegram, received, attempt + 1, error,
+            )
+        except preflight.PreflightError:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+
+    if os.path.exists(part_path):
+        os.remove(part_path)
+    raise ConnectionError("Download of " + file_path_telegram + " failed after retries")
 
-async def fileDownloader(file_id_telegram, file_name_telegram) -> str:
 
-    file_telegram = await bot.get_file(file_id_telegram)
-    file_path_telegram = file_telegram.file_path
+# The size Telegram reports and the operation decide whether the file goes to the in-memory
+# workspace or to disk
+async def _download(file_id_telegram, file_name_telegram, operation=None) -> str:
+    async with _download_slots:
+        started = time.perf_counter()
+        file_telegram = await get_bot().get_file(file_id_telegram)
+        location = workspace.input_location(file_telegram.file_size, operation)
+        file_local_path = os.path.join(location, file_id_telegram + "_" + file_name_telegram)
+        received = await _stream_to_file(file_telegram.file_path, file_local_path)
+        elapsed = time.perf_counter() - started
+
+    DOWNLOAD_BYTES.inc(received)
+    DOWNLOAD_SECONDS.observe(elapsed)
+    logger.info(
+        "Downloaded %s: %s bytes in %.3f s (%d bytes/s)",
+        file_local_path, received, elapsed, received / max(elapsed, 1e-6),
+        extra={"stage": "download", "duration": round(elapsed, 3), "size": received},
+    )
+    return file_local_path
+
+
+# Returns None when the file could not be downloaded
+async def fileDownloader(file_id_telegram, file_name_telegram, file_unique_id=None, operation=None) -> str | None:
     file_local_path = os.path.join(
-        file_input_location, file_id_telegram + "_" + file_name_telegram
+        workspace.file_input_location, file_id_telegram + "_" + file_name_telegram
     )
+    transfer_key = file_unique_id or file_id_telegram
+    # A file that has to be on disk can not join a transfer into the in-memory workspace
+    if not workspace.memory_allowed(operation):
+        transfer_key += ":disk"
 
-    file_local = await bot.download_file(file_path_telegram, file_local_path)
+    # Concurrent requests for the same file share one transfer
+    transfer = _in_flight.get(transfer_key)
+    if transfer is None:
+        transfer = asyncio.ensure_future(_download(file_id_telegram, file_name_telegram, operation))
+        _in_flight[transfer_key] = transfer
+        transfer.add_done_callback(lambda _: _in_flight.pop(transfer_key, None))
+    else:
+        logger.debug("Joining the download already in progress for %s", transfer_key)
+
+    # PreflightError goes to the caller, the file is not there and the user has to be told why
+    try:
+        downloaded_path = await asyncio.shield(transfer)
+    except preflight.PreflightError as error:
+        logger.info("Download of %s aborted: %s", file_local_path, error.reason)
+        raise
+    except (ConnectionError, aiohttp.ClientError, asyncio.TimeoutError, TelegramAPIError) as error:
+        DOWNLOAD_FAILURES.inc()
+        logger.error("Could not download %s: %r", file_local_path, error)
+        return None
+
+    # A forwarded copy of the file has another file_id, so it gets its own name in the input folder
+    file_local_path = os.path.join(
+        os.path.dirname(downloaded_path), file_id_telegram + "_" + file_name_telegram
+    )
+    if downloaded_path != file_local_path and not os.path.exists(file_local_path):
+        os.link(downloaded_path, file_local_path)
 
+    temp_files.track(file_local_path)
     return file_local_path
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from dotenv import find_dotenv, load_dotenv
+
+from common.metrics import Gauge, Histogram
+from workload_handlers.worker_pool import PDF_WORKERS
+
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger(__name__)
+
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", PDF_WORKERS))
+JOB_SMALL_FILE_SIZE = int(os.getenv("JOB_SMALL_FILE_SIZE", 2 * 1024 * 1024))
+JOB_SMALL_BURST = int(os.getenv("JOB_SMALL_BURST", 4))
+JOB_POSITION_UPDATE_INTERVAL = float(os.getenv("JOB_POSITION_UPDATE_INTERVAL", 3))
+
+JOB_WAIT_SECONDS = Histogram("bot_job_queue_wait_seconds", "Time a job waited in the queue before it was started")
+
+
+class _Job:
+    def __init__(self, user_id, size, on_position) -> None:
+        self.user_id = user_id
+        self.small = size <= JOB_SMALL_FILE_SIZE
+        self.on_position = on_position
+        self.started = asyncio.get_running_loop().create_future()
+        self.position = None
+        self.position_reported_at = 0.0
+        self.report: asyncio.Task | None = None
+
+
+# Runs heavy jobs at most JOB_CONCURRENCY at a time.
+# Waiting jobs are grouped per user and users are served round-robin, so one user's batch cannot
+# starve everybody else. Small files go first, but after JOB_SMALL_BURST small jobs in a row a
+# waiting large job gets its turn.
+class JobQueue:
+    def __init__(self, concurrency=JOB_CONCURRENCY) -> None:
+        self.concurrency = concurrency
+        self.running = 0
+        self._small: OrderedDict[int, deque[_Job]] = OrderedDict()
+        self._large: OrderedDict[int, deque[_Job]] = OrderedDict()
+        self._small_streak = 0
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(jobs) for jobs in self._small.values()) + sum(len(jobs) for jobs in self._large.values())
+
+    # Takes the next job from the user at the head of the ring and moves that user to the back
+    @staticmethod
+    def _take(ring) -> _Job:
+        user_id, jobs = next(iter(ring.items()))
+        job = jobs.popleft()
+        del ring[user_id]
+        if jobs:
+            ring[user_id] = jobs
+        return job
+
+    @staticmethod
+    def _next_is_small(small, large, small_streak) -> bool:
+        return bool(small) and (small_streak < JOB_SMALL_BURST or not large)
+
+    def _pop_next(self) -> _Job | None:
+        if not self._small and not self._large:
+            return None
+        if self._next_is_small(self._small, self._large, self._small_streak):
+            self._small_streak += 1
+            return self._take(self._small)
+        self._small_streak = 0
+        return self._take(self._large)
+
+    # The order waiting jobs will be started in, following the same rules as _pop_next
+    def _dispatch_order(self) -> list[_Job]:
+        small = OrderedDict((user_id, deque(jobs)) for user_id, jobs in self._small.items())
+        large = OrderedDict((user_id, deque(jobs)) for user_id, jobs in self._large.items())
+        small_streak = self._small_streak
+        order = []
+        while small or large:
+            if self._next_is_small(small, large, small_streak):
+                small_streak += 1
+                order.append(self._take(small))
+            else:
+                small_streak = 0
+                order.append(self._take(large))
+        return order
+
+    def _dispatch(self) -> None:
+        while self.running < self.concurrency:
+            job = self._pop_next()
+            if job is None:
+                break
+            self.running += 1
+            job.started.set_result(None)
+            # A position that is still being sent is out of date now
+            if job.report is not None:
+                job.report.cancel()
+        self._report_positions()
+
+    def _report_positions(self) -> None:
+        now = time.monotonic()
+        for position, job in enumerate(self._dispatch_order(), start=1):
+            if job.on_position is None or job.position == position:
+                continue
+            if now - job.position_reported_at < JOB_POSITION_UPDATE_INTERVAL and job.position is not None:
+                continue
+            job.position = position
+            job.position_reported_at = now
+            job.report = asyncio.get_running_loop().create_task(self._notify(job, position))
+
+    # Positions are worked out when the queue changes, so the job may have been started by the time
+    # the report runs. The start is reported only once an earlier report is done.
+    async def _notify(self, job, position, previous=None) -> None:
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        if position > 0 and job.started.done():
+            return
+        try:
+            await job.on_position(position)
+        except Exception as error:
+            logger.debug("Could not report queue position to user %s: %r", job.user_id, error)
+
+    def _remove(self, job) -> None:
+        ring = self._small if job.small else self._large
+        jobs = ring.get(job.user_id)
+        if jobs is not None and job in jobs:
+            jobs.remove(job)
+            if not jobs:
+                del ring[job.user_id]
+
+    async def run(self, user_id, size, job_factory, on_position=None):
+        job = _Job(user_id, size, on_position)
+        ring = self._small if job.small else self._large
+        ring.setdefault(user_id, deque()).append(job)
+        enqueued = time.monotonic()
+        self._dispatch()
+
+        try:
+            await job.started
+        except asyncio.CancelledError:
+            if job.started.cancelled():
+                self._remove(job)
+            else:
+                # Cancelled right after being started, so give the slot back
+                self.running -= 1
+                self._dispatch()
+            raise
+        waited = time.monotonic() - enqueued
+        JOB_WAIT_SECONDS.observe(waited)
+        logger.debug(
+            "Job of user %s started after %.3f s in the queue", user_id, waited,
+            extra={"stage": "queue", "duration": round(waited, 3)},
+        )
+
+        try:
+            if on_position is not None and job.position is not None:
+                job.report = asyncio.get_running_loop().create_task(self._notify(job, 0, job.report))
+            return await job_factory()
+        finally:
+            self.running -= 1
+            self._dispatch()
+
+
+job_queue = JobQueue()
+Gauge("bot_job_queue_waiting", "Jobs waiting for a slot", function=lambda: job_queue.waiting)
+Gauge("bot_job_queue_running", "Jobs being processed", function=lambda: job_queue.running)
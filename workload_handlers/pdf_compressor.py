@@ -1,27 +1,232 @@
+import logging
 import os
+import shutil
+import time
+from io import BytesIO
 from pypdf import PdfReader, PdfWriter
+from pypdf.filters import _xobj_to_image
+from pypdf.generic import NameObject
 
+from workload_handlers.worker_pool import run_in_pool, reset_peak_rss, peak_rss
 
-async def compressPDF(input_item, output_path) -> str:
-    reader = PdfReader(input_item)
-    writer = PdfWriter()
+logger = logging.getLogger(__name__)
 
+COMPRESS_MIN_IMAGE_SAVING = float(os.getenv("COMPRESS_MIN_IMAGE_SAVING", 0.05))
+COMPRESS_TARGET_SAMPLE_IMAGES = int(os.getenv("COMPRESS_TARGET_SAMPLE_IMAGES", 6))
+COMPRESS_TARGET_MAX_PASSES = int(os.getenv("COMPRESS_TARGET_MAX_PASSES", 3))
+
+COMPRESSION_PROFILES = {
+    "fast": {"quality": 75, "max_dimension": None, "stream_level": 1},
+    "balanced": {"quality": 60, "max_dimension": None, "stream_level": 5},
+    "maximum": {"quality": 40, "max_dimension": 1600, "stream_level": 9},
+}
+
+# Settings tried by the "fit under N MB" mode, from the best looking to the smallest output
+TARGET_SIZE_LADDER = [
+    {"quality": 75, "max_dimension": None, "stream_level": 9},
+    {"quality": 60, "max_dimension": None, "stream_level": 9},
+    {"quality": 50, "max_dimension": 2000, "stream_level": 9},
+    {"quality": 40, "max_dimension": 1600, "stream_level": 9},
+    {"quality": 30, "max_dimension": 1200, "stream_level": 9},
+    {"quality": 25, "max_dimension": 1000, "stream_level": 9},
+    {"quality": 20, "max_dimension": 800, "stream_level": 9},
+]
+
+
+class CompressionStats:
+    def __init__(self) -> None:
+        self.images = 0
+        self.images_reencoded = 0
+        self.images_shared = 0
+        self.images_not_smaller = 0
+        self.images_skipped = 0
+        self.image_bytes_saved = 0
+        self.image_seconds = 0.0
+
+    def __str__(self) -> str:
+        return (
+            str(self.images) + " images, " + str(self.images_reencoded) + " re-encoded, "
+            + str(self.images_shared) + " shared, " + str(self.images_not_smaller) + " kept as not smaller, "
+            + str(self.images_skipped) + " skipped as not decodable, "
+            + str(self.image_bytes_saved) + " bytes saved in " + str(round(self.image_seconds, 3)) + " s"
+        )
+
+
+# Re-encodes one image XObject and keeps the result only if it is meaningfully smaller
+def _compress_image(img, writer, stats, settings) -> None:
+    started = time.perf_counter()
+    idnum = img.indirect_reference.idnum
+    original = writer._objects[idnum - 1]
+    original_size = len(original._data)
+
+    max_dimension = settings["max_dimension"]
+    decoded = None
+    try:
+        decoded = img.image
+        if max_dimension is not None and max(decoded.size) > max_dimension:
+            decoded.thumbnail((max_dimension, max_dimension))
+        img.replace(decoded, quality=settings["quality"])
+    except Exception as error:
+        logger.debug("Image %s can not be re-encoded: %r", idnum, error)
+        writer._objects[idnum - 1] = original
+        stats.images_skipped += 1
+        return
+    finally:
+        if decoded is not None:
+            decoded.close()
+
+    replacement = writer._objects[idnum - 1]
+    new_size = len(replacement._data)
+    if new_size > original_size * (1 - COMPRESS_MIN_IMAGE_SAVING):
+        writer._objects[idnum - 1] = original
+        stats.images_not_smaller += 1
+    else:
+        if "/SMask" in original:
+            replacement[NameObject("/SMask")] = original["/SMask"]
+        stats.images_reencoded += 1
+        stats.image_bytes_saved += original_size - new_size
+
+    elapsed = time.perf_counter() - started
+    stats.image_seconds += elapsed
+    logger.debug("Image %s: %s -> %s bytes in %s s", idnum, original_size, new_size, round(elapsed, 3))
+
+
+def _compress_page(page, writer, stats, seen_images, settings) -> None:
+    images = page.images
+    for key in images.keys():
+        stats.images += 1
+        # pypdf decodes an image when it is looked up. One it has no decoder for (JBIG2 is common in
+        # scans) keeps its original stream, the rest of the document is still compressed.
+        try:
+            img = images[key]
+        except Exception as error:
+            logger.debug("Image %s can not be decoded: %r", key, error)
+            stats.images_skipped += 1
+            continue
+        # Inline images can not be replaced
+        if img.indirect_reference is None:
+            continue
+        # An image shared by several pages is one object in the writer, so it is re-encoded once
+        if img.indirect_reference.idnum in seen_images:
+            stats.images_shared += 1
+            continue
+        seen_images.add(img.indirect_reference.idnum)
+        _compress_image(img, writer, stats, settings)
+    page.compress_content_streams(level=settings["stream_level"])
+
+
+# Single pass: every page is copied, has its images re-encoded and its content streams compressed
+# before the next page is touched, and the decoded data of the source page is dropped right away
+def _compress_to_file(input_item, output_item, settings) -> CompressionStats:
+    stats = CompressionStats()
+    seen_images = set()
+
+    # Reading from an open file keeps pypdf from loading the whole input into memory
+    with open(input_item, "rb") as input_file:
+        reader = PdfReader(input_file)
+        writer = PdfWriter()
+
+        for page in reader.pages:
+            _compress_page(writer.add_page(page), writer, stats, seen_images, settings)
+            reader.resolved_objects.clear()
+
+        writer.add_metadata(reader.metadata)
+
+        with open(output_item, "wb") as output_file:
+            writer.write(output_file)
+
+    # Never hand back something bigger than what the user sent
+    if os.path.getsize(output_item) >= os.path.getsize(input_item):
+        logger.info("%s did not get smaller, returning the original file", os.path.basename(input_item))
+        shutil.copyfile(input_item, output_item)
+
+    return stats
+
+
+def _image_xobjects(reader) -> dict:
+    images = {}
     for page in reader.pages:
-        writer.add_page(page)
+        xobjects = page.get("/Resources", {}).get("/XObject", {})
+        for name in xobjects:
+            reference = xobjects.raw_get(name)
+            xobject = xobjects[name]
+            if xobject.get("/Subtype") == "/Image" and hasattr(reference, "idnum"):
+                images.setdefault(reference.idnum, xobject)
+    return images
 
-    writer.add_metadata(reader.metadata)
 
-    for page in writer.pages:
-        for img in page.images:
-            img.replace(img.image, quality=60)
+def _encoded_size(image, settings) -> int:
+    image = image.convert("RGB") if image.mode not in ("RGB", "L") else image.copy()
+    max_dimension = settings["max_dimension"]
+    if max_dimension is not None and max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension))
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=settings["quality"])
+    return buffer.tell()
 
-    for page in writer.pages:
-        page.compress_content_streams(level=5)
+
+# Picks the first step of TARGET_SIZE_LADDER expected to fit under target_size.
+# Only a handful of images spread over the size range are re-encoded, and their ratio is
+# applied to all image bytes instead of compressing the whole document for every step.
+def _estimate_ladder_step(input_item, target_size) -> int:
+    file_size = os.path.getsize(input_item)
+    with open(input_item, "rb") as input_file:
+        reader = PdfReader(input_file)
+        images = sorted(_image_xobjects(reader).values(), key=lambda xobject: len(xobject._data))
+        if not images:
+            return 0
+
+        image_bytes = sum(len(xobject._data) for xobject in images)
+        other_bytes = file_size - image_bytes
+        step = max(1, len(images) // COMPRESS_TARGET_SAMPLE_IMAGES)
+        sample = []
+        for xobject in images[::step][-COMPRESS_TARGET_SAMPLE_IMAGES:]:
+            try:
+                sample.append((len(xobject._data), _xobj_to_image(xobject)[2]))
+            except Exception as error:
+                logger.debug("Image can not be sampled: %r", error)
+        if not sample:
+            return 0
+
+        sample_bytes = sum(raw_size for raw_size, image in sample)
+        for index, settings in enumerate(TARGET_SIZE_LADDER):
+            sample_encoded = sum(min(raw_size, _encoded_size(image, settings)) for raw_size, image in sample)
+            estimate = other_bytes + image_bytes * sample_encoded / sample_bytes
+            logger.debug("Ladder step %s is estimated at %s bytes", index, int(estimate))
+            if estimate <= target_size:
+                return index
+    return len(TARGET_SIZE_LADDER) - 1
+
+
+def _compressPDF(input_item, output_path, profile="balanced", target_size=None) -> str:
+    started = time.perf_counter()
+    reset_peak_rss()
 
     input_filename = os.path.basename(input_item)
     output_item = os.path.join(output_path, input_filename)
 
-    with open(output_item, "wb") as output_file:
-        writer.write(output_file)
+    if target_size is None:
+        stats = _compress_to_file(input_item, output_item, COMPRESSION_PROFILES[profile])
+        passes = 1
+    else:
+        # The estimate is usually right; if not, step down the ladder a limited number of times
+        step = _estimate_ladder_step(input_item, target_size)
+        passes = 0
+        while True:
+            stats = _compress_to_file(input_item, output_item, TARGET_SIZE_LADDER[step])
+            passes += 1
+            if os.path.getsize(output_item) <= target_size:
+                break
+            if step == len(TARGET_SIZE_LADDER) - 1 or passes == COMPRESS_TARGET_MAX_PASSES:
+                break
+            step += 1
 
+    logger.info(
+        "Compressed %s in %s s (%s passes), peak RSS %s MB, %s",
+        input_filename, round(time.perf_counter() - started, 3), passes, peak_rss() // (1024 * 1024), stats,
+    )
     return output_item
+
+
+async def compressPDF(input_item, output_path, profile="balanced", target_size=None) -> str:
+    return await run_in_pool(_compressPDF, input_item, output_path, profile, target_size)
@@ -1,24 +1,92 @@
+import asyncio
+import logging
 import os
-import pycurl
-from io import BytesIO
+import time
+import aiohttp
 from dotenv import find_dotenv, load_dotenv
 
+from common.metrics import Counter, Histogram
+
 load_dotenv(find_dotenv())
 
+logger = logging.getLogger(__name__)
+
 CONVERTER_URL = os.getenv("CONVERTER_URL")
+CONVERTER_MAX_CONNECTIONS = int(os.getenv("CONVERTER_MAX_CONNECTIONS", 4))
+CONVERTER_CONNECT_TIMEOUT = float(os.getenv("CONVERTER_CONNECT_TIMEOUT", 5))
+CONVERTER_READ_TIMEOUT = float(os.getenv("CONVERTER_READ_TIMEOUT", 120))
+CONVERTER_RETRIES = int(os.getenv("CONVERTER_RETRIES", 3))
+CONVERTER_RETRY_BACKOFF = float(os.getenv("CONVERTER_RETRY_BACKOFF", 0.5))
+
+CONVERTER_SECONDS = Histogram("bot_converter_request_seconds", "Latency of requests to the converter service")
+CONVERTER_RESPONSES = Counter("bot_converter_responses_total", "Converter responses by HTTP status, or error")
+
+_session: aiohttp.ClientSession | None = None
+_semaphore: asyncio.Semaphore | None = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    global _session, _semaphore
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=CONVERTER_MAX_CONNECTIONS, keepalive_timeout=60
+        )
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=CONVERTER_CONNECT_TIMEOUT, sock_read=CONVERTER_READ_TIMEOUT
+        )
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        _semaphore = asyncio.Semaphore(CONVERTER_MAX_CONNECTIONS)
+    return _session
+
+
+async def close() -> None:
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+# The converter expects a multipart form with the file name in the shared volume
+def _build_form(input_filename) -> aiohttp.MultipartWriter:
+    form = aiohttp.MultipartWriter("form-data")
+    part = form.append(input_filename)
+    part.set_content_disposition("form-data", name="filename")
+    return form
+
+
+async def _post_with_retries(input_filename) -> int:
+    session = get_session()
+    http_status_code = -1
+
+    for attempt in range(CONVERTER_RETRIES + 1):
+        if attempt > 0:
+            await asyncio.sleep(CONVERTER_RETRY_BACKOFF * 2 ** (attempt - 1))
+        started = time.perf_counter()
+        try:
+            async with session.post(CONVERTER_URL, data=_build_form(input_filename)) as response:
+                await response.read()
+                http_status_code = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            CONVERTER_SECONDS.observe(time.perf_counter() - started)
+            CONVERTER_RESPONSES.inc(status="error")
+            logger.warning("Converter request for %s failed: %r", input_filename, error)
+            continue
+        CONVERTER_SECONDS.observe(time.perf_counter() - started)
+        CONVERTER_RESPONSES.inc(status=str(http_status_code))
+
+        if http_status_code < 500:
+            break
+        logger.warning("Converter returned %s for %s", http_status_code, input_filename)
+
+    return http_status_code
+
 
 async def convertToPDF(input_item, output_path) -> int:
     input_filename = os.path.basename(input_item)
 
-    response_buffer = BytesIO()
-
-    c = pycurl.Curl()
-    c.setopt(c.URL, CONVERTER_URL)
-    c.setopt(c.WRITEDATA, response_buffer)
-    c.setopt(c.HTTPPOST, [('filename', input_filename.encode('UTF-8'))])
-    c.perform()
-    http_status_code = c.getinfo(pycurl.HTTP_CODE)
-    c.close()
+    get_session()
+    async with _semaphore:
+        http_status_code = await _post_with_retries(input_filename)
 
     if http_status_code == 200:
         return 0
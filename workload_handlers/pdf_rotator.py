@@ -1,22 +1,156 @@
+import logging
 import os
-import subprocess
+import re
+import shutil
+import time
+from io import BytesIO
 
 from pypdf import PdfReader, PdfWriter
+from pypdf.errors import PdfReadError
+from pypdf.generic import DictionaryObject, NameObject, NumberObject
 
+from workload_handlers.worker_pool import run_in_pool
 
-async def rotatePDF(input_item, output_path, rotateAngle) -> str:
-    reader = PdfReader(input_item)
+logger = logging.getLogger(__name__)
 
-    input_filename = os.path.basename(input_item)
-    output_item = os.path.join(output_path, input_filename)
+ROTATE_TAIL_SIZE = 1024
+PAGE_RANGE_PATTERN = re.compile(r"^(\d+)(?:-(\d+))?$")
+
+
+# Turns user input like "3-5, 8" into a normalized spec ("3-5,8"), or None if it is not valid
+def parse_page_ranges(text):
+    ranges = []
+    for part in text.replace(" ", "").split(","):
+        match = PAGE_RANGE_PATTERN.match(part)
+        if match is None:
+            return None
+        first = int(match.group(1))
+        last = int(match.group(2) or first)
+        if first < 1 or last < first:
+            return None
+        ranges.append(str(first) if first == last else str(first) + "-" + str(last))
+    return ",".join(ranges)
+
+
+# Zero-based indexes of the pages a spec selects, pages past the end of the document are ignored
+def _page_indexes(pages, page_count) -> list[int]:
+    if pages is None:
+        return list(range(page_count))
+    indexes = set()
+    for part in pages.split(","):
+        first, _, last = part.partition("-")
+        indexes.update(range(int(first) - 1, min(int(last or first), page_count)))
+    return sorted(indexes)
+
+
+def _find_startxref(input_file) -> int | None:
+    input_file.seek(0, os.SEEK_END)
+    input_file.seek(max(0, input_file.tell() - ROTATE_TAIL_SIZE))
+    tail = input_file.read()
+    position = tail.rfind(b"startxref")
+    if position == -1:
+        return None
+    try:
+        return int(tail[position + len(b"startxref"):].split()[0])
+    except (IndexError, ValueError):
+        return None
+
+
+# Rotation only changes /Rotate of the page dictionaries, so instead of rewriting the document
+# the original bytes are copied as they are and a small revision is appended: the new page
+# dictionaries, an xref section for them and a trailer pointing back to the original xref with /Prev.
+# Returns False when the file does not allow it: encrypted files, cross-reference streams
+# (their objects may live in object streams) and files pypdf would have to repair.
+def _rotate_incremental(input_item, output_item, rotateAngle, pages) -> bool:
+    with open(input_item, "rb") as input_file:
+        startxref = _find_startxref(input_file)
+        if startxref is None:
+            return False
+        input_file.seek(startxref)
+        if input_file.read(4) != b"xref":
+            return False
+
+        try:
+            reader = PdfReader(input_file, strict=True)
+            if reader.is_encrypted or "/XRefStm" in reader.trailer:
+                return False
+            page_indexes = _page_indexes(pages, len(reader.pages))
+            revision = BytesIO()
+            updated_pages = []
+            for index in page_indexes:
+                page = reader.pages[index]
+                page_dictionary = DictionaryObject(page)
+                page_dictionary[NameObject("/Rotate")] = NumberObject((page.rotation + rotateAngle) % 360)
+                updated_pages.append((page.indirect_reference, page_dictionary))
+
+            trailer = DictionaryObject(
+                (key, value) for key, value in reader.trailer.items() if key != "/Prev"
+            )
+        except (PdfReadError, ValueError) as error:
+            logger.debug("Falling back to a full rewrite of %s: %r", input_item, error)
+            return False
+
+    shutil.copyfile(input_item, output_item)
+    base = os.path.getsize(output_item)
+
+    revision.write(b"\n")
+    offsets = []
+    for reference, page_dictionary in updated_pages:
+        offsets.append((reference, base + revision.tell()))
+        revision.write(str(reference.idnum).encode() + b" " + str(reference.generation).encode() + b" obj\n")
+        page_dictionary.write_to_stream(revision)
+        revision.write(b"\nendobj\n")
+
+    xref_offset = base + revision.tell()
+    # Starting with the head of the free list keeps readers that expect a zero-indexed table happy
+    revision.write(b"xref\n0 1\n0000000000 65535 f \n")
+    for reference, offset in sorted(offsets, key=lambda item: item[0].idnum):
+        revision.write(str(reference.idnum).encode() + b" 1\n")
+        revision.write(b"%010d %05d n \n" % (offset, reference.generation))
+
+    trailer[NameObject("/Prev")] = NumberObject(startxref)
+    revision.write(b"trailer\n")
+    trailer.write_to_stream(revision)
+    revision.write(b"\nstartxref\n" + str(xref_offset).encode() + b"\n%%EOF\n")
+
+    with open(output_item, "ab") as output_file:
+        output_file.write(revision.getvalue())
+    return True
+
+
+def _rotate_rewrite(input_item, output_item, rotateAngle, pages) -> None:
+    reader = PdfReader(input_item)
+    page_indexes = set(_page_indexes(pages, len(reader.pages)))
 
     with open(output_item, "wb") as file:
         writer = PdfWriter(file)
 
-        for page in reader.pages:
-            page.rotate(rotateAngle)
+        for index, page in enumerate(reader.pages):
+            if index in page_indexes:
+                page.rotate(rotateAngle)
             writer.add_page(page)
 
         writer.write(file)
 
+
+def _rotatePDF(input_item, output_path, rotateAngle, pages=None) -> str:
+    started = time.perf_counter()
+
+    input_filename = os.path.basename(input_item)
+    output_item = os.path.join(output_path, input_filename)
+
+    if _rotate_incremental(input_item, output_item, rotateAngle, pages):
+        mode = "incremental update"
+    else:
+        _rotate_rewrite(input_item, output_item, rotateAngle, pages)
+        mode = "full rewrite"
+
+    logger.info(
+        "Rotated %s by %s (%s) in %s s",
+        input_filename, rotateAngle, mode, round(time.perf_counter() - started, 3),
+    )
     return output_item
+
+
+async def rotatePDF(input_item, output_path, rotateAngle, pages=None) -> str:
+    return await run_in_pool(_rotatePDF, input_item, output_path, rotateAngle, pages)
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import os
+from dotenv import find_dotenv, load_dotenv
+from pypdf import PdfReader
+from pypdf.errors import PdfReadError
+
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger(__name__)
+
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", 2000))
+PDF_MAX_OBJECTS = int(os.getenv("PDF_MAX_OBJECTS", 500000))
+
+# The PDF header may come after some garbage, readers look for it in the first kilobyte
+PDF_HEADER_WINDOW = 1024
+
+ZIP_MAGIC = (b"PK\x03\x04",)
+OLE_MAGIC = (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1",)
+MAGIC_BYTES = {
+    ".docx": ZIP_MAGIC, ".xlsx": ZIP_MAGIC, ".pptx": ZIP_MAGIC,
+    ".odt": ZIP_MAGIC, ".ods": ZIP_MAGIC, ".odp": ZIP_MAGIC, ".odg": ZIP_MAGIC, ".odf": ZIP_MAGIC,
+    ".doc": OLE_MAGIC, ".xls": OLE_MAGIC, ".ppt": OLE_MAGIC,
+    ".jpg": (b"\xff\xd8\xff",), ".jpeg": (b"\xff\xd8\xff",),
+    ".png": (b"\x89PNG\r\n\x1a\n",),
+    ".tif": (b"II*\x00", b"MM\x00*"),
+}
+# None of the formats the bot takes are sent with these
+REJECTED_MIME_TYPES = ("video/", "audio/")
+
+
+class PreflightError(Exception):
+    def __init__(self, reason, **details) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.details = details
+
+
+# Extensions are compared lowercased everywhere, "SCAN.PDF" is a PDF like any other
+def is_pdf(file_name) -> bool:
+    return os.path.splitext(file_name or "")[1].lower() == ".pdf"
+
+
+# Decided from what Telegram tells about the document, before anything is downloaded
+def accepts(file_name, mime_type, extensions) -> bool:
+    extension = os.path.splitext(file_name or "")[1].lower()
+    if extension not in extensions:
+        return False
+    return not (mime_type or "").startswith(REJECTED_MIME_TYPES)
+
+
+# Called with the first chunk of the download, so a renamed file is dropped before the rest arrives.
+# Text based formats (.txt, .csv, .html) have nothing to check.
+def check_magic(file_name, first_chunk) -> None:
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == ".pdf":
+        matches = b"%PDF-" in first_chunk[:PDF_HEADER_WINDOW]
+    elif extension in MAGIC_BYTES:
+        matches = first_chunk.startswith(MAGIC_BYTES[extension])
+    else:
+        return
+    if not matches:
+        raise PreflightError("content_mismatch", extension=extension)
+
+
+# The page count comes from /Count of the root page tree and the object count from /Size of the
+# trailer, so only the cross-reference data and two objects are read, not the pages themselves
+def _check_pdf_limits(file_path, max_pages, max_objects) -> None:
+    try:
+        with open(file_path, "rb") as file:
+            reader = PdfReader(file)
+            if reader.is_encrypted:
+                return
+            objects = int(reader.trailer.get("/Size", 0))
+            if objects > max_objects:
+                raise PreflightError("too_many_objects", objects=objects, limit=max_objects)
+            pages = int(reader.trailer["/Root"]["/Pages"]["/Count"])
+            if pages > max_pages:
+                raise PreflightError("too_many_pages", pages=pages, limit=max_pages)
+    except (PdfReadError, KeyError, TypeError, ValueError) as error:
+        logger.debug("Preflight could not read %s: %r", file_path, error)
+        raise PreflightError("damaged") from error
+
+
+async def check_pdf_limits(file_path, max_pages=None, max_objects=None) -> None:
+    await asyncio.to_thread(
+        _check_pdf_limits, file_path, max_pages or PDF_MAX_PAGES, max_objects or PDF_MAX_OBJECTS
+    )
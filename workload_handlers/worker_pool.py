@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import os
+import resource
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import find_dotenv, load_dotenv
+
+from common import logging_config
+from common.metrics import Histogram
+
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger(__name__)
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", os.cpu_count() or 1))
+PDF_JOB_TIMEOUT = float(os.getenv("PDF_JOB_TIMEOUT", 120))
+
+JOB_SECONDS = Histogram("bot_job_seconds", "Time a workload function took in the worker pool, per operation")
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def _on_job_timeout(signum, frame):
+    raise TimeoutError("PDF job exceeded " + str(PDF_JOB_TIMEOUT) + " seconds")
+
+
+# Runs inside a worker process. The alarm makes the worker itself give up on a stuck job,
+# so a timed out job frees its slot instead of occupying the worker until it finishes.
+def _run_job(func, timeout, trace_id, args):
+    logging_config.trace_id.set(trace_id)
+    if hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGALRM, _on_job_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(*args)
+    finally:
+        if hasattr(signal, "setitimer"):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def start() -> None:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS,
+            initializer=logging_config.configure_worker,
+            initargs=(logging_config.worker_log_queue(), logging.getLogger().level),
+        )
+        logger.info("PDF worker pool started with %s workers", PDF_WORKERS)
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        logger.info("PDF worker pool stopped")
+
+
+async def run_in_pool(func, *args):
+    start()
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_executor, _run_job, func, PDF_JOB_TIMEOUT, logging_config.trace_id.get(), args)
+    started = time.perf_counter()
+    status = "error"
+    try:
+        # Small grace period so the worker-side timeout is the one that normally fires
+        result = await asyncio.wait_for(future, timeout=PDF_JOB_TIMEOUT + 5)
+        status = "ok"
+        return result
+    finally:
+        elapsed = time.perf_counter() - started
+        operation = func.__name__.lstrip("_")
+        JOB_SECONDS.observe(elapsed, operation=operation, status=status)
+        logger.info(
+            "Job %s finished (%s) in %.3f s", operation, status, elapsed,
+            extra={"stage": "process", "duration": round(elapsed, 3)},
+        )
+
+
+# Peak resident memory of the current process. On Linux the high-water mark can be reset,
+# so a long-lived worker reports the peak of the current job rather than of its whole life.
+def reset_peak_rss() -> None:
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss() -> int:
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024